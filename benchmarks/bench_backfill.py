@@ -0,0 +1,44 @@
+"""
+Backfill wall time as the number of shards goes up.
+
+A synthetic pair of files is backfilled over its whole range, every country
+into SQLite, with 1, 2, 4 ... shards. Each file is parsed once however many
+shards there are, so time should fall with more shards while there are CPUs
+for the worker processes, and hold steady past that.
+
+    python benchmarks/bench_backfill.py [countries] [provinces] [days] [max shards]
+"""
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from common import best_of, report
+from synthetic import write_datasets
+from backfill import Backfill, date_shards
+from loaders import SQLiteLoader
+
+
+def main(countries: int = 190, provinces: int = 10, days: int = 365, max_shards: int = 8):
+    with tempfile.TemporaryDirectory() as directory:
+        jh_path, nyt_path, rows = write_datasets(directory, countries, provinces, days)
+        database = os.path.join(directory, 'covid.db')
+        start = date(2020, 1, 22)
+        end = start + timedelta(days=days - 1)
+        print(f'{rows} rows, {os.path.getsize(jh_path) / (1024 * 1024):.1f} MB JH file, {os.cpu_count()} CPUs')
+
+        def backfill(count: int):
+            if os.path.exists(database):
+                os.remove(database)
+            Backfill(database, date_shards(jh_path, nyt_path, start, end, count), SQLiteLoader, all_regions=True).run()
+
+        baseline = None
+        count = 1
+        while count <= max_shards:
+            seconds = best_of(lambda: backfill(count), repeat=3)
+            report(f'{count} shard{"s" if count > 1 else ""}', seconds, baseline)
+            baseline = baseline or seconds
+            count *= 2
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,59 @@
+"""
+Cold start: time to import the ETL handler module in a fresh interpreter.
+
+Each run starts a new Python process with -X importtime, the same work a
+Lambda cold start does before the handler is called. Exits non-zero if the
+import takes longer than the budget, so it can gate a build.
+
+    python benchmarks/bench_coldstart.py [budget_ms]
+
+The budget can also be set with COLDSTART_BUDGET_MS (default 100).
+"""
+import os
+import re
+import subprocess
+import sys
+from common import SRC_DIR
+
+_DEFAULT_BUDGET_MS = 100
+_IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def import_times(module: str) -> dict:
+    """
+    Import a module in a fresh interpreter and return the cumulative
+    import time in microseconds of each top level module it pulled in
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SRC_DIR, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        # Only top level entries; nested ones are included in their parent's time
+        if match and len(match.group(3)) == 1:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def main(budget_ms: float, repeat: int = 5):
+    runs = [import_times('etl') for _ in range(repeat)]
+    best = min(runs, key=lambda t: t['etl'])
+
+    for name, micros in sorted(best.items(), key=lambda kv: kv[1], reverse=True)[:10]:
+        print(f'{name:<40} {micros / 1000:10.2f} ms')
+
+    total_ms = best['etl'] / 1000
+    loaded = [m for m in ('boto3', 'botocore', 'requests', 'urllib3') if m in best]
+    print(f'\nimport etl: {total_ms:.2f} ms (budget {budget_ms:.0f} ms)')
+    if loaded:
+        print(f'eagerly imported: {", ".join(loaded)}')
+
+    if total_ms > budget_ms:
+        print('over budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else float(os.environ.get('COLDSTART_BUDGET_MS', _DEFAULT_BUDGET_MS)))
@@ -0,0 +1,54 @@
+"""
+CSV decode throughput: DictReader over iter_lines and iterdecode vs the fast reader.
+
+A synthetic JH file is served by a local HTTP server, plain and gzip compressed,
+and read to the end with each reader. Throughput is of the uncompressed file.
+
+    python benchmarks/bench_csv.py [countries] [provinces] [days]
+"""
+import os
+import sys
+import tempfile
+from collections import deque
+from common import best_of
+from extract import Extract
+from transform import Transform
+from synthetic import write_jh
+from http_server import LocalHTTPServer, GzipRequestHandler
+
+
+def drain(datasets: list) -> None:
+    for dataset in datasets:
+        deque(dataset, maxlen=0)
+
+
+def main(countries: int = 190, provinces: int = 10, days: int = 365):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'jh.csv')
+        rows = write_jh(path, countries, provinces, days)
+        megabytes = os.path.getsize(path) / (1024 * 1024)
+        print(f'{rows} rows, {megabytes:.1f} MB')
+
+        with LocalHTTPServer(directory) as plain, LocalHTTPServer(directory, GzipRequestHandler) as gzipped:
+            readers = [
+                ('DictReader (file)', lambda: Extract.from_files(path, streaming=True)),
+                ('fast reader (file)', lambda: Extract.from_files(path, streaming=True, fast_reader=True)),
+                ('DictReader (HTTP)', lambda: Extract.from_urls(plain.url(path), streaming=True)),
+                ('fast reader (HTTP)', lambda: Extract.from_urls(plain.url(path), streaming=True, fast_reader=True)),
+                ('fast reader, projected (HTTP)', lambda: Extract.from_urls(plain.url(path), streaming=True, fast_reader=True,
+                                                                           columns=Transform.REQUIRED_FIELDS)),
+                ('DictReader (HTTP gzip)', lambda: Extract.from_urls(gzipped.url(path), streaming=True)),
+                ('fast reader (HTTP gzip)', lambda: Extract.from_urls(gzipped.url(path), streaming=True, fast_reader=True)),
+            ]
+
+            # DictReader is the baseline for each source
+            baseline = {}
+            for name, extract in readers:
+                seconds = best_of(lambda: drain(extract().get_datasets()), repeat=3)
+                source = name[name.index('('):]
+                speedup = baseline.setdefault(source, seconds) / seconds
+                print(f'{name:<32} {megabytes / seconds:8.1f} MB/s  {rows / seconds:12,.0f} rows/s  ({speedup:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
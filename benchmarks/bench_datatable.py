@@ -0,0 +1,49 @@
+"""
+DataTable JSON rendering: gviz_api vs render_datatable.
+
+    python benchmarks/bench_datatable.py [rows ...]
+
+Defaults to 10k, 100k and 1M rows.
+"""
+import sys
+import gviz_api
+from datetime import date, timedelta
+from common import best_of, report
+from columnar import ColumnarDataset
+from datatable import render_datatable
+from loaders import GVizCollector
+
+
+def synthetic_dataset(rows: int) -> ColumnarDataset:
+    """
+    Date ordered rows with steadily growing counts, one day per row
+    """
+    start = date(1900, 1, 1)
+    return ColumnarDataset.from_tuples(
+        (start + timedelta(days=i), i * 37, i * 3, i * 11) for i in range(rows)
+    )
+
+
+def main(*sizes: int):
+    for rows in sizes or (10_000, 100_000, 1_000_000):
+        dataset = synthetic_dataset(rows)
+        repeat = 3 if rows <= 100_000 else 1
+
+        def with_gviz_api():
+            datatable = gviz_api.DataTable(GVizCollector._column_definitions)
+            datatable.LoadData(dataset.tuples())
+            return datatable.ToJSon(columns_order=ColumnarDataset.COLUMNS, order_by='date').encode('utf-8')
+
+        def with_render_datatable():
+            return render_datatable(dataset, GVizCollector._column_definitions)
+
+        assert with_gviz_api() == with_render_datatable()
+
+        print(f'{rows} rows')
+        baseline = best_of(with_gviz_api, repeat)
+        report('  gviz_api', baseline)
+        report('  render_datatable', best_of(with_render_datatable, repeat), baseline)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,38 @@
+"""
+Date parsing: strptime per row vs the memoized parse_iso_date.
+
+The input mimics the JH file: every day repeated once per country.
+
+    python benchmarks/bench_dates.py [days] [countries]
+"""
+import sys
+from datetime import date, datetime, timedelta
+from common import best_of, report
+from dates import parse_iso_date
+
+
+def main(days: int = 365, countries: int = 190):
+    start = date(2020, 1, 22)
+    values = [str(start + timedelta(days=d)) for _ in range(countries) for d in range(days)]
+    print(f'{len(values)} date strings, {days} distinct')
+
+    def strptime():
+        return [datetime.strptime(v, '%Y-%m-%d').date() for v in values]
+
+    def fromisoformat():
+        return [date.fromisoformat(v) for v in values]
+
+    def memoized():
+        parse_iso_date.cache_clear()
+        return [parse_iso_date(v) for v in values]
+
+    assert strptime() == fromisoformat() == memoized()
+
+    baseline = best_of(strptime)
+    report('datetime.strptime', baseline)
+    report('date.fromisoformat', best_of(fromisoformat), baseline)
+    report('parse_iso_date (memoized, cold cache)', best_of(memoized), baseline)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
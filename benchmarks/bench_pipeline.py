@@ -0,0 +1,247 @@
+"""
+ETL stages end to end over synthetic data, with no network or AWS.
+
+Datasets come from synthetic.py, URLs are served from a local HTTP server,
+and DynamoDB and S3 are the in-process fakes used by the tests.
+For each stage this reports wall time percentiles over the runs, rows per
+second, the peak Python heap allocated by the stage (from one extra run
+under tracemalloc) and the process peak RSS once the stage has run.
+
+    python benchmarks/bench_pipeline.py [--countries N] [--provinces N] [--days N]
+                                        [--repeat N] [--save FILE] [--baseline FILE]
+
+With --baseline, a stage whose median time is more than --tolerance slower
+than the saved one is reported as a regression and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List
+from unittest import mock
+from common import ROOT_DIR
+from synthetic import write_datasets
+from aws_fakes import FakeAWS
+from http_server import LocalHTTPServer
+import clients
+from extract import Extract
+from transform import Transform
+from columnar import ColumnarDataset
+from loaders import DynamoDBLoader, SQLiteLoader, MultiRegionLoader, GVizCollector
+from metrics import peak_rss_mb
+
+_TABLE = 'covid'
+_BUCKET = 'website'
+_DEFAULT_BASELINE_DIRECTORY = os.path.join(ROOT_DIR, 'benchmarks', 'baselines')
+
+
+def percentile(timings: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of some timings
+    """
+    ordered = sorted(timings)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def drain(extract: Extract) -> int:
+    """
+    Read every row of every dataset, keeping none of them
+    """
+    return sum(sum(1 for _ in dataset) for dataset in extract.get_datasets())
+
+
+class Stage:
+    """
+    One stage of the pipeline being measured
+
+    :param name: Name to report it under
+    :param rows: Rows the stage handles, for throughput
+    :param run: Does the stage's work once. Called with a fresh FakeAWS in place of boto3.
+    :param setup: Untimed preparation of the FakeAWS before each run, if any
+    """
+
+    def __init__(self, name: str, rows: int, run: Callable[[FakeAWS], object], setup: Callable[[FakeAWS], object] = None):
+        self.name = name
+        self.rows = rows
+        self._run = run
+        self._setup = setup
+
+
+    def _run_once(self) -> float:
+        aws = FakeAWS(page_size=1000)
+        clients.reset()
+        with mock.patch('boto3.resource', side_effect=aws.resource):
+            if self._setup:
+                self._setup(aws)
+            start = time.perf_counter()
+            self._run(aws)
+            return time.perf_counter() - start
+
+
+    def measure(self, repeat: int, trace_memory: bool) -> dict:
+        """
+        Run the stage and summarise how it went
+        """
+        timings = [self._run_once() for _ in range(repeat)]
+
+        peak_alloc_mb = None
+        if trace_memory:
+            tracemalloc.start()
+            self._run_once()
+            peak_alloc_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+        median = percentile(timings, 0.5)
+        return {
+            'rows': self.rows,
+            'p50_seconds': median,
+            'p95_seconds': percentile(timings, 0.95),
+            'max_seconds': max(timings),
+            'rows_per_second': self.rows / median if median else None,
+            'peak_alloc_mb': peak_alloc_mb,
+            'peak_rss_mb': peak_rss_mb()
+        }
+
+
+def build_stages(server: LocalHTTPServer, jh_path: str, nyt_path: str, input_rows: int, database_path: str) -> List[Stage]:
+    """
+    The pipeline as the Lambda runs it, split into stages,
+    followed by loads of every country into the fake table and SQLite
+    """
+    jh_url, nyt_url = server.url(jh_path), server.url(nyt_path)
+
+    def transformed():
+        return Transform(Extract.from_files(jh_path, nyt_path, streaming=True).get_datasets()).transform_data()
+
+    dataset = transformed()
+    output_rows = len(dataset)
+
+    def load(aws):
+        DynamoDBLoader(_TABLE, dataset, GVizCollector(_BUCKET, 'dataset.js', 'history.json')).update_repository()
+
+    # Every 30th day revised, as the sources do now and then
+    revised = ColumnarDataset.from_tuples(
+        (day, cases + 1 if i % 30 == 0 else cases, deaths, recovered)
+        for i, (day, cases, deaths, recovered) in enumerate(dataset.tuples())
+    )
+
+    def load_revised(aws):
+        DynamoDBLoader(_TABLE, revised, GVizCollector(_BUCKET, 'dataset.js', 'history.json')).update_repository()
+
+    regions = Transform(Extract.from_files(jh_path, nyt_path, streaming=True).get_datasets()).transform_regions()
+    region_rows = sum(len(dataset) for dataset in regions.values())
+
+    def load_regions(aws):
+        MultiRegionLoader(_TABLE, regions, write_capacity=1000).update_repository()
+
+    def load_regions_sqlite(aws):
+        MultiRegionLoader(database_path, regions, loader_class=SQLiteLoader).update_repository()
+
+    def remove_database(aws):
+        if os.path.exists(database_path):
+            os.remove(database_path)
+
+    def publish(aws, precompressed=False):
+        collector = GVizCollector(_BUCKET, 'dataset.js', 'history.json', precompressed=precompressed)
+        collector.add_rows(dataset)
+        collector.write_to_s3()
+
+    def publish_precompressed(aws):
+        publish(aws, precompressed=True)
+
+    return [
+        Stage('extract (local HTTP)', input_rows,
+              lambda aws: drain(Extract.from_urls(jh_url, nyt_url, streaming=True, concurrent=True))),
+        Stage('parse files', input_rows,
+              lambda aws: drain(Extract.from_files(jh_path, nyt_path, streaming=True))),
+        Stage('transform (incl. parse)', input_rows, lambda aws: transformed()),
+        Stage('load (empty table)', output_rows, load),
+        # A run with nothing new after the first: the watermark and stored history are enough
+        Stage('load (nothing new)', output_rows, load, setup=load),
+        # Only the revised rows are written
+        Stage('load (revisions)', output_rows, load_revised, setup=load),
+        Stage('publish dataset.js', output_rows, publish),
+        Stage('publish precompressed', output_rows, publish_precompressed),
+        # Rendered and hashed, but nothing is uploaded
+        Stage('publish unchanged', output_rows, publish_precompressed, setup=publish_precompressed),
+        Stage('load all regions', region_rows, load_regions),
+        Stage('load all regions (SQLite)', region_rows, load_regions_sqlite, setup=remove_database),
+    ]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Names of the stages whose median time regressed past the tolerance
+    """
+    regressed = []
+    for name, result in results['stages'].items():
+        before = baseline['stages'].get(name, None)
+        if not before:
+            continue
+        change = result['p50_seconds'] / before['p50_seconds'] - 1
+        print(f'{name:<28} {before["p50_seconds"] * 1000:10.2f} ms -> {result["p50_seconds"] * 1000:10.2f} ms  {change:+7.1%}')
+        if change > tolerance:
+            regressed.append(name)
+    return regressed
+
+
+def main(arguments):
+    print(f'Generating {arguments.countries} countries x {arguments.provinces} provinces x {arguments.days} days')
+    results = {
+        'scale': {'countries': arguments.countries, 'provinces': arguments.provinces, 'days': arguments.days},
+        'python': sys.version.split()[0],
+        'stages': {}
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        jh_path, nyt_path, input_rows = write_datasets(directory, arguments.countries, arguments.provinces,
+                                                       arguments.days, arguments.seed)
+        print(f'{input_rows} input rows, {os.path.getsize(jh_path) / (1024 * 1024):.1f} MB JH file\n')
+        print(f'{"stage":<28} {"p50 ms":>10} {"p95 ms":>10} {"max ms":>10} {"rows/s":>12} {"alloc MB":>9} {"RSS MB":>8}')
+
+        with LocalHTTPServer(directory) as server:
+            for stage in build_stages(server, jh_path, nyt_path, input_rows, os.path.join(directory, 'covid.db')):
+                result = stage.measure(arguments.repeat, not arguments.no_memory)
+                results['stages'][stage.name] = result
+                alloc = f'{result["peak_alloc_mb"]:9.1f}' if result['peak_alloc_mb'] is not None else f'{"-":>9}'
+                rss = f'{result["peak_rss_mb"]:8.1f}' if result['peak_rss_mb'] is not None else f'{"-":>8}'
+                print(f'{stage.name:<28} {result["p50_seconds"] * 1000:10.2f} {result["p95_seconds"] * 1000:10.2f} '
+                      f'{result["max_seconds"] * 1000:10.2f} {result["rows_per_second"]:12,.0f} {alloc} {rss}')
+
+    if arguments.save:
+        os.makedirs(os.path.dirname(os.path.abspath(arguments.save)), exist_ok=True)
+        with open(arguments.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nSaved to {arguments.save}')
+
+    if arguments.baseline:
+        with open(arguments.baseline) as f:
+            baseline = json.load(f)
+        if baseline['scale'] != results['scale']:
+            print(f'\nWarning: baseline was taken at {baseline["scale"]}')
+        print(f'\nAgainst {arguments.baseline}:')
+        regressed = compare(results, baseline, arguments.tolerance)
+        if regressed:
+            print(f'\nRegressed by more than {arguments.tolerance:.0%}: {", ".join(regressed)}')
+            sys.exit(1)
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the ETL stages over synthetic data')
+    parser.add_argument('--countries', type=int, default=190)
+    parser.add_argument('--provinces', type=int, default=1)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs of each stage')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the extra run under tracemalloc')
+    parser.add_argument('--save', metavar='FILE', help=f'Save results as a baseline, e.g. in {_DEFAULT_BASELINE_DIRECTORY}')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed slowdown against the baseline')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
@@ -0,0 +1,32 @@
+import os
+import sys
+import time
+from typing import Callable
+
+# Benchmarks run the Lambda modules the way they are deployed: flat, importing each other by bare name
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+sys.path.insert(0, SRC_DIR)
+
+# The AWS fakes and local HTTP server used by the tests are reused here, behind src
+sys.path.append(os.path.join(ROOT_DIR, 'tests'))
+
+
+def best_of(func: Callable[[], object], repeat: int = 5) -> float:
+    """
+    Run a function several times and return the fastest wall time in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def report(name: str, seconds: float, baseline: float = None) -> None:
+    """
+    Print one line of benchmark output, with the speedup over a baseline if given
+    """
+    speedup = f'  ({baseline / seconds:.1f}x)' if baseline else ''
+    print(f'{name:<40} {seconds * 1000:10.2f} ms{speedup}')
@@ -0,0 +1,112 @@
+"""
+Synthetic datasets shaped like the two real sources.
+
+The JH file has a row per country, province and day, ordered by country
+as the real combined file is. US is always the first country, and the
+NYT file has one national row per day over the same dates.
+
+    python benchmarks/synthetic.py directory [countries] [provinces] [days]
+"""
+import csv
+import os
+import random
+import sys
+from datetime import date, timedelta
+from typing import Tuple
+
+JH_FILE_NAME = 'jh_synthetic.csv'
+NYT_FILE_NAME = 'nyt_synthetic.csv'
+
+_JH_HEADER = ('Date', 'Country/Region', 'Province/State', 'Lat', 'Long', 'Confirmed', 'Recovered', 'Deaths')
+_NYT_HEADER = ('date', 'cases', 'deaths')
+_START_DATE = date(2020, 1, 22)
+
+
+def _cumulative_counts(rng: random.Random, days: int, scale: int) -> Tuple[list, list, list]:
+    """
+    Three non-decreasing series like confirmed, recovered and deaths
+    """
+    confirmed, recovered, deaths = [], [], []
+    c = r = d = 0
+    for _ in range(days):
+        new_cases = rng.randint(0, scale)
+        c += new_cases
+        r += rng.randint(0, new_cases)
+        d += rng.randint(0, new_cases // 20 + 1)
+        confirmed.append(c)
+        recovered.append(r)
+        deaths.append(d)
+    return confirmed, recovered, deaths
+
+
+def write_jh(path: str, countries: int, provinces: int, days: int, seed: int = 0) -> int:
+    """
+    Write a JH-shaped CSV
+
+    :param path: File to write
+    :param countries: Number of countries, including US
+    :param provinces: Number of provinces in each country
+    :param days: Number of days from 2020-01-22
+    :param seed: Seed for the counts, so the same arguments write the same file
+    :returns: Number of data rows written
+    """
+    rng = random.Random(seed)
+    dates = [str(_START_DATE + timedelta(days=d)) for d in range(days)]
+    rows = 0
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(_JH_HEADER)
+
+        for c in range(countries):
+            country = 'US' if c == 0 else f'Country {c:05d}'
+            for p in range(provinces):
+                province = f'Province {p:04d}' if provinces > 1 else ''
+                lat, long = f'{rng.uniform(-90, 90):.4f}', f'{rng.uniform(-180, 180):.4f}'
+                confirmed, recovered, deaths = _cumulative_counts(rng, days, 1000)
+                writer.writerows(
+                    (dates[d], country, province, lat, long, confirmed[d], recovered[d], deaths[d])
+                    for d in range(days)
+                )
+                rows += days
+
+    return rows
+
+
+def write_nyt(path: str, days: int, seed: int = 0) -> int:
+    """
+    Write an NYT-shaped CSV
+
+    :param path: File to write
+    :param days: Number of days from 2020-01-22
+    :param seed: Seed for the counts
+    :returns: Number of data rows written
+    """
+    rng = random.Random(seed)
+    cases, _, deaths = _cumulative_counts(rng, days, 50_000)
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(_NYT_HEADER)
+        writer.writerows((str(_START_DATE + timedelta(days=d)), cases[d], deaths[d]) for d in range(days))
+
+    return days
+
+
+def write_datasets(directory: str, countries: int, provinces: int, days: int, seed: int = 0) -> Tuple[str, str, int]:
+    """
+    Write both files into a directory
+
+    :returns: (JH path, NYT path, total data rows)
+    """
+    jh_path = os.path.join(directory, JH_FILE_NAME)
+    nyt_path = os.path.join(directory, NYT_FILE_NAME)
+    rows = write_jh(jh_path, countries, provinces, days, seed) + write_nyt(nyt_path, days, seed)
+    return jh_path, nyt_path, rows
+
+
+if __name__ == '__main__':
+    directory, *scale = sys.argv[1:]
+    counts = [int(s) for s in scale] + [190, 1, 365][len(scale):]
+    *_, total = write_datasets(directory, *counts)
+    print(f'{total} rows written to {directory}')
@@ -1,18 +1,102 @@
 
 google.charts.load('current', {
     callback: function () {
-        // Object returned by createDataSet() is duck-typed like
-        // the return value of a charts AJAX call.
-        drawDashboards(createDataset());
+        loadManifest(drawDashboards);
     },
     packages: ['controls', 'corechart', 'line', 'bar']
 });
 
-function drawDashboards(response) {
+////////////////////////////////////////
+//
+// PUBLISHED DATA
+//
+////////////////////////////////////////
+
+// The ETL publishes dataset.js and the files next to it precompressed,
+// under keys that change with their content. dataset-manifest.json
+// maps each name to its current keys, and is the only file re-checked
+// on every visit.
+var manifest = {};
+
+function publishedUrl(name) {
 
-    drawLineChart(response);
-    drawPieChart(response);
-    drawColumnChart(response);
+    var entry = manifest[name];
+
+    if (!entry) {
+        // Published the old way
+        return './' + name;
+    }
+
+    // Browsers only take brotli over HTTPS
+    return './' + (entry.br && window.isSecureContext ? entry.br : entry.gzip);
+}
+
+function loadManifest(callback) {
+
+    fetch('./dataset-manifest.json', { cache: 'no-cache' })
+        .then(function (response) {
+            return response.ok ? response.json() : {};
+        })
+        .catch(function () {
+            return {};
+        })
+        .then(function (json) {
+            manifest = json;
+            callback();
+        });
+}
+
+function loadDataset(callback) {
+
+    // dataset.js holds every daily row. Only needed where the
+    // tables below have not been published.
+    var script = document.createElement('script');
+    script.type = 'text/javascript';
+    script.src = publishedUrl('dataset.js');
+    script.onload = function () {
+        // Object returned by createDataSet() is duck-typed like
+        // the return value of a charts AJAX call.
+        callback(createDataset());
+    };
+    document.head.appendChild(script);
+}
+
+// DataTable JSON published next to dataset.js, by name, e.g. 'weekly'
+// for dataset-weekly.json, as promises of the JSON or null if missing.
+var publishedJson = {};
+
+function fetchJson(name) {
+
+    if (!(name in publishedJson)) {
+        publishedJson[name] = fetch(publishedUrl('dataset-' + name + '.json'))
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json();
+            })
+            .catch(function () {
+                // Not published (yet)
+                return null;
+            });
+    }
+
+    return publishedJson[name];
+}
+
+function fetchTable(name, callback) {
+
+    fetchJson(name).then(function (json) {
+        callback(json ? new google.visualization.DataTable(json) : null);
+    });
+}
+
+function drawDashboards() {
+
+    drawLineChart();
+    drawPieChart();
+    drawColumnChart();
+    drawDailyChart();
 }
 
 ////////////////////////////////////////
@@ -21,16 +105,76 @@ function drawDashboards(response) {
 //
 ////////////////////////////////////////
 
-function drawLineChart(response) {
-    var dt = response.getDataTable();
-    var startDate = dt.getColumnRange(0).min;
-    var endDate = dt.getColumnRange(0).max;
+// Most points the line chart should draw. Wider ranges switch to
+// finer tables, and only the whole history is drawn from LTTB.
+var maxLinePoints = 500;
+
+function resolutionFor(range, startDate, endDate) {
+
+    var days = (range.end - range.start) / 86400000;
+
+    if (range.start <= startDate && range.end >= endDate) {
+        // Whole history: LTTB keeps the shape in few points
+        return 'lttb';
+    }
+    if (days <= maxLinePoints) {
+        return 'daily';
+    }
+    return days / 7 <= maxLinePoints ? 'weekly' : 'monthly';
+}
+
+function dailyTableNames(range) {
+
+    // Daily rows are published a year to a table
+    var names = [];
+
+    for (var year = range.start.getFullYear(); year <= range.end.getFullYear(); ++year) {
+        names.push('daily-' + year);
+    }
+
+    return names;
+}
+
+function fetchDaily(range, callback) {
+
+    Promise.all(dailyTableNames(range).map(fetchJson)).then(function (years) {
+        years = years.filter(Boolean);
+
+        if (!years.length) {
+            callback(null);
+            return;
+        }
+
+        callback(new google.visualization.DataTable({
+            cols: years[0].cols,
+            rows: [].concat.apply([], years.map(function (year) { return year.rows; }))
+        }));
+    });
+}
+
+function drawLineChart() {
+
+    // The whole history comes first, in at most maxLinePoints rows,
+    // so the first download and draw don't grow with it
+    fetchTable('lttb', function (overview) {
+        if (overview) {
+            drawLines(overview);
+        } else {
+            loadDataset(function (response) {
+                drawLines(response.getDataTable());
+            });
+        }
+    });
+}
+
+function drawLines(overview) {
+    var startDate = overview.getColumnRange(0).min;
+    var endDate = overview.getColumnRange(0).max;
     var chartWidth = '74%'
 
     var dailyDataChart = new google.visualization.ChartWrapper({
         chartType: 'LineChart',
         containerId: 'lineChart_chart_div',
-        dataTable: dt,
         options: {
             title: 'Cumulative Data (Log Scale)',
             legend: 'right',
@@ -55,9 +199,11 @@ function drawLineChart(response) {
         }
     });
 
+    // Drawn on its own from the overview, so it always spans the whole history
     var control = new google.visualization.ControlWrapper({
         controlType: 'ChartRangeFilter',
         containerId: 'lineChart_control_div',
+        dataTable: overview,
         options: {
             // Filter by the date axis.
             filterColumnIndex: 0,
@@ -89,9 +235,32 @@ function drawLineChart(response) {
         }
     });
 
-    new google.visualization.Dashboard(document.getElementById('lineChart_dashboard_div')).
-        bind(control, dailyDataChart).
-        draw(dt);
+    function showResolution() {
+
+        var range = control.getState().range;
+        var wanted = resolutionFor(range, startDate, endDate);
+
+        var show = function (table) {
+            // The overview stands in for anything not published
+            table = table || overview;
+            var view = new google.visualization.DataView(table);
+            view.setRows(table.getFilteredRows([{ column: 0, minValue: range.start, maxValue: range.end }]));
+            dailyDataChart.setDataTable(view);
+            dailyDataChart.draw();
+        };
+
+        if (wanted === 'lttb') {
+            show(overview);
+        } else if (wanted === 'daily') {
+            fetchDaily(range, show);
+        } else {
+            fetchTable(wanted, show);
+        }
+    }
+
+    google.visualization.events.addListener(control, 'statechange', showResolution);
+    control.draw();
+    showResolution();
 }
 
 ////////////////////////////////////////
@@ -100,14 +269,27 @@ function drawLineChart(response) {
 //
 ////////////////////////////////////////
 
-function drawPieChart(response) {
+function drawPieChart() {
+
+    // The ETL publishes the figures with a row per measure and a column
+    // per date, keyed YYYY-MM-DD, so a day is a view of two columns
+    fetchTable('pie', function (table) {
+        if (table) {
+            drawPie(table);
+        }
+    });
+}
+
+function drawPie(table) {
 
-    var dt = response.getDataTable();
-    var rowCount = dt.getNumberOfRows();
-    var pieView = new google.visualization.DataView(dt)
-    var startDate = dt.getColumnRange(0).min;
-    var endDate = dt.getColumnRange(0).max;
-    var pieDate = endDate;
+    var lastColumn = table.getNumberOfColumns() - 1;
+    var startDate = parseDay(table.getColumnId(1));
+    var endDate = parseDay(table.getColumnId(lastColumn));
+
+    // The slider only needs the range of dates
+    var dates = new google.visualization.DataTable();
+    dates.addColumn('date', 'Date');
+    dates.addRows([[startDate], [endDate]]);
 
     // Define a DateRangeFilter slider control for the 'Year' column.
     var slider = new google.visualization.ControlWrapper({
@@ -122,26 +304,19 @@ function drawPieChart(response) {
                 }
             }
         },
-        dataTable: dt,
+        dataTable: dates,
         state: {
             range: {
                 start: startDate,
                 end: endDate
             }
-        },
-        view: {
-            columns: [0]
         }
     });
 
-    var v = setUpPieView()
-
     var pieChart = new google.visualization.ChartWrapper({
         chartType: 'PieChart',
         containerId: 'pieChart_chart_div',
-        dataTable: v,
         options: {
-            title: pieTitle(pieDate),
             legend: 'right',
             width: 450,
             height: 300,
@@ -160,49 +335,28 @@ function drawPieChart(response) {
 
     google.visualization.events.addListener(slider, 'statechange', updatePieView);
     slider.draw();
-    pieChart.draw();
+    updatePieView();
 
     // Hide min range slider details as we don't want it for this chart
     document.getElementsByClassName("google-visualization-controls-slider-thumb")[0].style.opacity = 0;
     document.getElementsByClassName('google-visualization-controls-rangefilter-thumblabel')[0].style.display = 'none'
 
-    function setUpPieView() {
-
-        pieDate = (function () {
-            var state = slider.getState();
-
-            if ('range' in state) {
-                return state.range.end;
-            }
-
-            return state.highValue;
-
-        })();
-
-        pieView.setRows(0, rowCount - 1);
-
-        //latestDate = pieView.getColumnRange(0).date;
-        latestRow = pieView.getFilteredRows([{ column: 0, minValue: pieDate, maxValue: new Date(pieDate.getTime() + 86400000) }]).shift();
-
-        if (isNaN(latestRow) || latestRow < 1) {
-            latestRow = 1
-        }
+    function updatePieView() {
 
-        pieView.hideRows(0, latestRow - 1);
+        var state = slider.getState();
+        var pieDate = 'range' in state ? state.range.end : state.highValue;
+        var column = table.getColumnIndex(formatDay(pieDate));
 
-        if (latestRow < rowCount - 1) {
-            pieView.hideRows(latestRow + 1, rowCount - 1)
+        if (column < 1) {
+            // A day with no figures: show the latest
+            column = lastColumn;
         }
 
-        return transposeDateDataTable(pieView)
-    }
-
-    function updatePieView() {
+        var view = new google.visualization.DataView(table);
+        view.setColumns([0, column]);
 
-        var v = setUpPieView();
-        pieChart.setDataTable(v);
-        pieDate = v.getValue(0, 2);
-        pieChart.setOption('title', pieTitle(pieDate));
+        pieChart.setDataTable(view);
+        pieChart.setOption('title', pieTitle(parseDay(table.getColumnId(column))));
         pieChart.draw();
     }
 
@@ -210,34 +364,19 @@ function drawPieChart(response) {
 
         return 'Distribution by Day\n' + date.toLocaleDateString("en-US", { weekday: 'long', year: 'numeric', month: 'long', day: 'numeric' });
     }
+}
 
-    function transposeDateDataTable(dataTable) {
-
-        // Create new datatable
-        var newDataTable = new google.visualization.DataTable();
-
-        // Add first column from original datatable
-        newDataTable.addColumn('string', 'Metric');
+function parseDay(day) {
 
-        // Convert column labels to row labels
-        for (var x = 1; x < dataTable.getNumberOfColumns(); x++) {
-            var label = dataTable.getColumnLabel(x);
-            newDataTable.addRow([label]);
-        }
+    var parts = day.split('-');
+    return new Date(parts[0], parts[1] - 1, parts[2]);
+}
 
-        // Convert row labels and data to columns
-        // Last column is date. Not displayed but used for slider filter
-        for (var x = 0; x < dataTable.getNumberOfRows(); x++) {
-            newDataTable.addColumn('number', 'Number');
-            newDataTable.addColumn('date', 'Date')
-            for (var y = 1; y < dataTable.getNumberOfColumns(); y++) {
-                newDataTable.setValue(y - 1, x + 1, dataTable.getValue(x, y));
-                newDataTable.setValue(y - 1, x + 2, dataTable.getValue(x, 0));
-            }
-        }
+function formatDay(date) {
 
-        return newDataTable;
-    }
+    var m = date.getMonth() + 1;
+    var d = date.getDate();
+    return date.getFullYear() + '-' + (m < 10 ? '0' + m : m) + '-' + (d < 10 ? '0' + d : d);
 }
 
 ////////////////////////////////////////
@@ -247,38 +386,17 @@ function drawPieChart(response) {
 ////////////////////////////////////////
 
 
-function drawColumnChart(response) {
+function drawColumnChart() {
 
-    // Create view of dataset grouped by month and the max value of each column for the month
-    // The values on each day are cumulative
-    var tableView = google.visualization.data.group(
-        response.getDataTable(),
-        [
-            {
-                column: 0, modifier: function (date) {
-                    var m = date.getMonth() + 1;
-                    return date.getFullYear() + '-' + (m < 10 ? '0' + m : m);
-                },
-                type: 'string',
-                label: 'Month'
-            }
-        ],
-        [
-            { 'column': 1, 'aggregation': google.visualization.data.max, 'type': 'number' },
-            { 'column': 2, 'aggregation': google.visualization.data.max, 'type': 'number' },
-            { 'column': 3, 'aggregation': google.visualization.data.max, 'type': 'number' }
-        ]);
-
-    // Walk backwards through the view subtracting the previous month's total from this month's
-    // to get monthly totals
-    for (var row = tableView.getNumberOfRows() - 1; row > 0; --row) {
-        var newRow = [tableView.getValue(row, 0)];
-        for (var col = 1; col <= 3; ++col) {
-            var v1 = tableView.getValue(row, col);
-            var v2 = tableView.getValue(row - 1, col);
-            tableView.setValue(row, col, v1 - v2)
+    // Totals for each month are worked out by the ETL
+    fetchTable('monthly-totals', function (table) {
+        if (table) {
+            drawColumns(table);
         }
-    }
+    });
+}
+
+function drawColumns(tableView) {
 
     var columnChart = new google.visualization.ChartWrapper({
         chartType: 'Bar',
@@ -311,3 +429,50 @@ function drawColumnChart(response) {
 
     columnChart.draw();
 }
+
+////////////////////////////////////////
+//
+// DAILY CHART
+//
+////////////////////////////////////////
+
+function drawDailyChart() {
+
+    // Daily figures and rolling means are worked out by the ETL,
+    // so there is nothing to compute here
+    fetchTable('derived', function (table) {
+        if (table) {
+            drawDaily(table);
+        }
+    });
+}
+
+function drawDaily(dt) {
+
+    var dailyChart = new google.visualization.ChartWrapper({
+        chartType: 'ComboChart',
+        containerId: 'dailyChart_chart_div',
+        dataTable: dt,
+        options: {
+            title: 'New Cases per Day',
+            width: 1024,
+            height: 400,
+            chartArea: {
+                height: '75%',
+                width: '74%'
+            },
+            seriesType: 'bars',
+            series: {
+                1: { type: 'line' },
+                2: { type: 'line' }
+            },
+            legend: 'right'
+        },
+        view: {
+            // Date, new cases, 7 and 14 day means of new cases
+            columns: [0, 1, 4, 7]
+        }
+    });
+
+    dailyChart.draw();
+}
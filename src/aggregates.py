@@ -0,0 +1,47 @@
+from typing import Callable, Iterable, Iterator, Tuple
+
+
+class GroupBy:
+    """
+    Sums numeric columns of rows grouped on a key, in a single pass.
+
+    Keeps one running total per distinct key, so memory is set by the
+    number of groups, not the number of rows. Groups come out in key order.
+    """
+
+    def __init__(self, key: Callable[[tuple], tuple], values: Callable[[tuple], tuple]):
+        """
+        Constructor
+
+        :param key: Function returning the group key of a row
+        :param values: Function returning the tuple of numbers to sum from a row
+        """
+        self._key = key
+        self._values = values
+        self.rows_in = 0
+        self.groups_out = 0
+
+
+    def sum(self, rows: Iterable[tuple]) -> Iterator[Tuple[tuple, list]]:
+        """
+        Generator of (key, totals) pairs in ascending key order.
+        Nothing is yielded until all the rows have been read.
+        """
+        totals = {}
+
+        for row in rows:
+            self.rows_in += 1
+            values = self._values(row)
+            key = self._key(row)
+            accumulator = totals.get(key, None)
+
+            if accumulator is None:
+                totals[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    accumulator[i] += value
+
+        self.groups_out = len(totals)
+
+        for key in sorted(totals):
+            yield key, totals.pop(key)
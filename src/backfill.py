@@ -0,0 +1,443 @@
+"""
+Backfill: rebuild a range of dates in the repository from source files
+
+The normal ETL only ever appends what is newer than the last stored date.
+After a change to the transform, the history has to be regenerated instead.
+Here the dates are split into shards, and the source files into chunks of
+lines, one per shard sharing them. Each chunk is parsed once, in its own process,
+with its rows summed and split by shard, so the parsing is shared out rather than
+repeated. Each shard is then transformed from its part of every chunk, again in
+a process of its own, and written by one rate-limited writer, in shard order,
+so that the outcome is exactly that of running the shards one after another.
+
+    python backfill.py jh.csv nyt.csv --start 2020-03-01 --end 2020-12-31 --shards 8 --sqlite covid.db
+"""
+from __future__ import annotations
+
+import io
+import os
+import sys
+import time
+import argparse
+import threading
+from bisect import bisect_right
+from itertools import chain
+from operator import itemgetter
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+from aggregates import GroupBy
+from columnar import ColumnarDataset
+from csvrows import HeaderIndexedRows, read_csv_tuples
+from dates import parse_iso_date
+from transform import Transform, InvalidDatasetError
+from batch_writer import DynamoDBBatchWriter
+from loaders import Loader, DynamoDBLoader, SQLiteLoader, GVizCollector
+from snapshots import SnapshotStore
+
+# Columns read from each source, in the order aggregate_chunk() takes them
+_JH_COLUMNS = ('Date', 'Country/Region', 'Confirmed', 'Deaths', 'Recovered')
+_NYT_COLUMNS = ('date', 'cases', 'deaths')
+
+# Header of the JH totals handed to Transform
+_JH_FIELDS = ('Date', 'Country/Region', 'Province/State', 'Lat', 'Long', 'Confirmed', 'Recovered', 'Deaths')
+
+class Shard:
+    """
+    Part of a backfill: the source files to read, and the dates from start up to but not including end
+    to take from them. An open start or end takes everything before or after.
+    """
+
+    def __init__(self, jh_path: str, nyt_path: str, start: date = None, end: date = None):
+        self.jh_path = jh_path
+        self.nyt_path = nyt_path
+        self.start = start
+        self.end = end
+
+
+    def __repr__(self) -> str:
+        return f'Shard({self.start} to {self.end})'
+
+
+def date_shards(jh_path: str, nyt_path: str, start: date, end: date, count: int) -> List[Shard]:
+    """
+    Split the dates from start to end inclusive into shards of as near the same length as they go
+
+    :param jh_path: JH file
+    :param nyt_path: NYT file
+    :param start: First date
+    :param end: Last date
+    :param count: Number of shards wanted. Fewer if there are fewer days.
+    """
+    days = (end - start).days + 1
+    count = max(1, min(count, days))
+    bounds = [start + timedelta(days=days * i // count) for i in range(count + 1)]
+    return [Shard(jh_path, nyt_path, bounds[i], bounds[i + 1]) for i in range(count)]
+
+
+def snapshot_shards(snapshot_store: SnapshotStore, jh_url: str, nyt_url: str) -> List[Shard]:
+    """
+    One shard per JH snapshot, paired with the latest NYT snapshot at the time. Each takes
+    the dates from the day its predecessor was fetched up to the day it was fetched itself,
+    i.e. the figures as they were first published, and the last takes the rest.
+
+    :param snapshot_store: Store the snapshots are in
+    :param jh_url: URL the JH snapshots are of
+    :param nyt_url: URL the NYT snapshots are of
+    :raises ValueError: if a JH snapshot has no NYT snapshot to go with it, or either is of an incremental download
+    """
+    shards = []
+    start = None
+    # Read once, as reading it from S3 takes a request per entry
+    entries = snapshot_store.index()
+    snapshots = [entry for entry in entries if entry['url'] == jh_url]
+    nyt_snapshots = [entry for entry in entries if entry['url'] == nyt_url]
+    nyt_times = [datetime.fromisoformat(entry['fetched_at']) for entry in nyt_snapshots]
+
+    for i, jh in enumerate(snapshots):
+        fetched_at = datetime.fromisoformat(jh['fetched_at'])
+        latest = bisect_right(nyt_times, fetched_at)
+        if not latest:
+            raise ValueError(f'No snapshot of {nyt_url} at or before {fetched_at}')
+        nyt = nyt_snapshots[latest - 1]
+        for snapshot in (jh, nyt):
+            if snapshot.get('partial', False):
+                raise ValueError(f'Snapshot of {snapshot["url"]} fetched at {snapshot["fetched_at"]} is of an incremental download')
+        end = None if i == len(snapshots) - 1 else fetched_at.date()
+        if end is None or start is None or end > start:
+            shards.append(Shard(snapshot_store.path(jh['sha256']), snapshot_store.path(nyt['sha256']), start, end))
+            start = end
+
+    return shards
+
+
+class Chunk:
+    """
+    Lines of one source file, from byte start up to end, to take the dates of a group of shards from.
+    Every shard of the group reads the same files, and each is given by its index in the backfill,
+    with its start and end date.
+    """
+
+    def __init__(self, path: str, start: int, end: int, is_jh: bool, shards: List[Tuple[int, Optional[date], Optional[date]]],
+                 all_regions: bool = False):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.is_jh = is_jh
+        self.shards = shards
+        self.all_regions = all_regions
+        self._starts = [shard_start or date.min for _, shard_start, _ in shards]
+
+
+    def shard_for(self, day: date) -> Optional[int]:
+        """
+        Index of the shard a date falls in, or None if in none of them
+        """
+        i = bisect_right(self._starts, day) - 1
+        if i < 0:
+            return None
+        index, _, shard_end = self.shards[i]
+        return index if shard_end is None or day < shard_end else None
+
+
+def line_ranges(path: str, count: int) -> List[Tuple[int, int]]:
+    """
+    Split the lines of a CSV file after the header into up to count byte ranges
+    of about the same size, each starting at the start of a line.
+    Fields are taken not to span lines, as in both sources.
+
+    :param path: File to split
+    :param count: Number of ranges wanted. Fewer if there are fewer lines.
+    """
+    with open(path, 'rb') as f:
+        f.readline()
+        first = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        offsets = [first]
+
+        for i in range(1, count):
+            # From the byte before, so a range already on a line start stays there
+            f.seek(max(offsets[-1], first + (size - first) * i // count) - 1)
+            f.readline()
+            offsets.append(f.tell())
+
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if end > start]
+
+
+def _read_chunk(chunk: Chunk, columns: Tuple[str, ...]) -> HeaderIndexedRows:
+    """
+    The header and lines of a chunk as header-indexed tuples, projected to the given columns
+    """
+    with open(chunk.path, 'rb') as f:
+        header = f.readline()
+        f.seek(chunk.start)
+        lines = f.read(chunk.end - chunk.start)
+
+    return read_csv_tuples(io.TextIOWrapper(io.BytesIO(header + lines), newline=''), columns)
+
+
+def aggregate_chunk(chunk: Chunk) -> Dict[int, list]:
+    """
+    Parse one chunk and split its rows by shard. Runs in a worker process.
+
+    JH rows are summed by country and date, as Transform does, so that what comes back
+    is set by the number of countries and days, not provinces. Sums from different chunks
+    of the same file add up to the sums over the whole file. Only the US is kept
+    unless all_regions is set. NYT rows are passed back as they are.
+
+    :param chunk: Chunk to parse
+    :returns: For each shard with rows in the chunk, (country, date, confirmed, deaths, recovered)
+              JH totals in country and date order, or (date, cases, deaths) NYT rows in file order
+    :raises InvalidDatasetError: For a missing column or a value that doesn't parse
+    """
+    columns = _JH_COLUMNS if chunk.is_jh else _NYT_COLUMNS
+    rows = _read_chunk(chunk, columns)
+    buckets = {}
+
+    try:
+        values = map(rows.getter(*columns), rows)
+
+        if not chunk.is_jh:
+            for row in values:
+                shard = chunk.shard_for(parse_iso_date(row[0]))
+                if shard is not None:
+                    buckets.setdefault(shard, []).append(row)
+            return buckets
+
+        keyed = (
+            (shard, country, day, int(confirmed), int(deaths), int(recovered))
+            for day, country, confirmed, deaths, recovered in values
+            if chunk.all_regions or country == 'US'
+            for shard in (chunk.shard_for(parse_iso_date(day)),) if shard is not None
+        )
+        for (shard, country, day), totals in GroupBy(key=itemgetter(0, 1, 2), values=itemgetter(3, 4, 5)).sum(keyed):
+            buckets.setdefault(shard, []).append((country, day, *totals))
+    except ValueError as e:
+        raise InvalidDatasetError(f'{e}')
+    except IndexError:
+        raise InvalidDatasetError('Row has too few fields')
+
+    return buckets
+
+
+def transform_shard(jh_totals: Iterable[list], nyt_rows: Iterable[list], all_regions: bool = False) -> Dict[str, ColumnarDataset]:
+    """
+    Transform one shard from what aggregate_chunk() gave for it. Runs in a worker process.
+
+    JH totals from every chunk are summed again, then handed to Transform
+    as one row per country and date, so the merge is exactly as for an ETL run.
+
+    :param jh_totals: JH totals from each chunk, in file order
+    :param nyt_rows: NYT rows from each chunk, in file order
+    :param all_regions: If set, every country, else just the US
+    :returns: Dataset for each country
+    """
+    totals = GroupBy(key=itemgetter(0, 1), values=itemgetter(2, 3, 4)).sum(chain.from_iterable(jh_totals))
+    jh = HeaderIndexedRows(chain(
+        (_JH_FIELDS,),
+        ((day, country, '', '', '', confirmed, recovered, deaths) for (country, day), (confirmed, deaths, recovered) in totals)
+    ))
+    nyt = HeaderIndexedRows(chain((_NYT_COLUMNS,), chain.from_iterable(nyt_rows)))
+    transform = Transform([jh, nyt])
+
+    if all_regions:
+        return transform.transform_regions()
+
+    us = transform.transform_data()
+    return {'US': us} if us else {}
+
+
+class _RateLimiter:
+    """
+    Paces work to an average rate, allowing up to a second's worth at once
+    """
+
+    def __init__(self, rate: float):
+        self._rate = rate
+        self._allowance = rate
+        self._last = time.monotonic()
+
+
+    def acquire(self, amount: int) -> None:
+        """
+        Wait until this much more work keeps to the rate
+        """
+        now = time.monotonic()
+        self._allowance = min(self._rate, self._allowance + (now - self._last) * self._rate) - amount
+        self._last = now
+
+        if self._allowance < 0:
+            time.sleep(-self._allowance / self._rate)
+            self._allowance = 0
+            self._last = time.monotonic()
+
+
+class Backfill:
+    """
+    Rebuilds the repository over the dates of a set of shards
+
+    The chunks of the source files are parsed in a process pool, all at once.
+    Each shard is transformed in the pool as soon as the last of its chunks is in,
+    and written, in shard order, by this process alone, while later shards are
+    still being transformed. Writes are paced to the table's write capacity, with batches in flight
+    limited as MultiRegionLoader does. Records are written whether or not they are already
+    there, and the watermark plays no part, but fingerprints kept by earlier
+    loads are brought up to date so the next load doesn't write them again.
+
+    Shards may not overlap, so the datasets merged from them, and what ends up
+    in the repository, are the same as for a sequential run over the whole range.
+    """
+
+    def __init__(self, target: str, shards: List[Shard], loader_class: type = DynamoDBLoader,
+                 all_regions: bool = False, max_workers: int = None, write_capacity: int = None,
+                 collector: GVizCollector = None):
+        """
+        Constructor
+
+        :param target: Table to load, or database file for SQLiteLoader
+        :param shards: Shards to transform and write
+        :param loader_class: Loader for each partition
+        :param all_regions: If set, every country is written to its own partition, else just the US
+        :param max_workers: Number of worker processes. One per CPU if not given.
+        :param write_capacity: Write capacity units of the table to keep to. Unpaced if not given.
+        :param collector: Chart collector to rebuild from the US partition and publish once written
+        :raises ValueError: if shards overlap
+        """
+        self._shards = sorted(shards, key=lambda shard: shard.start or date.min)
+        for before, after in zip(self._shards, self._shards[1:]):
+            if before.end is None or after.start is None or before.end > after.start:
+                raise ValueError(f'{before} and {after} overlap')
+
+        self._target = target
+        self._loader_class = loader_class
+        self._all_regions = all_regions
+        self._max_workers = max_workers
+        self._collector = collector
+        self._rate_limiter = _RateLimiter(write_capacity) if write_capacity else None
+        self._capacity_limiter = threading.BoundedSemaphore(
+            max(1, (write_capacity or DynamoDBBatchWriter._MAX_BATCH_SIZE) // DynamoDBBatchWriter._MAX_BATCH_SIZE))
+        self._partitions = {}
+        self.record_counts = {}
+        self.write_capacity_units = 0.0
+
+
+    def _write(self, regions: Dict[str, ColumnarDataset]) -> None:
+        """
+        Write one shard's datasets, a partition at a time
+        """
+        for region in sorted(regions):
+            dataset = regions[region]
+            partition = Loader.partition_for(region)
+            if self._partitions.setdefault(partition, region) != region:
+                raise ValueError(f'{region} and {self._partitions[partition]} would share partition {partition}')
+            if not dataset:
+                continue
+
+            if self._rate_limiter:
+                self._rate_limiter.acquire(len(dataset))
+
+            options = {'capacity_limiter': self._capacity_limiter} if issubclass(self._loader_class, DynamoDBLoader) else {}
+            loader = self._loader_class(self._target, dataset, None, partition, **options)
+            loader.write_records(dataset)
+            loader.update_fingerprints(dataset)
+            self.record_counts[region] = self.record_counts.get(region, 0) + len(dataset)
+            self.write_capacity_units += loader.write_capacity_units
+
+
+    def _chunks(self) -> List[Chunk]:
+        """
+        Chunks of every source file, as many for each file as there are shards reading it, in file order
+        """
+        groups = {}
+        for index, shard in enumerate(self._shards):
+            groups.setdefault((shard.jh_path, shard.nyt_path), []).append((index, shard.start, shard.end))
+
+        return [
+            Chunk(path, start, end, is_jh, shards, self._all_regions)
+            for (jh_path, nyt_path), shards in groups.items()
+            for path, is_jh in ((jh_path, True), (nyt_path, False))
+            for start, end in line_ranges(path, len(shards))
+        ]
+
+
+    def run(self) -> Dict[str, ColumnarDataset]:
+        """
+        Transform and write every shard
+
+        :returns: Dataset for each country, over all the shards
+        """
+        chunks = self._chunks()
+        shard_chunks = {index: [] for index in range(len(self._shards))}
+        for position, chunk in enumerate(chunks):
+            for index, _, _ in chunk.shards:
+                shard_chunks[index].append(position)
+
+        parts = [None] * len(chunks)
+        transforms = [None] * len(self._shards)
+        merged = {}
+
+        with ProcessPoolExecutor(max_workers=self._max_workers) as executor:
+            def submit_transform(index: int) -> None:
+                # Its parts in chunk order, which is file order, whatever order they finished in
+                positions = shard_chunks[index]
+                transforms[index] = executor.submit(
+                    transform_shard,
+                    [parts[position].pop(index, []) for position in positions if chunks[position].is_jh],
+                    [parts[position].pop(index, []) for position in positions if not chunks[position].is_jh],
+                    self._all_regions
+                )
+
+            aggregates = {executor.submit(aggregate_chunk, chunk): position for position, chunk in enumerate(chunks)}
+            for index, positions in shard_chunks.items():
+                if not positions:
+                    submit_transform(index)
+
+            for future in as_completed(aggregates):
+                parts[aggregates[future]] = future.result()
+                for index, _, _ in chunks[aggregates[future]].shards:
+                    if all(parts[position] is not None for position in shard_chunks[index]):
+                        submit_transform(index)
+
+            for transform in transforms:
+                regions = transform.result()
+                self._write(regions)
+                for region, dataset in regions.items():
+                    merged.setdefault(region, ColumnarDataset()).extend(dataset)
+
+        if self._collector is not None:
+            self._collector.add_rows(self._loader_class(self._target, [], None).read_all_data())
+            self._collector.write_to_s3()
+
+        return merged
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description='Rebuild a range of dates in the repository from source files')
+    parser.add_argument('jh_path')
+    parser.add_argument('nyt_path')
+    parser.add_argument('--start', type=date.fromisoformat, required=True)
+    parser.add_argument('--end', type=date.fromisoformat, required=True, help='Last date, inclusive')
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes. One per CPU by default.')
+    parser.add_argument('--all-regions', action='store_true', help='Every country, not just the US')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--table', help='DynamoDB table')
+    target.add_argument('--sqlite', help='SQLite database file')
+    parser.add_argument('--write-capacity', type=int, default=25, help='Write capacity units of the DynamoDB table')
+    args = parser.parse_args(argv)
+
+    shards = date_shards(args.jh_path, args.nyt_path, args.start, args.end, args.shards)
+    if args.sqlite:
+        backfill = Backfill(args.sqlite, shards, SQLiteLoader, args.all_regions, args.workers)
+    else:
+        backfill = Backfill(args.table, shards, DynamoDBLoader, args.all_regions, args.workers, args.write_capacity)
+
+    start = time.perf_counter()
+    backfill.run()
+    print(f'{sum(backfill.record_counts.values())} records in {len(backfill.record_counts)} regions written '
+          f'from {len(shards)} shards in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,179 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from lazy import lazy_import
+from metrics import capacity_units
+from typing import Iterable, List, Tuple
+
+botocore_exceptions = lazy_import('botocore.exceptions')
+
+
+class BatchWriteError(Exception):
+    """
+    Raised when items are still unprocessed after all retries
+    """
+    def __init__(self, unprocessed_count: int):
+        self.unprocessed_count = unprocessed_count
+        self.message = f'{unprocessed_count} items could not be written after retrying'
+        super().__init__(self.message)
+
+
+class BatchWriteStats:
+    """
+    Counts from a DynamoDBBatchWriter.write() call, or several merged
+    """
+    def __init__(self):
+        self.items_written = 0
+        self.batches = 0
+        self.retries = 0
+        self.throttles = 0
+        self.duplicates = 0
+        self.consumed_capacity = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **counts) -> None:
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def merge(self, other: 'BatchWriteStats') -> None:
+        """
+        Add the counts of another write() call to these
+        """
+        self.add(**other.as_dict())
+
+    def as_dict(self) -> dict:
+        return {
+            'items_written': self.items_written,
+            'batches': self.batches,
+            'retries': self.retries,
+            'throttles': self.throttles,
+            'duplicates': self.duplicates,
+            'consumed_capacity': self.consumed_capacity
+        }
+
+
+class DynamoDBBatchWriter:
+    """
+    Writes items to a DynamoDB table with BatchWriteItem,
+    running batches concurrently on a bounded thread pool.
+
+    Items DynamoDB hands back as unprocessed, and whole batches rejected
+    by throttling, are resubmitted after a jittered exponential backoff
+    (random wait up to base_delay * 2^attempt, capped at max_delay).
+    If anything is left after max_attempts, BatchWriteError is raised,
+    so items are never silently dropped.
+
+    A semaphore can be given to bound the batches in flight across several
+    writers, e.g. one per partition all writing to the same table.
+
+    Takes a client rather than a resource, as clients are thread safe.
+    The client of a resource (resource.meta.client) accepts plain Python values.
+    """
+
+    # Maximum number of records that can be written to dynamo in batches
+    _MAX_BATCH_SIZE = 25
+
+    _THROTTLING_ERRORS = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+
+    def __init__(self, client, table_name: str, key_attributes: Tuple[str, ...] = ('dataset', 'date'),
+                 max_workers: int = 4, max_attempts: int = 8, base_delay: float = 0.05, max_delay: float = 5.0,
+                 limiter: threading.Semaphore = None):
+        """
+        Constructor
+
+        :param client: DynamoDB client
+        :param table_name: Table to write to
+        :param key_attributes: Names of the key attributes, used to remove duplicate keys
+        :param max_workers: Maximum number of batches in flight at once
+        :param max_attempts: Maximum number of tries for any one item
+        :param base_delay: Backoff before the first retry, in seconds
+        :param max_delay: Longest backoff, in seconds
+        :param limiter: Semaphore held for each batch write, if any
+        """
+        self._client = client
+        self._table_name = table_name
+        self._key_attributes = key_attributes
+        self._max_workers = max_workers
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._limiter = limiter
+
+
+    def _backoff(self, attempt: int) -> None:
+        time.sleep(random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt)))
+
+
+    def _send(self, requests: List[dict]) -> dict:
+        return self._client.batch_write_item(
+            RequestItems={self._table_name: requests},
+            ReturnConsumedCapacity='TOTAL'
+        )
+
+
+    def _write_batch(self, requests: List[dict], stats: BatchWriteStats) -> None:
+        """
+        Write one batch, retrying until everything in it is processed
+
+        :raises BatchWriteError: If items remain after the last attempt
+        """
+        for attempt in range(self._max_attempts):
+            if attempt:
+                stats.add(retries=1)
+                self._backoff(attempt)
+
+            try:
+                if self._limiter:
+                    with self._limiter:
+                        response = self._send(requests)
+                else:
+                    response = self._send(requests)
+            except botocore_exceptions.ClientError as e:
+                if e.response['Error']['Code'] not in self._THROTTLING_ERRORS:
+                    raise
+                stats.add(throttles=1)
+                continue
+
+            unprocessed = response.get('UnprocessedItems', {}).get(self._table_name, [])
+            stats.add(items_written=len(requests) - len(unprocessed),
+                      consumed_capacity=capacity_units(response.get('ConsumedCapacity', None)))
+
+            if not unprocessed:
+                return
+
+            stats.add(throttles=1)
+            requests = unprocessed
+
+        raise BatchWriteError(len(requests))
+
+
+    def write(self, items: Iterable[dict]) -> BatchWriteStats:
+        """
+        Write all the given items. Where several have the same key, the last one is written.
+
+        :param items: Items to write
+        :returns: Counts of what was done
+        """
+        stats = BatchWriteStats()
+        unique = {}
+
+        for item in items:
+            key = tuple(item[name] for name in self._key_attributes)
+            if key in unique:
+                stats.duplicates += 1
+            unique[key] = item
+
+        requests = [{'PutRequest': {'Item': item}} for item in unique.values()]
+        batches = [requests[i:i + self._MAX_BATCH_SIZE] for i in range(0, len(requests), self._MAX_BATCH_SIZE)]
+        stats.batches = len(batches)
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = [executor.submit(self._write_batch, batch, stats) for batch in batches]
+
+        # Raise the first failure, if any, once everything has finished
+        for future in futures:
+            future.result()
+
+        return stats
@@ -0,0 +1,128 @@
+import os
+import json
+from abc import ABC, abstractmethod
+from clients import get_client, get_resource
+
+
+class ValidatorCache(ABC):
+    """
+    Stores the HTTP validators (ETag, Last-Modified) and content hash
+    of the last successfully processed download of each URL,
+    so that Extract can tell when a source has not changed.
+
+    Derived classes decide where the entries are kept.
+    """
+
+    @abstractmethod
+    def get(self, url: str) -> dict:
+        """
+        Get the validators stored for a URL
+
+        :param url: URL of the source
+        :returns: dict of validators, empty if there are none
+        """
+
+
+    @abstractmethod
+    def put(self, url: str, validators: dict) -> None:
+        """
+        Store the validators for a URL, replacing any already there
+
+        :param url: URL of the source
+        :param validators: dict of validators
+        """
+
+
+class FileValidatorCache(ValidatorCache):
+    """
+    Validator cache held in a local JSON file. Used by the tests.
+    """
+
+    def __init__(self, file_path: str):
+        self._file_path = file_path
+
+
+    def _read(self) -> dict:
+        if not os.path.exists(self._file_path):
+            return {}
+        with open(self._file_path, 'r') as f:
+            return json.load(f)
+
+
+    def get(self, url: str) -> dict:
+        return self._read().get(url, {})
+
+
+    def put(self, url: str, validators: dict) -> None:
+        entries = self._read()
+        entries[url] = validators
+        with open(self._file_path, 'w') as f:
+            json.dump(entries, f)
+
+
+class S3ValidatorCache(ValidatorCache):
+    """
+    Validator cache held as a single JSON object in S3
+    """
+
+    def __init__(self, bucket_name: str, key: str):
+        self._bucket_name = bucket_name
+        self._key = key
+        self._s3 = get_client('s3')
+
+
+    def _read(self) -> dict:
+        try:
+            response = self._s3.get_object(Bucket=self._bucket_name, Key=self._key)
+        except self._s3.exceptions.NoSuchKey:
+            return {}
+        return json.loads(response['Body'].read())
+
+
+    def get(self, url: str) -> dict:
+        return self._read().get(url, {})
+
+
+    def put(self, url: str, validators: dict) -> None:
+        entries = self._read()
+        entries[url] = validators
+        self._s3.put_object(
+            Bucket=self._bucket_name,
+            Key=self._key,
+            Body=json.dumps(entries).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+
+class DynamoDBValidatorCache(ValidatorCache):
+    """
+    Validator cache held as items in the data table.
+
+    Entries live in their own partition so they never show up
+    in queries for the data itself. Extract reads and writes them from
+    several threads, so calls go through the resource's client, which
+    unlike the resource is thread safe.
+    """
+
+    # Partition key value reserved for ETL metadata
+    _METADATA_DATASET = 0
+
+    def __init__(self, table_name: str):
+        self._table_name = table_name
+        self._client = get_resource('dynamodb').meta.client
+
+
+    def _key(self, url: str) -> dict:
+        return {
+            'dataset': self._METADATA_DATASET,
+            'date': f'validators#{url}'
+        }
+
+
+    def get(self, url: str) -> dict:
+        item = self._client.get_item(TableName=self._table_name, Key=self._key(url), ConsistentRead=True).get('Item', None)
+        return json.loads(item['validators']) if item else {}
+
+
+    def put(self, url: str, validators: dict) -> None:
+        self._client.put_item(TableName=self._table_name, Item={**self._key(url), 'validators': json.dumps(validators)})
@@ -0,0 +1,49 @@
+"""
+Shared boto3 clients and resources.
+
+Created on first use and then kept at module level, so warm Lambda
+invocations reuse them (and their connection pools) instead of paying
+for new ones each time.
+"""
+import threading
+from lazy import lazy_import
+
+boto3 = lazy_import('boto3')
+
+_lock = threading.Lock()
+_clients = {}
+_resources = {}
+
+
+def get_client(service_name: str):
+    """
+    Get the shared client for a service, creating it if need be
+
+    :param service_name: e.g. 'sns'
+    """
+    with _lock:
+        if service_name not in _clients:
+            _clients[service_name] = boto3.client(service_name)
+        return _clients[service_name]
+
+
+def get_resource(service_name: str):
+    """
+    Get the shared resource for a service, creating it if need be.
+    Resources are not thread safe; use resource.meta.client to share across threads.
+
+    :param service_name: e.g. 'dynamodb'
+    """
+    with _lock:
+        if service_name not in _resources:
+            _resources[service_name] = boto3.resource(service_name)
+        return _resources[service_name]
+
+
+def reset() -> None:
+    """
+    Forget all shared clients and resources. Used by the tests.
+    """
+    with _lock:
+        _clients.clear()
+        _resources.clear()
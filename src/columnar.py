@@ -0,0 +1,256 @@
+import json
+from array import array
+from bisect import bisect_right
+from datetime import date
+from collections.abc import Mapping, Sequence
+from typing import Iterable, Iterator, Optional, Tuple
+
+
+class Row(Mapping):
+    """
+    Read-only view of one row of a ColumnarDataset.
+
+    Behaves like the dict records used elsewhere (row['date'] etc.)
+    for code that wants per-row access, without copying the row out.
+    """
+    __slots__ = ('_dataset', '_index')
+
+    def __init__(self, dataset: 'ColumnarDataset', index: int):
+        self._dataset = dataset
+        self._index = index
+
+    def __getitem__(self, key: str):
+        return self._dataset._value(key, self._index)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(ColumnarDataset.COLUMNS)
+
+    def __len__(self) -> int:
+        return len(ColumnarDataset.COLUMNS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class ColumnarDataset(Sequence):
+    """
+    Compact, column-oriented store for the merged data.
+
+    Dates are held as ordinals in an array('i') and the counts
+    in array('q'), so a row costs 28 bytes rather than a dict.
+    Indexing gives a Row view; slicing gives a new dataset.
+    """
+    __slots__ = ('_dates', '_cases', '_deaths', '_recovered', '_sorted')
+
+    COLUMNS = ('date', 'cases', 'deaths', 'recovered')
+
+    def __init__(self):
+        self._dates = array('i')
+        self._cases = array('q')
+        self._deaths = array('q')
+        self._recovered = array('q')
+        self._sorted = True
+
+
+    @classmethod
+    def from_tuples(cls, records: Iterable[Tuple[date, int, int, int]]) -> 'ColumnarDataset':
+        """
+        Build a dataset from (date, cases, deaths, recovered) tuples
+        """
+        dataset = cls()
+        for record in records:
+            dataset.append(*record)
+        return dataset
+
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping]) -> 'ColumnarDataset':
+        """
+        Build a dataset from dict-like records with the keys in COLUMNS
+        """
+        if isinstance(rows, ColumnarDataset):
+            return rows
+        return cls.from_tuples((r['date'], r['cases'], r['deaths'], r['recovered']) for r in rows)
+
+
+    def append(self, day: date, cases: int, deaths: int, recovered: int) -> None:
+        """
+        Add a row to the end of the dataset
+        """
+        ordinal = day.toordinal()
+        if self._dates and ordinal < self._dates[-1]:
+            self._sorted = False
+        self._dates.append(ordinal)
+        self._cases.append(cases)
+        self._deaths.append(deaths)
+        self._recovered.append(recovered)
+
+
+    def extend(self, other: 'ColumnarDataset') -> None:
+        """
+        Add all the rows of another dataset to the end of this one
+        """
+        if other._dates and self._dates and other._dates[0] < self._dates[-1]:
+            self._sorted = False
+        self._sorted = self._sorted and other._sorted
+        self._dates.extend(other._dates)
+        self._cases.extend(other._cases)
+        self._deaths.extend(other._deaths)
+        self._recovered.extend(other._recovered)
+
+
+    def column(self, name: str) -> array:
+        """
+        Get a column's array. Dates are ordinals.
+        """
+        return getattr(self, f'_{name}s' if name == 'date' else f'_{name}')
+
+
+    def _value(self, name: str, index: int):
+        if name == 'date':
+            return date.fromordinal(self._dates[index])
+        if name in self.COLUMNS:
+            return self.column(name)[index]
+        raise KeyError(name)
+
+
+    def tuples(self) -> Iterator[Tuple[date, int, int, int]]:
+        """
+        Generator of (date, cases, deaths, recovered) tuples, in row order
+        """
+        for ordinal, cases, deaths, recovered in zip(self._dates, self._cases, self._deaths, self._recovered):
+            yield date.fromordinal(ordinal), cases, deaths, recovered
+
+
+    def to_json(self) -> bytes:
+        """
+        Serialize as a JSON object of column arrays, dates as ordinals
+        """
+        return json.dumps({name: self.column(name).tolist() for name in self.COLUMNS}, separators=(',', ':')).encode('utf-8')
+
+
+    @classmethod
+    def from_json(cls, data: bytes) -> 'ColumnarDataset':
+        """
+        Deserialize from the output of to_json()
+        """
+        columns = json.loads(data)
+        dataset = cls()
+        for name in cls.COLUMNS:
+            dataset.column(name).fromlist(columns[name])
+        dataset._sorted = all(a <= b for a, b in zip(dataset._dates, dataset._dates[1:]))
+        return dataset
+
+
+    def is_sorted(self) -> bool:
+        """
+        Whether the rows are in ascending date order
+        """
+        return self._sorted
+
+
+    def last_date(self) -> Optional[date]:
+        """
+        Date of the last row, or None if empty
+        """
+        return date.fromordinal(self._dates[-1]) if self._dates else None
+
+
+    def after(self, day: date) -> 'ColumnarDataset':
+        """
+        New dataset with only the rows dated after the given date
+        """
+        ordinal = day.toordinal()
+        if self._sorted:
+            return self[bisect_right(self._dates, ordinal):]
+
+        selected = ColumnarDataset()
+        for i, row_ordinal in enumerate(self._dates):
+            if row_ordinal > ordinal:
+                selected._dates.append(row_ordinal)
+                selected._cases.append(self._cases[i])
+                selected._deaths.append(self._deaths[i])
+                selected._recovered.append(self._recovered[i])
+        return selected
+
+
+    def take(self, indices: Iterable[int]) -> 'ColumnarDataset':
+        """
+        New dataset with the rows at the given indices, in the order given
+        """
+        indices = list(indices)
+        selected = ColumnarDataset()
+        selected._dates = array('i', map(self._dates.__getitem__, indices))
+        selected._cases = array('q', map(self._cases.__getitem__, indices))
+        selected._deaths = array('q', map(self._deaths.__getitem__, indices))
+        selected._recovered = array('q', map(self._recovered.__getitem__, indices))
+        selected._sorted = all(a <= b for a, b in zip(selected._dates, selected._dates[1:]))
+        return selected
+
+
+    def merged(self, other: 'ColumnarDataset') -> 'ColumnarDataset':
+        """
+        New dataset of the rows of both, in date order, those of other
+        taking the place of any here with the same date.
+        Dates are taken to be unique within each.
+        """
+        rows = {}
+        for dataset in (self, other):
+            for i, ordinal in enumerate(dataset._dates):
+                rows[ordinal] = (dataset, i)
+
+        merged = ColumnarDataset()
+        for ordinal in sorted(rows):
+            dataset, i = rows[ordinal]
+            merged._dates.append(ordinal)
+            merged._cases.append(dataset._cases[i])
+            merged._deaths.append(dataset._deaths[i])
+            merged._recovered.append(dataset._recovered[i])
+        return merged
+
+
+    def sorted_by_date(self) -> 'ColumnarDataset':
+        """
+        This dataset if already in date order, else a copy sorted by date.
+        Rows with the same date keep their order.
+        """
+        if self._sorted:
+            return self
+        return self.take(sorted(range(len(self._dates)), key=self._dates.__getitem__))
+
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            selected = ColumnarDataset()
+            selected._dates = self._dates[index]
+            selected._cases = self._cases[index]
+            selected._deaths = self._deaths[index]
+            selected._recovered = self._recovered[index]
+            selected._sorted = self._sorted and (index.step or 1) > 0
+            return selected
+
+        if index < 0:
+            index += len(self._dates)
+        if not 0 <= index < len(self._dates):
+            raise IndexError('dataset index out of range')
+        return Row(self, index)
+
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ColumnarDataset):
+            return (self._dates, self._cases, self._deaths, self._recovered) == \
+                (other._dates, other._cases, other._deaths, other._recovered)
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+
+    __hash__ = None
+
+
+    def __repr__(self) -> str:
+        return f'ColumnarDataset({list(map(dict, self))!r})'
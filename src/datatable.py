@@ -0,0 +1,79 @@
+import json
+from datetime import date
+from typing import List, Tuple, Union
+from columnar import ColumnarDataset
+from derived import DerivedSeries
+
+# Encoded the same way as gviz_api's DataTableJSONEncoder
+_encode = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+# Date cells are pre-rendered once per distinct date and dropped in whole
+_CELL_FORMATS = {
+    'date': b'%b',
+    'string': b'%b',
+    'number': b'{"v":%d}'
+}
+
+# Number columns held as floats. %a gives repr(), which is how json writes a float.
+_FLOAT_CELL_FORMAT = b'{"v":%a}'
+
+
+def _date_cells(ordinals) -> list:
+    """
+    Render the cells for a column of date ordinals, once per distinct date
+    """
+    rendered = {}
+    for ordinal in set(ordinals):
+        day = date.fromordinal(ordinal)
+        rendered[ordinal] = b'{"v":"Date(%d,%d,%d)"}' % (day.year, day.month - 1, day.day)
+    return [rendered[ordinal] for ordinal in ordinals]
+
+
+def _string_cells(values) -> list:
+    """
+    Render the cells for a column of strings, once per distinct string
+    """
+    rendered = {value: b'{"v":' + _encode(value).encode('utf-8') + b'}' for value in set(values)}
+    return [rendered[value] for value in values]
+
+
+def render_datatable(dataset: Union[ColumnarDataset, DerivedSeries], column_definitions: List[Tuple[str, str, str]]) -> bytes:
+    """
+    Render a dataset as the JSON literal for a google.visualization.DataTable,
+    with rows in date order.
+
+    Produces exactly the same bytes as gviz_api's DataTable.LoadData()
+    and ToJSon(order_by='date'), without building a table of Python objects:
+    each row is formatted straight from the column arrays with one
+    pre-built format string.
+
+    :param dataset: Rows to render. Anything with column(name) and is_sorted() will do.
+    :param column_definitions: (id, type, label) for each column, in output order.
+                               Types may be 'date', 'string' or 'number'; numbers may be int or float arrays.
+    :returns: UTF-8 encoded JSON
+    """
+    cols = _encode([{'id': col_id, 'label': label, 'type': col_type} for col_id, col_type, label in column_definitions])
+    row_format = b'{"c":[' + b','.join(
+        _FLOAT_CELL_FORMAT if getattr(dataset.column(col_id), 'typecode', None) == 'd' else _CELL_FORMATS[col_type]
+        for col_id, col_type, _ in column_definitions
+    ) + b']}'
+
+    if dataset.is_sorted():
+        order = None
+    else:
+        # Stable, like gviz_api's sort
+        dates = dataset.column('date')
+        order = sorted(range(len(dates)), key=dates.__getitem__)
+
+    columns = []
+    for col_id, col_type, _ in column_definitions:
+        column = dataset.column(col_id)
+        if order is not None:
+            column = [column[i] for i in order]
+        if col_type == 'date':
+            column = _date_cells(column)
+        elif col_type == 'string':
+            column = _string_cells(column)
+        columns.append(column)
+
+    return b'{"cols":' + cols.encode('utf-8') + b',"rows":[' + b','.join(row_format % row for row in zip(*columns)) + b']}'
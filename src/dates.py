@@ -0,0 +1,28 @@
+from datetime import date, datetime
+from functools import lru_cache
+
+# Enough for more than ten years of distinct days
+_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def parse_iso_date(value: str) -> date:
+    """
+    Parse a YYYY-MM-DD date string.
+
+    The datasets repeat the same few hundred date strings many times over
+    (once per country in JH), so results are memoized. Cache misses shaped
+    like YYYY-MM-DD use date.fromisoformat, which is far cheaper than strptime.
+    It takes other ISO 8601 forms from Python 3.11, so anything else, and anything
+    it rejects, goes to strptime: exactly what parsed before is accepted.
+
+    :param value: Date string
+    :returns: The date
+    :raises ValueError: If the value is not a valid date (errors are not cached)
+    """
+    if len(value) == 10 and value[4] == value[7] == '-':
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, '%Y-%m-%d').date()
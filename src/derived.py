@@ -0,0 +1,174 @@
+from array import array
+from datetime import date
+from itertools import chain
+from operator import sub
+from typing import Dict, List, Tuple
+from columnar import ColumnarDataset
+from downsample import rollup
+
+# Rolling mean windows, in days
+_WINDOWS = (7, 14)
+_MEASURES = ('cases', 'deaths', 'recovered')
+
+
+class DerivedSeries:
+    """
+    Daily figures derived from the cumulative dataset: new cases, deaths and
+    recovered each day, and their 7 and 14 day rolling means.
+
+    Worked out once per ETL run and published alongside the dataset, so the
+    page doesn't have to walk the table to get them on every view.
+
+    Each column is built from whole arrays with map() over C-level
+    operators, rather than row by row. A day's figure is the difference
+    from the row before, so the first row counts everything up to it.
+    A rolling mean over w days is the difference from the row w before,
+    divided by w; until there are w rows, it is the mean of those there are.
+    Rows are taken to be consecutive days, as both sources publish daily.
+    """
+    __slots__ = ('_columns',)
+
+    WINDOWS = _WINDOWS
+
+    COLUMNS = ('date',) + tuple(f'new_{m}' for m in _MEASURES) + \
+        tuple(f'{m}_{w}d' for w in _WINDOWS for m in _MEASURES)
+
+    # (id, type, label) in output order, as for GVizCollector
+    column_definitions = [('date', 'date', 'Date')] + \
+        [(f'new_{m}', 'number', f'New {m}') for m in _MEASURES] + \
+        [(f'{m}_{w}d', 'number', f'New {m} ({w} day mean)') for w in _WINDOWS for m in _MEASURES]
+
+    def __init__(self, columns: Dict[str, array]):
+        self._columns = columns
+
+
+    @classmethod
+    def from_dataset(cls, dataset: ColumnarDataset) -> 'DerivedSeries':
+        """
+        Derive the series from cumulative data, sorting it by date first if need be
+        """
+        dataset = dataset.sorted_by_date()
+        source = {name: dataset.column(name) for name in ColumnarDataset.COLUMNS}
+
+        columns = {'date': array('i', source['date'])}
+
+        for measure in _MEASURES:
+            cumulative = source[measure]
+            columns[f'new_{measure}'] = array('q', chain(cumulative[:1], map(sub, cumulative[1:], cumulative[:-1])))
+
+        for window in cls.WINDOWS:
+            for measure in _MEASURES:
+                cumulative = source[measure]
+                head = (total / (i + 1) for i, total in enumerate(cumulative[:window]))
+                full = (difference / window for difference in map(sub, cumulative[window:], cumulative[:-window]))
+                columns[f'{measure}_{window}d'] = array('d', (round(mean, 2) for mean in chain(head, full)))
+
+        return cls(columns)
+
+
+    def column(self, name: str) -> array:
+        """
+        Get a column's array. Dates are ordinals, means are floats.
+        """
+        return self._columns[name]
+
+
+    def is_sorted(self) -> bool:
+        return True
+
+
+    def tuples(self) -> List[Tuple]:
+        """
+        Rows as tuples of the column values in COLUMNS order, dates as ordinals
+        """
+        return list(zip(*(self._columns[name] for name in self.COLUMNS)))
+
+
+    def __len__(self) -> int:
+        return len(self._columns['date'])
+
+
+class MonthlyTotals:
+    """
+    New cases, deaths and recovered in each calendar month, for the column chart.
+
+    A month's total is its last cumulative figure less the month before's,
+    so the first month counts everything up to its end. Months are labelled
+    YYYY-MM, as strings, so the chart shows one bar per label.
+    """
+    __slots__ = ('_columns',)
+
+    COLUMNS = ('month',) + _MEASURES
+
+    # (id, type, label) in output order, as for GVizCollector
+    column_definitions = [('month', 'string', 'Month')] + [(m, 'number', m.capitalize()) for m in _MEASURES]
+
+    def __init__(self, columns: Dict[str, array]):
+        self._columns = columns
+
+
+    @classmethod
+    def from_dataset(cls, dataset: ColumnarDataset) -> 'MonthlyTotals':
+        """
+        Total cumulative data by month, in any order
+        """
+        months = rollup(dataset, 'month')
+        columns = {'month': [date.fromordinal(ordinal).strftime('%Y-%m') for ordinal in months.column('date')]}
+
+        for measure in _MEASURES:
+            cumulative = months.column(measure)
+            columns[measure] = array('q', chain(cumulative[:1], map(sub, cumulative[1:], cumulative[:-1])))
+
+        return cls(columns)
+
+
+    def column(self, name: str):
+        return self._columns[name]
+
+
+    def is_sorted(self) -> bool:
+        return True
+
+
+    def __len__(self) -> int:
+        return len(self._columns['month'])
+
+
+class MeasuresByDate:
+    """
+    The cumulative figures turned on their side for the pie chart: a row per
+    measure and a column per date, with the date (YYYY-MM-DD) as column id.
+    Showing one day is then a view of two columns, found by id.
+    """
+    __slots__ = ('_columns', 'column_definitions')
+
+    _LABELS = tuple(m.capitalize() for m in _MEASURES)
+
+    def __init__(self, columns: Dict[str, list], column_definitions: List[Tuple[str, str, str]]):
+        self._columns = columns
+        self.column_definitions = column_definitions
+
+
+    @classmethod
+    def from_dataset(cls, dataset: ColumnarDataset) -> 'MeasuresByDate':
+        """
+        Turn cumulative data, in any order, on its side
+        """
+        dataset = dataset.sorted_by_date()
+        days = [str(date.fromordinal(ordinal)) for ordinal in dataset.column('date')]
+        columns = dict(zip(days, zip(*(dataset.column(m) for m in _MEASURES))))
+        columns['measure'] = cls._LABELS
+
+        return cls(columns, [('measure', 'string', 'Metric')] + [(day, 'number', day) for day in days])
+
+
+    def column(self, name: str):
+        return self._columns[name]
+
+
+    def is_sorted(self) -> bool:
+        return True
+
+
+    def __len__(self) -> int:
+        return len(_MEASURES)
@@ -0,0 +1,135 @@
+"""
+Smaller versions of a dataset for charting long date ranges.
+
+Rollups keep one row per week or month. Figures are cumulative, so each
+period's row holds the values of the last day in it, dated by the first day
+of the period.
+
+by_year() splits the daily rows into a dataset per calendar year, so a
+narrow range can be drawn at full resolution from a year or two of rows.
+
+lttb() picks a fixed number of rows with Largest-Triangle-Three-Buckets,
+which keeps the visual shape of a series far better than taking every
+n-th row. Rows are chosen on one column, and carried whole.
+"""
+from bisect import bisect_left
+from datetime import date
+from itertools import groupby
+from typing import Callable, Dict
+from columnar import ColumnarDataset
+
+
+def _week_start(ordinal: int) -> int:
+    # Ordinal 1 (0001-01-01) was a Monday
+    return ordinal - (ordinal - 1) % 7
+
+
+def _month_start(ordinal: int) -> int:
+    return date.fromordinal(ordinal).replace(day=1).toordinal()
+
+
+_PERIOD_STARTS = {
+    'week': _week_start,
+    'month': _month_start
+}
+
+
+def rollup(dataset: ColumnarDataset, period: str) -> ColumnarDataset:
+    """
+    Roll a cumulative dataset up to one row per period
+
+    :param dataset: Daily rows, in any order
+    :param period: 'week' (starting Monday) or 'month'
+    :returns: A row per period holding its last day's values, dated by the period's first day
+    """
+    period_start: Callable[[int], int] = _PERIOD_STARTS[period]
+    dataset = dataset.sorted_by_date()
+    dates = dataset.column('date')
+
+    last_rows = []
+    starts = []
+    for start, rows in groupby(range(len(dates)), key=lambda i: period_start(dates[i])):
+        starts.append(start)
+        *_, last = rows
+        last_rows.append(last)
+
+    cases, deaths, recovered = (dataset.column(name) for name in ('cases', 'deaths', 'recovered'))
+    return ColumnarDataset.from_tuples(
+        (date.fromordinal(start), cases[i], deaths[i], recovered[i]) for start, i in zip(starts, last_rows)
+    )
+
+
+def by_year(dataset: ColumnarDataset) -> Dict[int, ColumnarDataset]:
+    """
+    Split a dataset into one per calendar year
+
+    :param dataset: Daily rows, in any order
+    :returns: The rows of each year there are rows for, in date order
+    """
+    dataset = dataset.sorted_by_date()
+    dates = dataset.column('date')
+    years = {}
+    start = 0
+
+    while start < len(dates):
+        year = date.fromordinal(dates[start]).year
+        end = bisect_left(dates, date(year + 1, 1, 1).toordinal(), start)
+        years[year] = dataset[start:end]
+        start = end
+
+    return years
+
+
+def lttb(dataset: ColumnarDataset, threshold: int, column: str = 'cases') -> ColumnarDataset:
+    """
+    Downsample to at most threshold rows with Largest-Triangle-Three-Buckets
+
+    The first and last rows are always kept. The rows between are split into
+    threshold - 2 buckets, and from each the row making the largest triangle
+    with the row chosen before it and the average of the next bucket is kept.
+    Below 3, there are no buckets and just the ends are kept, as many as fit.
+
+    :param dataset: Rows, in any order
+    :param threshold: Most rows to keep
+    :param column: Column whose shape is kept
+    :returns: Selected rows, in date order
+    """
+    dataset = dataset.sorted_by_date()
+    length = len(dataset)
+    if threshold >= length:
+        return dataset
+    if threshold < 3:
+        return dataset.take([0, length - 1][:max(threshold, 0)])
+
+    xs = dataset.column('date')
+    ys = dataset.column(column)
+    bucket_size = (length - 2) / (threshold - 2)
+
+    selected = [0]
+    a = 0
+
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Average of the next bucket; the last row for the last bucket
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, length)
+        if next_start >= next_end:
+            next_start, next_end = length - 1, length
+        count = next_end - next_start
+        average_x = sum(xs[next_start:next_end]) / count
+        average_y = sum(ys[next_start:next_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            # Twice the triangle's area; only the comparison matters
+            area = abs((ax - average_x) * (ys[i] - ay) - (ax - xs[i]) * (average_y - ay))
+            if area > best_area:
+                best, best_area = i, area
+
+        selected.append(best)
+        a = best
+
+    selected.append(length - 1)
+    return dataset.take(selected)
@@ -2,40 +2,172 @@
 
 import os
 import json
-import boto3
 from extract import Extract
+from caches import DynamoDBValidatorCache
+from snapshots import S3SnapshotStore
+from clients import get_client
 from transform import Transform, InvalidDatasetError, MissingDatasetError
-from loaders import DynamoDBLoader, GVizCollector
+from loaders import DynamoDBLoader, SQLiteLoader, MultiRegionLoader, GVizCollector
+from metrics import Metrics, StdoutSink
 
-def do_etl(dynamo_table, website_bucket, url1, url2):
+# How many times a load cut short by the time limit re-invokes itself in a row
+_MAX_RESUMES = 10
+
+def do_etl(dynamo_table, website_bucket, url1, url2, validator_cache=None, metrics=None,
+           all_regions=False, write_capacity=25, sqlite_path=None, remaining_time_ms=None, snapshot_store=None,
+           incremental_urls=()):
     """
     Performs the ETL
+
+    Extract and transform are streamed, so rows flow one at a time
+    from the downloads into the compact columnar dataset handed to the loader.
+    Rows are read as tuples of just the columns the transform needs.
+    Both downloads run at the same time.
+
+    If a validator cache is given and neither source has changed since
+    the last successful run, transform and load are skipped entirely.
+    The sources in incremental_urls, which must be append-only, are then
+    fetched from just before where the last run finished. Others are
+    downloaded whole, gzip compressed where the server offers it.
+
+    Each stage is timed into metrics. As the downloads are streamed,
+    extract only covers getting the responses going; reading the bodies
+    is part of transform.
+
+    With all_regions, every country in the JH data is loaded into its own
+    partition, concurrently, with batch writes held to what write_capacity
+    can take. Only the US is charted.
+
+    With sqlite_path, records are loaded into that SQLite database
+    instead of the DynamoDB table, e.g. to run at full volume locally.
+
+    With remaining_time_ms, the load stops at a checkpoint when time runs
+    short. What was stored is still published, but the validators are not
+    committed, so the next run downloads again and resumes from the checkpoint.
+
+    With a snapshot store, the bytes of each download are kept there,
+    to replay with Extract.from_snapshots().
+
+    Returns False if the load was cut short, else True.
     """
-    gviz_collector = GVizCollector(website_bucket, 'dataset.js')
-    record_count = DynamoDBLoader(dynamo_table,
-                        Transform(
-                            Extract.from_urls(url1, url2).get_datasets()
-                        ).transform_data(),
-                        gviz_collector
-                ).update_repository()
-
-    print(f'{record_count} new records stored')
-    gviz_collector.write_to_s3()
+    metrics = metrics or Metrics()
+
+    with metrics.stage('extract'):
+        extract = Extract.from_urls(url1, url2, streaming=True, concurrent=True,
+                                    validator_cache=validator_cache, incremental=incremental_urls,
+                                    fast_reader=True, columns=Transform.REQUIRED_FIELDS, snapshot_store=snapshot_store)
+        datasets = extract.get_datasets()
+
+    if extract.sources_unchanged:
+        print('Datasets unchanged since last run')
+        # e.g. a ranged download's new offset, or a fresh ETag for the same bytes
+        extract.commit_validators()
+        return True
+
+    gviz_collector = GVizCollector(website_bucket, 'dataset.js', 'history.json', derived=True, resolutions=True,
+                                   precompressed=True)
+    transform = Transform(datasets)
+
+    with metrics.stage('transform') as stage:
+        if all_regions:
+            regions = transform.transform_regions()
+            stage.rows = sum(len(dataset) for dataset in regions.values())
+        else:
+            transformed = transform.transform_data()
+            stage.rows = len(transformed)
+
+    loader_class, target = (SQLiteLoader, sqlite_path) if sqlite_path else (DynamoDBLoader, dynamo_table)
+
+    if all_regions:
+        loader = MultiRegionLoader(target, regions, {'US': gviz_collector},
+                                   write_capacity=write_capacity, loader_class=loader_class,
+                                   remaining_time_ms=remaining_time_ms)
+    else:
+        loader = loader_class(target,
+                            transformed,
+                            gviz_collector,
+                            remaining_time_ms=remaining_time_ms
+                    )
+
+    with metrics.stage('load') as stage:
+        stage.rows = loader.update_repository()
+        stage.add('ConsumedReadCapacity', loader.read_capacity_units)
+        stage.add('ConsumedWriteCapacity', loader.write_capacity_units)
+        stage.add('NewRows', loader.new_rows)
+        stage.add('ChangedRows', loader.changed_rows)
+        stage.add('UnchangedRows', loader.unchanged_rows)
+
+    join = transform.join
+    if join:
+        print(f'{join.matched_keys} dates merged, {join.left_dropped_keys} JH and {join.right_dropped_keys} NYT dates without a match')
+
+    if all_regions:
+        print(f'{len(regions)} regions loaded, {sum(1 for count in loader.record_counts.values() if count)} with new or revised records')
+    elif loader.write_stats:
+        print(f'Batch write: {json.dumps(loader.write_stats.as_dict())}')
+
+    print(f'{loader.new_rows} new and {loader.changed_rows} revised records stored, {loader.unchanged_rows} unchanged')
+
+    if not loader.complete:
+        print('Load stopped at a checkpoint before running out of time')
+
+    with metrics.stage('publish') as stage:
+        stage.add('ObjectsWritten', gviz_collector.write_to_s3())
+        stage.rows = len(gviz_collector)
     print('BI dataset written to S3')
 
+    if validator_cache and loader.complete:
+        # Only now is it safe to skip these downloads next time
+        extract.commit_validators()
+
+    return loader.complete
 
-def handler(_, __):
+
+def resume(event, context):
+    """
+    Invoke this function again, asynchronously, to carry on a load cut short.
+    Gives up after _MAX_RESUMES in a row, leaving it to the next scheduled run.
+
+    :param event: Event this invocation was given
+    :param context: Lambda context of this invocation
+    """
+    resumes = (event or {}).get('resume', 0)
+
+    if resumes >= _MAX_RESUMES:
+        print(f'Load still incomplete after {resumes} resumes, leaving it to the next run')
+        return
+
+    get_client('lambda').invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps({'resume': resumes + 1})
+    )
+    print(f'Resume {resumes + 1} invoked')
+
+
+def handler(event, context):
     """
     Lambda entry point
     """
     try:
         # Perform ETL
-        do_etl(
+        complete = do_etl(
             os.environ['TABLE'],
             os.environ['WEBSITE_BUCKET'],
             os.environ['JH_DATA_URL'],
-            os.environ['NYT_DATA_URL']
+            os.environ['NYT_DATA_URL'],
+            DynamoDBValidatorCache(os.environ['TABLE']),
+            Metrics(StdoutSink(), trace_memory=os.environ.get('TRACE_MEMORY', '') == '1'),
+            all_regions=os.environ.get('ALL_REGIONS', '').lower() == 'true',
+            write_capacity=int(os.environ.get('TABLE_WRITE_CAPACITY', '25')),
+            remaining_time_ms=context.get_remaining_time_in_millis,
+            snapshot_store=S3SnapshotStore(os.environ['SNAPSHOT_BUCKET']) if os.environ.get('SNAPSHOT_BUCKET') else None,
+            # JH is sorted by country, so only NYT grows at the end
+            incremental_urls=[os.environ['NYT_DATA_URL']]
         )
+
+        if not complete:
+            resume(event, context)
     except Exception as e:
         exception_type = e.__class__.__name__
         exception_message = e.message if hasattr(e, 'message') else str(e)
@@ -55,7 +187,7 @@ def handler(_, __):
                 'An exception was caught in the Covid ETL job',
                 f'Exception Type: {exception_type}',
                 f'Message: {exception_message}'
-                f'Arguments: {",".join(e.args)}'
+                f'Arguments: {",".join(map(str, e.args))}'
             )
         )
 
@@ -67,7 +199,7 @@ def handler(_, __):
         }
 
         try:
-            boto3.client('sns').publish(
+            get_client('sns').publish(
                 TopicArn=os.environ['ERROR_TOPIC_ARN'],
                 Subject='Exception in Covid ETL job',
                 MessageStructure='json',
@@ -1,8 +1,26 @@
+from __future__ import annotations
+
+import io
 import csv
+import gzip
+import queue
 import codecs
-import requests
-from typing import List, Dict
+import hashlib
+import shutil
+import tempfile
+import weakref
+import threading
+from datetime import datetime
+from typing import BinaryIO, List, Dict, Iterable, Iterator, Optional, Tuple, Union
 from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from csvrows import HeaderIndexedRows, read_csv_tuples
+from snapshots import SnapshotStore
+from lazy import lazy_import
+
+requests = lazy_import('requests')
+requests_adapters = lazy_import('requests.adapters')
+urllib3_retry = lazy_import('urllib3.util.retry')
 
 
 class Extract:
@@ -18,10 +36,81 @@ class Extract:
     at read time to save memory, but the conditions of the
     challenge state that filtering must be done in a separate
     transform stage.
+
+    In streaming mode, get_datasets() returns lazy row iterators
+    instead of lists, so that nothing is read until the transform
+    stage asks for it and only one row per source is in flight.
+
+    In concurrent mode, all URLs are downloaded at the same time over
+    one keep-alive session. When also streaming, each download runs on
+    its own thread and hands rows over through a small bounded queue.
+
+    With a validator cache, requests are conditional on the ETag and
+    Last-Modified of the last processed download, and each body is
+    hashed as it arrives. If every source comes back 304 or with the
+    same hash, sources_unchanged is set and no data is returned.
+    New validators are only stored when commit_validators() is called,
+    i.e. once the caller has successfully processed the data.
+
+    Incremental mode is for append-only sources, and is turned on for all
+    the URLs or only those named. It keeps the byte offset,
+    header line and a hash of the last few KB of each download in the
+    validator cache, and next time asks only for the bytes from just before
+    that offset with a Range request. See _download() for the details.
+
+    Fast reader mode skips the per-line work of the default path (requests
+    line splitting, a decoder call per line and a dict per row). Each body is
+    read through one large buffer and a TextIOWrapper, gzip compressed on the
+    wire where the server offers it, and parsed by csv.reader into tuples.
+    Each dataset is then a HeaderIndexedRows, optionally projected down to
+    the given columns, which Transform takes in place of dict rows.
+
+    With a snapshot store, the bytes of every download are kept there
+    before they are parsed, so whatever goes wrong with them can be
+    reproduced. Each body is then downloaded in full before its first row
+    is read. An incremental download is kept as the whole file: the last
+    snapshot up to the range asked for, then the bytes that came back. If
+    there is no snapshot of the last download to build on, the whole file
+    is downloaded instead. from_snapshots() replays them.
     """
 
+    # Marks the end of a prefetched download in its queue
+    _END_OF_DATA = object()
+
+    # How many rows a background download may get ahead of its consumer
+    _PREFETCH_ROWS = 1000
+
+    # HTTP status codes that are worth retrying
+    _RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    # Downloads larger than this are spooled to disk while hashing
+    _SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+    # Size of the chunks read from a response body
+    _CHUNK_BYTES = 64 * 1024
+
+    # In incremental mode, how far before the end of the last download to start the next one
+    _OVERLAP_BYTES = 16 * 1024
+
+    # Read buffer for response bodies in fast reader mode
+    _BUFFER_BYTES = 1024 * 1024
+
     _dataset_urls = None
     _files = None
+    _streaming = False
+    _concurrent = False
+    _timeout = None
+    _retries = 0
+    _session = None
+    _validator_cache = None
+    _validators = None
+    _sources_unchanged = False
+    _incremental = frozenset()
+    _fast_reader = False
+    _columns = None
+    _snapshot_store = None
+    _snapshots = None
+    _snapshot_bodies = None
 
     def __init__(self, **kwargs):
         """
@@ -33,60 +122,580 @@ class Extract:
         """
         self._dataset_urls = kwargs.get('Urls', None)
         self._files = kwargs.get('Files', None)
+        self._streaming = kwargs.get('Streaming', False)
+        self._concurrent = kwargs.get('Concurrent', False)
+        self._timeout = kwargs.get('Timeout', None)
+        self._retries = kwargs.get('Retries', 0)
+        self._session = kwargs.get('Session', None)
+        self._validator_cache = kwargs.get('ValidatorCache', None)
+        incremental = kwargs.get('Incremental', False)
+        if incremental is True:
+            incremental = self._dataset_urls or ()
+        self._incremental = frozenset(incremental or ())
+        self._fast_reader = kwargs.get('FastReader', False)
+        self._columns = kwargs.get('Columns', None)
+        self._snapshot_store = kwargs.get('SnapshotStore', None)
+        self._snapshots = kwargs.get('Snapshots', None)
+        self._validators = {}
+        self._snapshot_bodies = {}
 
     @classmethod
-    def from_urls(cls, *dataset_urls):
+    def from_urls(cls, *dataset_urls, streaming: bool = False, concurrent: bool = False,
+                  timeout: float = 30, retries: int = 2, session: requests.Session = None,
+                  validator_cache=None, incremental: Union[bool, Iterable[str]] = False, fast_reader: bool = False,
+                  columns: Iterable[str] = None, snapshot_store: SnapshotStore = None):
         """
         Class initializer that sets up to read the data from URLs
 
         :param urls: List of URLs to read data from
+        :param streaming: If set, return lazy row iterators rather than lists
+        :param concurrent: If set, download all URLs in parallel
+        :param timeout: Connect and read timeout in seconds for each request
+        :param retries: Number of times to retry a failed connection or 5xx/429 response
+        :param session: Session to use. If not given, one is created with a connection pool per host
+        :param validator_cache: ValidatorCache to make requests conditional on the last processed download
+        :param incremental: If set, fetch only what was appended since the last processed download,
+                            of every URL, or of those given, which must be among the URLs.
+                            Needs a validator cache to keep track.
+        :param fast_reader: If set, read each dataset as header-indexed tuples rather than dicts
+        :param columns: In fast reader mode, the only columns to keep, e.g. Transform.REQUIRED_FIELDS
+        :param snapshot_store: SnapshotStore to keep the bytes of each download in
         """
-        return cls(Urls=dataset_urls)
+        if incremental and not validator_cache:
+            raise ValueError('Incremental extract needs a validator cache to hold its state')
+        if incremental is not True and set(incremental or ()) - set(dataset_urls):
+            raise ValueError('Incremental extract of a URL not being extracted')
+
+        return cls(Urls=dataset_urls, Streaming=streaming, Concurrent=concurrent,
+                   Timeout=timeout, Retries=retries, Session=session, ValidatorCache=validator_cache,
+                   Incremental=incremental, FastReader=fast_reader, Columns=columns, SnapshotStore=snapshot_store)
 
 
     @classmethod
-    def from_files(cls, *files):
+    def from_files(cls, *files, streaming: bool = False, fast_reader: bool = False, columns: Iterable[str] = None):
         """
         Class initializer that sets up to read the data from CSV files
 
         :param files: List of files to read data from
+        :param streaming: If set, return lazy row iterators rather than lists
+        :param fast_reader: If set, read each dataset as header-indexed tuples rather than dicts
+        :param columns: In fast reader mode, the only columns to keep
         """
-        return cls(Files=files)
+        return cls(Files=files, Streaming=streaming, FastReader=fast_reader, Columns=columns)
 
 
-    def _read_csv_from_url(self, url: str) -> List[dict]:
+    @classmethod
+    def from_snapshots(cls, snapshot_store: SnapshotStore, *dataset_urls, at: datetime = None,
+                       streaming: bool = False, fast_reader: bool = False, columns: Iterable[str] = None):
         """
-        Reads CSV from given URL
+        Class initializer that sets up to replay downloads kept in a snapshot store
+
+        :param snapshot_store: Store the downloads were kept in
+        :param dataset_urls: URLs the downloads were of
+        :param at: Replay the last downloads at or before this time. The latest if not given.
+        :param streaming: If set, return lazy row iterators rather than lists
+        :param fast_reader: If set, read each dataset as header-indexed tuples rather than dicts
+        :param columns: In fast reader mode, the only columns to keep
+        :raises ValueError: if a URL has no snapshot, or the one to replay is of part of the file
+        """
+        snapshots = []
+        for url in dataset_urls:
+            snapshot = snapshot_store.latest(url, at)
+            if snapshot is None:
+                raise ValueError(f'No snapshot of {url}' + (f' at or before {at}' if at else ''))
+            if snapshot.get('partial', False):
+                raise ValueError(f'Snapshot of {url} fetched at {snapshot["fetched_at"]} is of an incremental download')
+            snapshots.append(snapshot)
+
+        return cls(SnapshotStore=snapshot_store, Snapshots=snapshots, Streaming=streaming,
+                   FastReader=fast_reader, Columns=columns)
+
+
+    def _get_session(self) -> requests.Session:
+        """
+        Get the HTTP session, creating it on first use.
+        Connections are kept alive and pooled per host, sized so that
+        every URL can have its own connection when downloading concurrently.
+        """
+        if not self._session:
+            pool_size = max(len(self._dataset_urls or ()), 1)
+            adapter = requests_adapters.HTTPAdapter(
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+                max_retries=urllib3_retry.Retry(
+                    total=self._retries,
+                    backoff_factor=0.5,
+                    status_forcelist=self._RETRY_STATUSES,
+                    raise_on_status=False
+                )
+            )
+            self._session = requests.Session()
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+
+        return self._session
+
+
+    def _iter_csv_from_url(self, url: str) -> Iterator[dict]:
+        """
+        Generator that yields CSV rows from given URL.
+        The request is not made until the first row is asked for,
+        and the connection is released when the generator is exhausted or discarded.
 
         :param url: URL to pull the data from
         """
-        with closing(requests.get(url, stream=True)) as f:
+        with closing(self._get_session().get(url, stream=True, timeout=self._timeout)) as f:
+            f.raise_for_status()
             reader = csv.DictReader(codecs.iterdecode(
                 f.iter_lines(), f.encoding), delimiter=",", skipinitialspace=1)
-            return list(reader)
+            yield from reader
 
 
-    def _read_csv_from_file(self, file_path: str) -> List[dict]:
+    def _iter_tuples_from_url(self, url: str) -> Iterator[tuple]:
         """
-        Reads CSV from given file
+        Generator that yields the header then the rows of the CSV at given URL, as tuples.
+        The body is decompressed and decoded as it streams through one large buffer,
+        rather than a line at a time.
+
+        :param url: URL to pull the data from
+        """
+        headers = {'Accept-Encoding': 'gzip'}
+
+        with closing(self._get_session().get(url, stream=True, timeout=self._timeout, headers=headers)) as f:
+            f.raise_for_status()
+            # Read the bytes as sent, as urllib3 1.x can't decode into a fixed size buffer.
+            # Left open at the end of the body, as readers look past it; closing() sees to it.
+            f.raw.decode_content = False
+            f.raw.auto_close = False
+            body = io.BufferedReader(f.raw, self._BUFFER_BYTES)
+            if f.headers.get('Content-Encoding', '').lower() == 'gzip':
+                body = gzip.GzipFile(fileobj=body, mode='rb')
+            # No charset (e.g. application/octet-stream) leaves encoding None
+            text = io.TextIOWrapper(body, encoding=f.encoding or 'utf-8', newline='')
+            rows = read_csv_tuples(text, self._columns)
+            yield rows.fieldnames
+            yield from rows
+
+
+    def _iter_csv_from_file(self, file_path: str) -> Iterator[dict]:
+        """
+        Generator that yields CSV rows from given file
 
         :param file_path: Path to file to pull the data from
         """
         with open(file_path, 'r') as f:
             reader = csv.DictReader(f, delimiter=",", skipinitialspace=1, strict=1)
-            return list(reader)
+            yield from reader
+
+
+    def _iter_tuples_from_file(self, file_path: str) -> Iterator[tuple]:
+        """
+        Generator that yields the header then the rows of given CSV file, as tuples
+
+        :param file_path: Path to file to pull the data from
+        """
+        with open(file_path, 'r', newline='', buffering=self._BUFFER_BYTES) as f:
+            rows = read_csv_tuples(f, self._columns)
+            yield rows.fieldnames
+            yield from rows
+
+
+    def _iter_snapshotted_rows_from_url(self, url: str) -> Iterator[Union[dict, tuple]]:
+        """
+        Generator that downloads given URL in full, keeps it in the snapshot store,
+        then yields its rows as the reader mode has them
+
+        :param url: URL to pull the data from
+        """
+        with closing(self._get_session().get(url, stream=True, timeout=self._timeout)) as f:
+            f.raise_for_status()
+            spool, _, _ = self._spool_response(f)
+            encoding = f.encoding
+
+        self._snapshot_store.put(url, spool, encoding)
+        yield from self._iter_csv_from_spool(spool, encoding)
+
+
+    def _iter_rows_from_url(self, url: str) -> Iterator[Union[dict, tuple]]:
+        """
+        Rows from given URL as the reader mode has them
+        """
+        if self._snapshot_store:
+            return self._iter_snapshotted_rows_from_url(url)
+        return self._iter_tuples_from_url(url) if self._fast_reader else self._iter_csv_from_url(url)
+
+
+    def _iter_rows_from_file(self, file_path: str) -> Iterator[Union[dict, tuple]]:
+        """
+        Rows from given file as the reader mode has them
+        """
+        return self._iter_tuples_from_file(file_path) if self._fast_reader else self._iter_csv_from_file(file_path)
+
+
+    def _rows(self, rows: Iterable[Union[dict, tuple]]) -> Union[List[dict], Iterator[dict], HeaderIndexedRows]:
+        """
+        Shape rows for get_datasets(): a list, or left lazy when streaming.
+        In fast reader mode, the first of the rows is the header and the result is a HeaderIndexedRows.
+        """
+        if not self._streaming and not isinstance(rows, list):
+            rows = list(rows)
+        return HeaderIndexedRows(rows) if self._fast_reader else rows
+
+
+    def _iter_prefetched_csv_from_url(self, url: str, executor: ThreadPoolExecutor) -> Iterator[dict]:
+        """
+        Start downloading from given URL on a background thread now,
+        and return a generator that yields the rows as they arrive.
+
+        The queue between the two is bounded, so a download can only get a little
+        ahead of its consumer. If the consumer goes away early, the download is stopped.
+
+        :param url: URL to pull the data from
+        :param executor: Thread pool to run the download on
+        """
+        rows = queue.Queue(maxsize=self._PREFETCH_ROWS)
+        stopped = threading.Event()
+
+        def put(item) -> bool:
+            # Block while the queue is full, but give up if the consumer has gone
+            while not stopped.is_set():
+                try:
+                    rows.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def download():
+            try:
+                for row in self._iter_rows_from_url(url):
+                    if not put(row):
+                        return
+            except Exception as e:
+                # Hand the failure over to be raised on the consuming side
+                put(e)
+            put(self._END_OF_DATA)
+
+        executor.submit(download)
+
+        def consume() -> Iterator[dict]:
+            try:
+                while True:
+                    item = rows.get()
+                    if item is self._END_OF_DATA:
+                        return
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                stopped.set()
+
+        # A generator that is never started doesn't run its finally block
+        consumer = consume()
+        weakref.finalize(consumer, stopped.set)
+        return consumer
+
+
+    def _spool_response(self, response: requests.Response) -> Tuple[tempfile.SpooledTemporaryFile, str, int]:
+        """
+        Copy a response body into a spool, hashing it as it arrives
+
+        :param response: Streamed response to read
+        :returns: The rewound spool, the SHA-256 hex digest of the body and its length
+        """
+        digest = hashlib.sha256()
+        spool = tempfile.SpooledTemporaryFile(max_size=self._SPOOL_MAX_BYTES)
+        size = 0
+
+        for chunk in response.iter_content(chunk_size=self._CHUNK_BYTES):
+            digest.update(chunk)
+            spool.write(chunk)
+            size += len(chunk)
+
+        spool.seek(0)
+        return spool, digest.hexdigest(), size
+
+
+    def _read_tail(self, spool: tempfile.SpooledTemporaryFile, size: int) -> bytes:
+        """
+        Read the last _OVERLAP_BYTES of a spool, leaving it rewound
+        """
+        spool.seek(max(size - self._OVERLAP_BYTES, 0))
+        tail = spool.read()
+        spool.seek(0)
+        return tail
+
+
+    def _previous_snapshot(self, url: str, offset: int, tail_sha256: str) -> Optional[dict]:
+        """
+        The last snapshot of a URL, if it is of the download an incremental one carries on from
+
+        :param url: URL the snapshot is of
+        :param offset: Size of the last download
+        :param tail_sha256: Hash of its last _OVERLAP_BYTES
+        :returns: The index entry, or None if there's no such snapshot
+        """
+        entry = self._snapshot_store.latest(url)
+        if entry is None or entry.get('partial', False) or entry['size'] != offset:
+            return None
+
+        with self._snapshot_store.open(entry['sha256']) as f:
+            f.seek(max(offset - self._OVERLAP_BYTES, 0))
+            return entry if hashlib.sha256(f.read()).hexdigest() == tail_sha256 else None
+
+
+    def _complete_snapshot(self, previous: dict, range_start: int, spool: tempfile.SpooledTemporaryFile) -> tempfile.SpooledTemporaryFile:
+        """
+        The whole file an incremental download is the end of: the previous snapshot
+        up to where the range started, then the bytes downloaded. The spool is left rewound.
+
+        :param previous: Index entry of the snapshot the download carries on from
+        :param range_start: Offset the range started at
+        :param spool: The ranged download
+        :returns: The rewound file
+        """
+        whole = tempfile.SpooledTemporaryFile(max_size=self._SPOOL_MAX_BYTES)
+
+        with self._snapshot_store.open(previous['sha256']) as f:
+            remaining = range_start
+            while remaining:
+                chunk = f.read(min(remaining, self._BUFFER_BYTES))
+                whole.write(chunk)
+                remaining -= len(chunk)
+
+        spool.seek(0)
+        shutil.copyfileobj(spool, whole, self._BUFFER_BYTES)
+        spool.seek(0)
+        whole.seek(0)
+        return whole
+
+
+    def _download(self, url: str, conditional: bool, ranged: bool = True) -> Optional[tempfile.SpooledTemporaryFile]:
+        """
+        Download the body of given URL into a spool, and record its validators to be committed later.
+
+        For an incremental URL, if a previous download's state is cached, only the bytes from
+        _OVERLAP_BYTES before the previous end are requested. The overlap is checked against the
+        hash stored last time; if it differs, the file shrank, or the server ignored the range,
+        the whole file is used instead. The returned spool then holds the remembered header line
+        followed by the complete lines in the overlap and everything after it. Re-reading
+        the overlap means rows that could not be merged last time (e.g. one source was
+        a day behind the other) are seen again; rows already loaded are filtered by the loader.
+
+        :param url: URL to pull the data from
+        :param conditional: If set, send the cached validators and treat an identical body as unchanged
+        :param ranged: If set, allow a range request in incremental mode
+        :returns: The rewound spool, or None if the content is unchanged since it was last processed
+        """
+        cached = self._validator_cache.get(url)
+        headers = {}
+
+        if conditional and cached.get('etag', None):
+            headers['If-None-Match'] = cached['etag']
+        if conditional and cached.get('last_modified', None):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        offset = cached.get('offset', 0)
+        range_start = offset - self._OVERLAP_BYTES
+        incremental = url in self._incremental
+        ranged = ranged and incremental and range_start > 0 and 'header' in cached
+        previous = None
+
+        if ranged and self._snapshot_store:
+            # Snapshots are of whole files, so the range is only any use if the last one can be completed with it
+            previous = self._previous_snapshot(url, offset, cached['tail_sha256'])
+            ranged = previous is not None
+
+        if incremental:
+            # Byte offsets must be of the file itself, not a compressed rendition of it
+            headers['Accept-Encoding'] = 'identity'
+        if ranged:
+            headers['Range'] = f'bytes={range_start}-'
+
+        with closing(self._get_session().get(url, stream=True, timeout=self._timeout, headers=headers)) as f:
+            if f.status_code == requests.codes.not_modified:
+                return None
+
+            if ranged and f.status_code == requests.codes.requested_range_not_satisfiable:
+                # File is now shorter than the overlap start
+                return self._download(url, conditional, ranged=False)
+
+            f.raise_for_status()
+            spool, sha256, size = self._spool_response(f)
+            encoding = f.encoding
+            validators = {
+                'etag': f.headers.get('ETag', None),
+                'last_modified': f.headers.get('Last-Modified', None),
+                'sha256': sha256,
+                'encoding': encoding
+            }
+            content_range = f.headers.get('Content-Range', '') if f.status_code == requests.codes.partial_content else ''
+
+        if content_range:
+            total = content_range.rpartition('/')[2]
+            overlap = spool.read(self._OVERLAP_BYTES)
+
+            if (total != '*' and int(total) < offset) or hashlib.sha256(overlap).hexdigest() != cached['tail_sha256']:
+                # Rewritten since last time
+                spool.close()
+                return self._download(url, conditional, ranged=False)
+
+            new_bytes = size - len(overlap)
+            validators['sha256'] = cached.get('sha256', None) if new_bytes == 0 else None
+            validators['offset'] = range_start + size
+            validators['header'] = cached['header']
+            validators['tail_sha256'] = hashlib.sha256(self._read_tail(spool, size)).hexdigest()
+            self._validators[url] = validators
+
+            if conditional and new_bytes == 0:
+                spool.close()
+                return None
+
+            if previous:
+                self._snapshot_bodies[url] = self._complete_snapshot(previous, range_start, spool)
+
+            # Rebuild as a CSV document: remembered header, then whole lines from the overlap onwards
+            tail = tempfile.SpooledTemporaryFile(max_size=self._SPOOL_MAX_BYTES)
+            tail.write(cached['header'].encode(encoding or 'utf-8'))
+            line_end = overlap.find(b'\n')
+            tail.write(overlap[line_end + 1:] if line_end >= 0 else b'')
+            spool.seek(len(overlap))
+            shutil.copyfileobj(spool, tail)
+            spool.close()
+            tail.seek(0)
+            return tail
+
+        if incremental:
+            validators['offset'] = size
+            validators['header'] = spool.readline().decode(encoding or 'utf-8')
+            validators['tail_sha256'] = hashlib.sha256(self._read_tail(spool, size)).hexdigest()
+
+        self._validators[url] = validators
+
+        if conditional and sha256 == cached.get('sha256', None):
+            spool.close()
+            return None
+
+        return spool
+
+
+    def _iter_csv_from_spool(self, spool: Union[tempfile.SpooledTemporaryFile, BinaryIO], encoding: str) -> Iterator[Union[dict, tuple]]:
+        """
+        Generator that yields CSV rows from a downloaded body, closing it when done.
+        In fast reader mode, the header then the rows, as tuples.
+
+        :param spool: Downloaded body, or a snapshot of one
+        :param encoding: Text encoding of the body
+        """
+        with spool:
+            if self._fast_reader:
+                # SpooledTemporaryFile is only a complete io object from Python 3.11. The file it wraps always is.
+                body = getattr(spool, '_file', spool)
+                rows = read_csv_tuples(io.TextIOWrapper(body, encoding=encoding or 'utf-8', newline=''), self._columns)
+                yield rows.fieldnames
+                yield from rows
+                return
+            reader = csv.DictReader(codecs.iterdecode(spool, encoding or 'utf-8'), delimiter=",", skipinitialspace=1)
+            yield from reader
+
+
+    def _get_validated_datasets(self) -> list:
+        """
+        Conditionally download all URLs. If any has changed, every dataset
+        is needed, so those that were not modified are downloaded again in full.
+        """
+        def map_urls(func, urls):
+            if self._concurrent and urls:
+                with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+                    return list(executor.map(func, urls))
+            return [func(url) for url in urls]
+
+        spools = map_urls(lambda url: self._download(url, True), self._dataset_urls)
+        self._sources_unchanged = all(spool is None for spool in spools)
+
+        if self._sources_unchanged:
+            return [[] for _ in spools]
+
+        refetch = [url for url, spool in zip(self._dataset_urls, spools) if spool is None]
+        refetched = dict(zip(refetch, map_urls(lambda url: self._download(url, False), refetch)))
+        datasets = []
+
+        for url, spool in zip(self._dataset_urls, spools):
+            if self._snapshot_store:
+                # For an incremental download, the whole file it completes
+                whole = self._snapshot_bodies.pop(url, None)
+                self._snapshot_store.put(url, whole or spool or refetched[url], self._validators[url]['encoding'])
+                if whole:
+                    whole.close()
+            datasets.append(self._rows(self._iter_csv_from_spool(spool or refetched[url], self._validators[url]['encoding'])))
+
+        return datasets
+
+
+    @property
+    def sources_unchanged(self) -> bool:
+        """
+        True if get_datasets() found that no source has changed since validators were last committed
+        """
+        return self._sources_unchanged
+
+
+    def commit_validators(self) -> None:
+        """
+        Store the validators of the downloads made by get_datasets() in the validator cache.
+        Call this once the data has been successfully processed.
+        """
+        for url, validators in self._validators.items():
+            self._validator_cache.put(url, validators)
+
+
+    def _read_csv_from_url(self, url: str) -> List[Union[dict, tuple]]:
+        """
+        Reads CSV from given URL
+
+        :param url: URL to pull the data from
+        """
+        return list(self._iter_rows_from_url(url))
+
+
+    def _read_csv_from_file(self, file_path: str) -> List[Union[dict, tuple]]:
+        """
+        Reads CSV from given file
+
+        :param file_path: Path to file to pull the data from
+        """
+        return list(self._iter_rows_from_file(file_path))
 
 
     def get_datasets(self) -> list:
         """
         Read all CSV datasets passed to one of the class initializers
+
+        :returns: List with one entry per source; a list of rows,
+                  or a row iterator when in streaming mode.
+                  A HeaderIndexedRows in fast reader mode, either way.
         """
 
-        if self._dataset_urls:
-            return [self._read_csv_from_url(url) for url in self._dataset_urls]
+        if self._snapshots:
+            return [self._rows(self._iter_csv_from_spool(self._snapshot_store.open(snapshot['sha256']), snapshot['encoding']))
+                    for snapshot in self._snapshots]
+        elif self._dataset_urls and self._validator_cache:
+            return self._get_validated_datasets()
+        elif self._dataset_urls and self._concurrent:
+            executor = ThreadPoolExecutor(max_workers=len(self._dataset_urls))
+            try:
+                if self._streaming:
+                    return [self._rows(self._iter_prefetched_csv_from_url(url, executor)) for url in self._dataset_urls]
+                return [self._rows(rows) for rows in executor.map(self._read_csv_from_url, self._dataset_urls)]
+            finally:
+                # Don't wait here; streamed downloads finish as their rows are consumed
+                executor.shutdown(wait=False)
+        elif self._dataset_urls:
+            read = self._iter_rows_from_url if self._streaming else self._read_csv_from_url
+            return [self._rows(read(url)) for url in self._dataset_urls]
         elif self._files:
-            return [self._read_csv_from_file(file_path) for file_path in self._files]
-            pass
+            read = self._iter_rows_from_file if self._streaming else self._read_csv_from_file
+            return [self._rows(read(file_path)) for file_path in self._files]
         else:
             raise RuntimeError("Class not pproperly initialized")
 
@@ -0,0 +1,115 @@
+"""
+Per-row fingerprints of what a repository partition holds
+
+The sources revise past days, so comparing dates against a watermark misses
+changes. Instead the loader keeps a fingerprint of each stored row's figures,
+compares every incoming row against it and writes only the rows that are new
+or different. A fingerprint is a CRC-32 of the row's counts: four bytes a row,
+stored compressed as a single value, and read back in one call.
+"""
+import zlib
+import struct
+from itertools import accumulate
+from typing import Dict, Tuple
+from columnar import ColumnarDataset
+
+_COUNTS = struct.Struct('<qqq')
+_HEADER = struct.Struct('<I')
+
+
+def fingerprint(cases: int, deaths: int, recovered: int) -> int:
+    """
+    Fingerprint of a row's figures
+    """
+    return zlib.crc32(_COUNTS.pack(cases, deaths, recovered))
+
+
+class Fingerprints:
+    """
+    Fingerprint of each row of a partition, by date
+    """
+
+    def __init__(self, fingerprints: Dict[int, int] = None):
+        """
+        :param fingerprints: Fingerprint of each row, by date ordinal
+        """
+        self._fingerprints = fingerprints or {}
+
+
+    @classmethod
+    def of(cls, dataset: ColumnarDataset) -> 'Fingerprints':
+        """
+        Fingerprints of every row of a dataset
+        """
+        fingerprints = cls()
+        fingerprints.update(dataset)
+        return fingerprints
+
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+
+    def __contains__(self, ordinal: int) -> bool:
+        return ordinal in self._fingerprints
+
+
+    def update(self, dataset: ColumnarDataset) -> None:
+        """
+        Take the fingerprints of rows that have been stored, replacing any of the same dates
+        """
+        self._fingerprints.update(zip(
+            dataset.column('date'),
+            map(fingerprint, dataset.column('cases'), dataset.column('deaths'), dataset.column('recovered'))
+        ))
+
+
+    def diff(self, dataset: ColumnarDataset) -> Tuple[ColumnarDataset, int, int, int]:
+        """
+        Compare a dataset with the stored rows, in one pass
+
+        :param dataset: Incoming rows
+        :returns: The rows that are new or changed, in the dataset's order,
+                  and the numbers of new, changed and unchanged rows
+        """
+        stored = self._fingerprints
+        indices = []
+        new = changed = 0
+
+        for i, (ordinal, cases, deaths, recovered) in enumerate(zip(
+                dataset.column('date'), dataset.column('cases'), dataset.column('deaths'), dataset.column('recovered'))):
+            previous = stored.get(ordinal, None)
+            if previous is None:
+                new += 1
+                indices.append(i)
+            elif previous != fingerprint(cases, deaths, recovered):
+                changed += 1
+                indices.append(i)
+
+        return dataset.take(indices), new, changed, len(dataset) - new - changed
+
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize, compressed. Dates go as differences from the one before,
+        which for a daily series are all ones and take next to no space.
+        """
+        ordinals = sorted(self._fingerprints)
+        deltas = [b - a for a, b in zip([0] + ordinals, ordinals)]
+        count = len(ordinals)
+        return zlib.compress(
+            _HEADER.pack(count) +
+            struct.pack(f'<{count}i{count}I', *deltas, *(self._fingerprints[ordinal] for ordinal in ordinals))
+        )
+
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Fingerprints':
+        """
+        Deserialize from the output of to_bytes()
+        """
+        data = zlib.decompress(data)
+        count, = _HEADER.unpack_from(data)
+        values = struct.unpack_from(f'<{count}i{count}I', data, _HEADER.size)
+
+        return cls(dict(zip(accumulate(values[:count]), values[count:])))
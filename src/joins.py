@@ -0,0 +1,134 @@
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+
+class Join:
+    """
+    Joins two streams of rows on a key.
+
+    Two strategies, both linear and single pass over each input:
+
+    - merge() is a sort-merge join for inputs already in ascending key order.
+      It holds the current left row and the right rows sharing its key.
+    - hash() builds a table of the right input and streams the left one past it.
+      Use it when the inputs are not sorted; the right input should be the smaller.
+
+    Joined rows come out as (left_row, right_row) pairs. In a left join,
+    right_row is None for left rows that have no match.
+
+    After a join has run to completion, the counts of matched
+    and dropped keys on each side are available as attributes.
+    """
+
+    INNER = 'inner'
+    LEFT = 'left'
+
+    def __init__(self, left_key: Callable, right_key: Callable, how: str = INNER, names: Tuple[str, str] = ('left', 'right')):
+        """
+        Constructor
+
+        :param left_key: Function returning the join key of a left row
+        :param right_key: Function returning the join key of a right row
+        :param how: Join.INNER or Join.LEFT
+        :param names: Names of the inputs, used in error messages
+        """
+        if how not in (self.INNER, self.LEFT):
+            raise ValueError(f'Unsupported join type: {how}')
+
+        self._left_key = left_key
+        self._right_key = right_key
+        self._how = how
+        self._names = names
+        self.matched_keys = 0
+        self.left_dropped_keys = 0
+        self.right_dropped_keys = 0
+
+
+    def _ordered(self, rows: Iterable, key: Callable, name: str) -> Iterator[Tuple[object, object]]:
+        """
+        Generator of (key, row) pairs, raising ValueError if keys go backwards
+        """
+        last_key = None
+        for row in rows:
+            row_key = key(row)
+            if last_key is not None and row_key < last_key:
+                raise ValueError(f'{name} data is not in key order at {row_key}')
+            last_key = row_key
+            yield row_key, row
+
+
+    def merge(self, left: Iterable, right: Iterable) -> Iterator[Tuple[object, Optional[object]]]:
+        """
+        Sort-merge join of two inputs in ascending key order.
+        Both inputs are read to the end, even when the other runs out first,
+        so problems anywhere in either are always reported.
+
+        :raises ValueError: If either input is out of order
+        """
+        left_rows = self._ordered(left, self._left_key, self._names[0])
+        right_rows = self._ordered(right, self._right_key, self._names[1])
+        left_key, left_row = next(left_rows, (None, None))
+        right_key, right_row = next(right_rows, (None, None))
+
+        while left_row is not None:
+            # Skip right rows with keys the left doesn't have
+            while right_row is not None and right_key < left_key:
+                self.right_dropped_keys += 1
+                group_key = right_key
+                while right_row is not None and right_key == group_key:
+                    right_key, right_row = next(right_rows, (None, None))
+
+            # Gather the right rows for this key
+            group = []
+            while right_row is not None and right_key == left_key:
+                group.append(right_row)
+                right_key, right_row = next(right_rows, (None, None))
+
+            if group:
+                self.matched_keys += 1
+            else:
+                self.left_dropped_keys += 1
+
+            # Emit every left row with this key against the group
+            group_key = left_key
+            while left_row is not None and left_key == group_key:
+                if group:
+                    for match in group:
+                        yield left_row, match
+                elif self._how == self.LEFT:
+                    yield left_row, None
+                left_key, left_row = next(left_rows, (None, None))
+
+        # Whatever is left on the right has no match
+        while right_row is not None:
+            self.right_dropped_keys += 1
+            group_key = right_key
+            while right_row is not None and right_key == group_key:
+                right_key, right_row = next(right_rows, (None, None))
+
+
+    def hash(self, left: Iterable, right: Iterable) -> Iterator[Tuple[object, Optional[object]]]:
+        """
+        Hash join of two inputs in any order. Output follows the order of the left input.
+        """
+        table = {}
+        for row in right:
+            table.setdefault(self._right_key(row), []).append(row)
+
+        matched = set()
+        dropped = set()
+
+        for row in left:
+            row_key = self._left_key(row)
+            group = table.get(row_key, None)
+            if group:
+                matched.add(row_key)
+                for match in group:
+                    yield row, match
+            else:
+                dropped.add(row_key)
+                if self._how == self.LEFT:
+                    yield row, None
+
+        self.matched_keys = len(matched)
+        self.left_dropped_keys = len(dropped)
+        self.right_dropped_keys = len(table) - len(matched)
@@ -0,0 +1,48 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Stands in for a module that is only imported when one of
+    its attributes is first used.
+
+    boto3 and requests account for most of the import time of the ETL,
+    and a cold start pays for all of it before the handler even runs.
+    Deferring them means each is only loaded once a stage needs it.
+
+    Modules using these should have `from __future__ import annotations`
+    so that type hints naming lazy attributes don't trigger the import.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+
+    def __getattr__(self, attribute: str):
+        # Only called for attributes not found on the proxy itself
+        return getattr(self._load(), attribute)
+
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Get a proxy for a module that imports it on first use
+
+    :param name: Full module name, e.g. 'boto3.dynamodb.conditions'
+    """
+    return LazyModule(name)
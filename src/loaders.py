@@ -1,160 +1,722 @@
-import boto3
-import gviz_api
+from __future__ import annotations
 
-from datetime import datetime, date
-from boto3.dynamodb.conditions import Key
-from typing import List, Dict
+import time
+import zlib
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Callable, List, Dict, Iterable, Tuple, Union, Optional
+from columnar import ColumnarDataset
+from fingerprints import Fingerprints
+from dates import parse_iso_date
+from batch_writer import DynamoDBBatchWriter
+from datatable import render_datatable
+from derived import DerivedSeries, MonthlyTotals, MeasuresByDate
+from downsample import rollup, lttb, by_year
+from clients import get_resource
+from publish import ContentAddressedPublisher
+from metrics import capacity_units
+from lazy import lazy_import
+
+conditions = lazy_import('boto3.dynamodb.conditions')
+sqlite3 = lazy_import('sqlite3')
+botocore_exceptions = lazy_import('botocore.exceptions')
 
 class GVizCollector:
     """
     Builds a Google Visualization datatable from the dataset
+
+    If given a history key, the collected rows are also kept as a compact
+    JSON object in the bucket. Next run, the loader can take the history
+    from there instead of re-reading the whole table.
+
+    Collected rows belong to the instance, so each run starts empty
+    however many warm invocations the container has served.
+    The number of rows is capped so a runaway load can't exhaust memory.
+
+    With derived set, the tables the page would otherwise work out on every
+    view are written next to the script as DataTable JSON: the daily figures
+    and rolling means of DerivedSeries (dataset-derived.json), MonthlyTotals
+    for the column chart (dataset-monthly-totals.json) and MeasuresByDate
+    for the pie chart (dataset-pie.json).
+
+    With resolutions set, weekly and monthly rollups, an LTTB series of
+    at most max_points rows and the daily rows of each year are written next
+    to the script as DataTable JSON (dataset-weekly.json, dataset-daily-2020.json
+    etc.), each cacheable on its own. The page draws the whole history from the
+    LTTB series, and fetches whichever suits a narrower range, so what it
+    downloads stays bounded however long the history gets.
+
+    With precompressed set, everything is published through a
+    ContentAddressedPublisher: gzip (and brotli, where available) variants
+    under content-hashed keys, listed in a manifest (dataset-manifest.json),
+    and nothing is uploaded that hasn't changed since the last run.
+    The history is kept under its own key, as the loader reads it back.
     """
-    _column_definitions = {
-        'date': ('date', 'Date'),
-        'cases': ('number', 'Cases'),
-        'deaths': ('number', 'Deaths'),
-        'recovered': ('number', 'Recovered')
-    }
-    _dataset = []
+    # (id, type, label) in output order
+    _column_definitions = [
+        ('date', 'date', 'Date'),
+        ('cases', 'number', 'Cases'),
+        ('deaths', 'number', 'Deaths'),
+        ('recovered', 'number', 'Recovered')
+    ]
+
+    # Over 270 years of daily rows
+    _DEFAULT_MAX_ROWS = 100_000
+
+    # Enough for a full width chart
+    _DEFAULT_MAX_POINTS = 500
+
+    # Lower resolution and derived tables change once a day at most
+    _RESOLUTION_CACHE_CONTROL = 'public, max-age=3600'
 
 
-    def __init__(self, bucket_name, key):
+    def __init__(self, bucket_name, key, history_key=None, max_rows=_DEFAULT_MAX_ROWS, derived=False,
+                 resolutions=False, max_points=_DEFAULT_MAX_POINTS, precompressed=False):
         self._bucket_name = bucket_name
         self._key = key
+        self._history_key = history_key
+        self._max_rows = max_rows
+        self._derived = derived
+        self._resolutions = resolutions
+        self._max_points = max_points
+        self._precompressed = precompressed
+        self._dataset = ColumnarDataset()
+
+
+    def load_history(self, last_date: date) -> bool:
+        """
+        Load the rows stored by the last write_to_s3(),
+        but only if they run up to the given date.
+
+        :param last_date: Date of the last row in the repository
+        :returns: True if the history was loaded
+        """
+        if not self._history_key:
+            return False
+
+        try:
+            body = get_resource('s3').Object(self._bucket_name, self._history_key).get()['Body'].read()
+        except botocore_exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return False
+            raise
+
+        history = ColumnarDataset.from_json(body)
+        if history.last_date() != last_date:
+            # Out of step with the repository
+            return False
+        if len(history) > self._max_rows:
+            raise ValueError(f'Stored gviz history of {len(history)} rows is over the limit of {self._max_rows}.')
+
+        self._dataset = history
+        return True
 
 
     def add_rows(self, rows: any) -> None:
         if not rows:
             return
-        if isinstance(rows, dict):
-            self._dataset.append(rows)
+        if isinstance(rows, ColumnarDataset):
+            pass
+        elif isinstance(rows, dict):
+            rows = ColumnarDataset.from_rows([rows])
         elif isinstance(rows, list):
-            self._dataset.extend(rows)
+            rows = ColumnarDataset.from_rows(rows)
         else:
             raise ValueError(f'Cannot add value of type {type(rows)} to gviz dataset.')
 
+        if len(self._dataset) + len(rows) > self._max_rows:
+            raise ValueError(f'Cannot add {len(rows)} rows to gviz dataset of {len(self._dataset)}; limit is {self._max_rows}.')
+        self._dataset.extend(rows)
+
+
+    def revise_rows(self, rows: ColumnarDataset) -> None:
+        """
+        Add rows, replacing any already collected for the same dates, keeping date order
+        """
+        merged = self._dataset.merged(rows)
+        if len(merged) > self._max_rows:
+            raise ValueError(f'Cannot revise gviz dataset of {len(self._dataset)} to {len(merged)} rows; limit is {self._max_rows}.')
+        self._dataset = merged
+
+
+    def __len__(self) -> int:
+        return len(self._dataset)
+
+
+    def render(self) -> bytes:
+        """
+        Render the collected rows as the dataset.js script
+
+        :returns: UTF-8 encoded script
+        """
+        json_data = render_datatable(self._dataset, self._column_definitions)
+        return b'function createDataset() { return { getDataTable: function () { return new google.visualization.DataTable(' + \
+            json_data + b'); } }; }'
+
+
+    def render_derived(self) -> Dict[str, bytes]:
+        """
+        Render the tables derived from the collected rows for the daily, column and pie charts
+
+        :returns: UTF-8 encoded DataTable JSON by S3 key
+        """
+        stem = self._stem()
+        measures_by_date = MeasuresByDate.from_dataset(self._dataset)
+        return {
+            f'{stem}-derived.json': render_datatable(DerivedSeries.from_dataset(self._dataset), DerivedSeries.column_definitions),
+            f'{stem}-monthly-totals.json': render_datatable(MonthlyTotals.from_dataset(self._dataset), MonthlyTotals.column_definitions),
+            f'{stem}-pie.json': render_datatable(measures_by_date, measures_by_date.column_definitions)
+        }
+
+
+    def _tables(self) -> Dict[str, bytes]:
+        """
+        Everything published as DataTable JSON next to the script
+        """
+        tables = {}
+        if self._resolutions:
+            tables.update(self.render_resolutions())
+        if self._derived:
+            tables.update(self.render_derived())
+        return tables
+
+
+    def render_resolutions(self) -> Dict[str, bytes]:
+        """
+        Render the weekly, monthly, LTTB and yearly daily versions of the collected rows
+
+        :returns: UTF-8 encoded DataTable JSON by S3 key
+        """
+        stem = self._stem()
+        resolutions = {
+            f'{stem}-weekly.json': render_datatable(rollup(self._dataset, 'week'), self._column_definitions),
+            f'{stem}-monthly.json': render_datatable(rollup(self._dataset, 'month'), self._column_definitions),
+            f'{stem}-lttb.json': render_datatable(lttb(self._dataset, self._max_points), self._column_definitions)
+        }
+        for year, rows in by_year(self._dataset).items():
+            resolutions[f'{stem}-daily-{year}.json'] = render_datatable(rows, self._column_definitions)
+        return resolutions
+
+
+    def _stem(self) -> str:
+        return self._key.rsplit('.', 1)[0]
+
+
+    def write_to_s3(self) -> int:
+        """
+        Publish the script, and the resolutions, derived tables and history if wanted, to the bucket
+
+        :returns: Number of objects written
+        """
+        if self._precompressed:
+            return self._publish_precompressed()
 
-    def write_to_s3(self) -> None:
-        datatable = gviz_api.DataTable(self._column_definitions)
-        datatable.LoadData(self._dataset)
-        json_data = datatable.ToJSon(columns_order=('date', 'cases', 'deaths', 'recovered'),
-                                     order_by='date')
-        code = f'function createDataset() {{ return {{ getDataTable: function () {{ return new google.visualization.DataTable({json_data}); }} }}; }}'
-        boto3.resource('s3').Bucket(self._bucket_name).put_object(
+        bucket = get_resource('s3').Bucket(self._bucket_name)
+        bucket.put_object(
             Key=self._key,
-            Body=code.encode('utf-8')
+            Body=self.render()
         )
+        tables = self._tables()
+        for key, body in tables.items():
+            bucket.put_object(
+                Key=key,
+                Body=body,
+                ContentType='application/json',
+                CacheControl=self._RESOLUTION_CACHE_CONTROL
+            )
+        if self._history_key:
+            bucket.put_object(
+                Key=self._history_key,
+                Body=self._dataset.to_json(),
+                ContentType='application/json'
+            )
+        return 1 + len(tables) + (1 if self._history_key else 0)
+
+
+    def _publish_precompressed(self) -> int:
+        publisher = ContentAddressedPublisher(self._bucket_name, f'{self._stem()}-manifest.json')
+        publisher.publish(self._key, self.render(), 'application/javascript')
+        for key, body in self._tables().items():
+            publisher.publish(key, body, 'application/json')
+        if self._history_key:
+            publisher.publish_fixed(self._history_key, self._dataset.to_json(), 'application/json')
+        # Last, so it never points at objects not there yet
+        manifest = publisher.commit()
+        return len(publisher.written) + (1 if manifest else 0)
 
 
-class DynamoDBLoader:
+class Loader(ABC):
     """
-    Handles load logic for a DynamoDB repository
+    Load logic common to every kind of repository
+
+    Every record of the dataset is compared with a fingerprint of what is
+    stored for its date, and only new records and those the source has revised
+    are written, so a run costs what changed rather than what is there.
+    The fingerprints are kept in the repository, read in one call and saved
+    once the records are written. A partition stored before there were fingerprints
+    has them taken from what it holds, once. If there is a collector, it is
+    brought up to date with everything stored so far, from its history if that
+    is current or else by reading the whole partition back.
+
+    Derived classes provide the storage: finding the high-watermark, the most
+    recent date stored, bulk upserting records, keeping the fingerprints and
+    reading a range of dates back. Every repository is divided into
+    numbered partitions, one per country; see partition_for().
+
+    Records are written in date order, a chunk at a time, revisions first,
+    unless the repository can write them all at once (see SQLiteLoader).
+    Writes within a chunk
+    may land in any order, so a load that dies part way could leave later dates
+    stored with earlier ones missing, and the watermark would skip the gap.
+    A checkpoint guards against that. It is set before the first chunk, moved
+    to each chunk's last date once the chunk is in, and cleared at the end.
+    While one is set, it is the watermark, so an interrupted load carries on
+    from the last complete chunk and nothing already written is recomputed.
 
-    If we were being clever, we could have an abstract base class Loader
-    and derive this and other repo targets, e.g. RDS
+    Given the time left (e.g. a Lambda context's get_remaining_time_in_millis),
+    the load stops cleanly between chunks rather than run out of time, and
+    complete is False. The next run picks up from the checkpoint.
     """
 
     # We'll use this as the partition key so that date can be a sort key for queries.
-    # There could conceivably be other countries datasets.
+    # Other countries get their own partitions, see partition_for().
     _US_DATASET = 1
 
-    # Maximum number of records that can be written to dynamo in batches
-    _MAX_BATCH_SIZE = 25
+    # Records per checkpoint
+    _CHECKPOINT_ROWS = 250
 
-    def __init__(self, table_name: str, dataset: list, collector: GVizCollector):
+    # Time to leave for what comes after the load, e.g. publishing
+    _RESERVE_MS = 10_000
+
+    def __init__(self, dataset: Union[ColumnarDataset, Iterable[dict]], collector: Optional[GVizCollector],
+                 partition: int = _US_DATASET, remaining_time_ms: Callable[[], int] = None):
         """
         Constructor.
 
-        Store DynamoDB table name and dataset to load
-        Create a boto resource for the DDB connection
+        Dict records (or a lazy iterator of them) are packed into a ColumnarDataset.
+        Repositories that meter their use tot it up in read_capacity_units and write_capacity_units.
+        Each update counts the new and changed records it stored in new_rows and changed_rows,
+        and those already stored as they are in unchanged_rows.
+
+        :param dataset: Records to load
+        :param collector: Collector for the chart data, or None if this partition isn't charted
+        :param partition: Partition to load into
+        :param remaining_time_ms: Function giving the milliseconds left to run in, if limited
         """
-        self._table_name = table_name
-        self._dataset  = dataset
-        self._dynamodb = boto3.resource('dynamodb')
+        self._dataset  = ColumnarDataset.from_rows(dataset)
         self._collector = collector
+        self._partition = partition
+        self._remaining_time_ms = remaining_time_ms
+        self.write_stats = None
+        self.read_capacity_units = 0.0
+        self.write_capacity_units = 0.0
+        self.new_rows = 0
+        self.changed_rows = 0
+        self.unchanged_rows = 0
+        self.complete = True
+
 
-    def _render_dynamo_item(self, record: dict) -> dict:
+    @classmethod
+    def partition_for(cls, region: str) -> int:
+        """
+        Partition key value of a country's data. US keeps the partition it has
+        always had; others get a stable number from a hash of the name.
+
+        :param region: Country name as given in the JH data
+        """
+        if region == 'US':
+            return cls._US_DATASET
+        # Clear of 0 (validators) and 1 (US)
+        return 2 + zlib.crc32(region.encode('utf-8'))
+
+
+    @abstractmethod
+    def read_last_date(self) -> Optional[date]:
+        """
+        Find the date of the most recent record in the partition
+
+        :returns: The date, or None if the partition is empty
+        """
+
+
+    @abstractmethod
+    def read_range(self, start: date = None, end: date = None) -> ColumnarDataset:
+        """
+        Read the records of the partition between two dates, inclusive
+
+        :param start: First date to read, or None to start at the beginning
+        :param end: Last date to read, or None to read to the end
+        :returns: The records in date order
+        """
+
+
+    @abstractmethod
+    def write_records(self, records: ColumnarDataset) -> None:
+        """
+        Insert or replace records in the partition, as efficiently as the repository allows
+
+        :param records: Records to write
+        """
+
+
+    @abstractmethod
+    def read_checkpoint(self) -> Optional[date]:
+        """
+        Get the partition's checkpoint: the date up to which an unfinished load is complete
+
+        :returns: The date, date.min if nothing is complete yet, or None if no load is unfinished
+        """
+
+
+    @abstractmethod
+    def write_checkpoint(self, day: Optional[date]) -> None:
+        """
+        Set the partition's checkpoint, or clear it with None
+        """
+
+
+    @abstractmethod
+    def read_fingerprints(self) -> Optional[Fingerprints]:
+        """
+        Get the fingerprints of the rows stored in the partition
+
+        :returns: The fingerprints, or None if none have been kept
+        """
+
+
+    @abstractmethod
+    def write_fingerprints(self, fingerprints: Fingerprints) -> None:
+        """
+        Replace the partition's fingerprints
+        """
+
+
+    def update_fingerprints(self, records: ColumnarDataset) -> None:
+        """
+        Take the fingerprints of records written other than by update_repository(), e.g. by a backfill.
+        A partition without fingerprints is left without; the next update takes them from what is stored.
+        """
+        fingerprints = self.read_fingerprints()
+        if fingerprints is not None:
+            fingerprints.update(records)
+            self.write_fingerprints(fingerprints)
+
+
+    def write_chunk(self, records: ColumnarDataset) -> None:
+        """
+        Write one chunk of records, then move the checkpoint to its last date.
+        Repositories with transactions should override this to do both at once.
+        """
+        self.write_records(records)
+        self.write_checkpoint(records.last_date())
+
+
+    def _time_for(self, seconds: float) -> bool:
+        """
+        Whether there is time left for something taking about this long
+        """
+        if self._remaining_time_ms is None:
+            return True
+        return self._remaining_time_ms() - self._RESERVE_MS > seconds * 1000
+
+
+    def _write_checkpointed(self, records: ColumnarDataset, watermark: date, fingerprints: Fingerprints) -> int:
+        """
+        Write records in date order a chunk at a time, then save their fingerprints,
+        once at the end or when stopping short. Rows written but not yet fingerprinted,
+        as after a crash, are only written again next time.
+        Revisions of dates up to the watermark leave the checkpoint be; it only
+        guards the newer dates, moving after each of their chunks.
+
+        :returns: Number of records written, fewer than given if time ran short
+        """
+        if len(records) == 1:
+            # A single write can't be left half done
+            self.write_records(records)
+            fingerprints.update(records)
+            self.write_fingerprints(fingerprints)
+            return 1
+
+        split = bisect_right(records.column('date'), watermark.toordinal())
+        checkpointed = len(records) - split > 1
+        if not checkpointed:
+            # Nothing to guard, so one new date goes along with the revisions
+            split = len(records)
+        revised, added = records[:split], records[split:]
+        chunks = [(revised[i:i + self._CHECKPOINT_ROWS], False) for i in range(0, len(revised), self._CHECKPOINT_ROWS)] + \
+                 [(added[i:i + self._CHECKPOINT_ROWS], True) for i in range(0, len(added), self._CHECKPOINT_ROWS)]
+
+        if checkpointed:
+            self.write_checkpoint(watermark)
+        written = 0
+        slowest = 0.0
+
+        for chunk, moves_checkpoint in chunks:
+            if not self._time_for(slowest * 1.5):
+                self.complete = False
+                if written:
+                    self.write_fingerprints(fingerprints)
+                return written
+
+            start = time.perf_counter()
+            if moves_checkpoint:
+                self.write_chunk(chunk)
+            else:
+                self.write_records(chunk)
+            fingerprints.update(chunk)
+            written += len(chunk)
+            slowest = max(slowest, time.perf_counter() - start)
+
+        self.write_fingerprints(fingerprints)
+        if checkpointed:
+            self.write_checkpoint(None)
+        return written
+
+
+    def read_all_data(self) -> ColumnarDataset:
+        """
+        Read the entire partition
+        """
+        return self.read_range()
+
+
+    def update_repository(self) -> int:
+        """
+        Update repository with latest data
+
+        :returns: Number of records stored, new or changed. Check complete to see if that was all of them.
+        """
+        self.complete = True
+
+        # High-watermark: the most recent date stored so far,
+        # or where an unfinished load got up to
+        last_entry_date = self.read_checkpoint()
+        if last_entry_date is None:
+            last_entry_date = self.read_last_date()
+        elif last_entry_date == date.min:
+            last_entry_date = None
+
+        # What is stored, as fingerprints. An empty partition has none, whatever
+        # might be left over; one stored without them has them taken from its rows.
+        stored = None
+        fingerprints = self.read_fingerprints() if last_entry_date else Fingerprints()
+        if fingerprints is None:
+            stored = self.read_range(end=last_entry_date)
+            fingerprints = Fingerprints.of(stored)
+
+        # Gviz data needs everything so far. Only read the whole table
+        # if the collector's stored history doesn't match up with it.
+        if last_entry_date and self._collector is not None and not self._collector.load_history(last_entry_date):
+            # This will be sorted in ascending SORT KEY order, i.e. date.
+            # Stop at the watermark, as an unfinished load may have stored some later dates.
+            self._collector.add_rows(stored if stored is not None else self.read_range(end=last_entry_date))
+
+        last_entry_date = last_entry_date or date.min
+
+        # Only records that are new or revised need writing
+        records_to_write, _, _, self.unchanged_rows = fingerprints.diff(self._dataset)
+        records_to_write = records_to_write.sorted_by_date()
+        new_dates = {ordinal for ordinal in records_to_write.column('date') if ordinal not in fingerprints}
+        record_count = self._write_checkpointed(records_to_write, last_entry_date, fingerprints) if records_to_write else 0
+        written = records_to_write[:record_count]
+
+        # Count what was stored, which is less than the diff if time ran short
+        self.new_rows = sum(ordinal in new_dates for ordinal in written.column('date'))
+        self.changed_rows = record_count - self.new_rows
+
+        # Bring gviz data up to date. Revisions replace rows it has; new dates go on the end.
+        if self._collector is not None and written:
+            if written[0]['date'] <= last_entry_date:
+                self._collector.revise_rows(written)
+            else:
+                self._collector.add_rows(written)
+
+        return record_count
+
+
+class DynamoDBLoader(Loader):
+    """
+    Handles load logic for a DynamoDB repository
+    """
+
+    # Checkpoints and fingerprints live with the validators, clear of the data partitions
+    _CHECKPOINT_PARTITION = 0
+
+    def __init__(self, table_name: str, dataset: Union[ColumnarDataset, Iterable[dict]], collector: Optional[GVizCollector],
+                 partition: int = Loader._US_DATASET, capacity_limiter: threading.Semaphore = None,
+                 remaining_time_ms: Callable[[], int] = None):
+        """
+        Constructor.
+
+        Store DynamoDB table name and dataset to load.
+        Get the client of the shared boto resource for the DDB connection,
+        as MultiRegionLoader runs loaders on several threads and only clients are thread safe.
+
+        :param table_name: Table to load
+        :param capacity_limiter: Semaphore bounding batch writes in flight, shared between loaders
+        """
+        super().__init__(dataset, collector, partition, remaining_time_ms)
+        self._table_name = table_name
+        self._client = get_resource('dynamodb').meta.client
+        self._capacity_limiter = capacity_limiter
+
+
+    def _render_dynamo_item(self, record: Tuple[date, int, int, int]) -> dict:
         """
         Render a single record for database insertion, adding partition key and converting date to string
 
-        :param record: Record to render
+        :param record: (date, cases, deaths, recovered) tuple to render
         :return: Record suitable for insertion to dynamo
         """
+        record_date, cases, deaths, recovered = record
         return {
-            'dataset': self._US_DATASET,
-            'date': record['date'].__str__(),
-            'cases': record['cases'],
-            'deaths': record['deaths'],
-            'recovered': record['recovered']
+            'dataset': self._partition,
+            'date': record_date.__str__(),
+            'cases': cases,
+            'deaths': deaths,
+            'recovered': recovered
         }
 
 
-    def _batch_insert_repository(self, records_to_write: List[dict]) -> None:
+    def _batch_insert_repository(self, records_to_write: ColumnarDataset) -> None:
         """
         Push a batch of records to the repository.
-        This will take a little time on initial load since WCU is low
+        Batches go concurrently, and anything throttled or unprocessed is retried,
+        which matters on initial load since WCU is low
 
         :param records_to_write: Records that need inseting in the database
         """
-        def batch_records(dataset: List[dict]) -> List[dict]:
-            """
-            Generator that yields batches of records for BatchWriteItem
-            """
-            for i in range(0, len(dataset), self._MAX_BATCH_SIZE):
-                yield dataset[i:i + self._MAX_BATCH_SIZE]
-
-        for batch in batch_records(records_to_write):
-            self._dynamodb.batch_write_item(RequestItems={
-                self._table_name:  [
-                        {
-                            'PutRequest': {
-                                'Item': self._render_dynamo_item(record)
-                            }
-                        }
-                    for record in batch
-                    ]
-                }
-            )
+        writer = DynamoDBBatchWriter(self._client, self._table_name, limiter=self._capacity_limiter)
+        stats = writer.write(self._render_dynamo_item(record) for record in records_to_write.tuples())
+        self.write_capacity_units += stats.consumed_capacity
+        # One write() per checkpoint chunk; the stats are of the whole load
+        if self.write_stats is None:
+            self.write_stats = stats
+        else:
+            self.write_stats.merge(stats)
 
 
-    def read_all_data(self) -> List[dict]:
+    def write_records(self, records: ColumnarDataset) -> None:
+        """
+        Write records in batches, or a single record with a plain put
         """
-        Read the entire dataset from Dynamo
-        This is inexpensive because the dataset is small
+        if len(records) > 1:
+            self._batch_insert_repository(records)
+            return
+
+        response = self._client.put_item(
+            TableName=self._table_name,
+            Item=self._render_dynamo_item(next(records.tuples())),
+            ReturnConsumedCapacity='TOTAL'
+        )
+        self.write_capacity_units += capacity_units(response.get('ConsumedCapacity', None))
+
+
+    def _checkpoint_key(self) -> dict:
+        return {'dataset': self._CHECKPOINT_PARTITION, 'date': f'checkpoint#{self._partition}'}
+
+
+    def read_checkpoint(self) -> Optional[date]:
+        response = self._client.get_item(
+            TableName=self._table_name,
+            Key=self._checkpoint_key(),
+            ConsistentRead=True,
+            ReturnConsumedCapacity='TOTAL'
+        )
+        self.read_capacity_units += capacity_units(response.get('ConsumedCapacity', None))
+
+        item = response.get('Item', None)
+        return parse_iso_date(item['last_date']) if item else None
+
+
+    def write_checkpoint(self, day: Optional[date]) -> None:
+        if day is None:
+            response = self._client.delete_item(TableName=self._table_name, Key=self._checkpoint_key(),
+                                                ReturnConsumedCapacity='TOTAL')
+        else:
+            response = self._client.put_item(TableName=self._table_name, Item={**self._checkpoint_key(), 'last_date': str(day)},
+                                             ReturnConsumedCapacity='TOTAL')
+        self.write_capacity_units += capacity_units(response.get('ConsumedCapacity', None))
+
+
+    def _fingerprints_key(self) -> dict:
+        return {'dataset': self._CHECKPOINT_PARTITION, 'date': f'fingerprints#{self._partition}'}
+
+
+    def read_fingerprints(self) -> Optional[Fingerprints]:
+        response = self._client.get_item(
+            TableName=self._table_name,
+            Key=self._fingerprints_key(),
+            ConsistentRead=True,
+            ReturnConsumedCapacity='TOTAL'
+        )
+        self.read_capacity_units += capacity_units(response.get('ConsumedCapacity', None))
+
+        item = response.get('Item', None)
+        if not item:
+            return None
+        # boto3 hands binary attributes back wrapped in a Binary
+        value = item['fingerprints']
+        return Fingerprints.from_bytes(getattr(value, 'value', value))
+
+
+    def write_fingerprints(self, fingerprints: Fingerprints) -> None:
+        response = self._client.put_item(
+            TableName=self._table_name,
+            Item={**self._fingerprints_key(), 'fingerprints': fingerprints.to_bytes()},
+            ReturnConsumedCapacity='TOTAL'
+        )
+        self.write_capacity_units += capacity_units(response.get('ConsumedCapacity', None))
+
+
+    def read_range(self, start: date = None, end: date = None) -> ColumnarDataset:
+        """
+        Read records from Dynamo, a page at a time.
+        Reading everything is inexpensive because the dataset is small
         and we only do it once a day.
         """
-        table = self._dynamodb.Table(self._table_name)
+        key_condition = conditions.Key('dataset').eq(self._partition)
+
+        if start or end:
+            key_condition = key_condition & conditions.Key('date').between(str(start or date.min), str(end or date.max))
 
         start_key = None
-        dataset = []
+        dataset = ColumnarDataset()
 
         while True:
             # Loop until the query retrieves all the data
             if start_key:
-                response = table.query(
+                response = self._client.query(
+                    TableName=self._table_name,
                     Select='ALL_ATTRIBUTES',
                     ConsistentRead=False,
                     ScanIndexForward=True,
-                    KeyConditionExpression=Key('dataset').eq(1),
-                    ExclusiveStartKey=start_key
+                    KeyConditionExpression=key_condition,
+                    ExclusiveStartKey=start_key,
+                    ReturnConsumedCapacity='TOTAL'
                 )
             else:
-                response = table.query(
+                response = self._client.query(
+                    TableName=self._table_name,
                     Select='ALL_ATTRIBUTES',
                     ConsistentRead=False,
                     ScanIndexForward=True,
-                    KeyConditionExpression=Key('dataset').eq(1),
+                    KeyConditionExpression=key_condition,
+                    ReturnConsumedCapacity='TOTAL'
                 )
 
-            dataset.extend([
-                {
-                    'date': datetime.strptime(item['date'], '%Y-%m-%d').date(),
-                    'cases': int(item['cases']),
-                    'deaths': int(item['deaths']),
-                    'recovered': int(item['recovered'])
-                }
-                for item in response['Items']
-            ])
+            self.read_capacity_units += capacity_units(response.get('ConsumedCapacity', None))
+
+            for item in response['Items']:
+                dataset.append(
+                    parse_iso_date(item['date']),
+                    int(item['cases']),
+                    int(item['deaths']),
+                    int(item['recovered'])
+                )
 
             start_key = response.get('LastEvaluatedKey', None)
 
@@ -164,41 +726,310 @@ class DynamoDBLoader:
         return dataset
 
 
-    def update_repository(self) -> None:
+    def read_last_date(self) -> Optional[date]:
         """
-        Update repository with latest data
+        Find the date of the most recent record in the partition.
+        This reads a single key, so costs the same however much is stored.
+
+        :returns: The date, or None if the partition is empty
+        """
+        response = self._client.query(
+            TableName=self._table_name,
+            ConsistentRead=False,
+            ScanIndexForward=False,
+            Limit=1,
+            KeyConditionExpression=conditions.Key('dataset').eq(self._partition),
+            ProjectionExpression='#date',
+            ExpressionAttributeNames={'#date': 'date'},
+            ReturnConsumedCapacity='TOTAL'
+        )
+        self.read_capacity_units += capacity_units(response.get('ConsumedCapacity', None))
+
+        items = response['Items']
+        return parse_iso_date(items[0]['date']) if items else None
+
+
+class SQLiteLoader(Loader):
+    """
+    Handles load logic for a local SQLite database, so the whole ETL can
+    run on a laptop or in CI at full data volumes.
+
+    The table mirrors the DynamoDB one, keyed on dataset and date. All the
+    new records go in one executemany() in a single transaction, together
+    with their fingerprints, rather than a round trip per 25 items. The
+    transaction lands whole or not at all, so a load needs no checkpoints
+    and is never stopped part way for time.
+
+    A connection is opened for each operation, so loaders for several
+    partitions can share a database file from different threads.
+    SQLite serialises their writes.
+
+    Checkpoints are kept in a second table, for the Loader interface.
+    Fingerprints are kept in a third, one row per partition.
+    """
+
+    _TABLE_SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS {table} ('
+        'dataset INTEGER NOT NULL, date TEXT NOT NULL, '
+        'cases INTEGER NOT NULL, deaths INTEGER NOT NULL, recovered INTEGER NOT NULL, '
+        'PRIMARY KEY (dataset, date)) WITHOUT ROWID'
+    )
+
+    _CHECKPOINT_SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS {table}_checkpoints ('
+        'dataset INTEGER PRIMARY KEY, last_date TEXT NOT NULL)'
+    )
+
+    _FINGERPRINTS_SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS {table}_fingerprints ('
+        'dataset INTEGER PRIMARY KEY, fingerprints BLOB NOT NULL)'
+    )
+
+    # Seconds to wait on another loader's write lock
+    _LOCK_TIMEOUT = 30
+
+    def __init__(self, database_path: str, dataset: Union[ColumnarDataset, Iterable[dict]], collector: Optional[GVizCollector],
+                 partition: int = Loader._US_DATASET, remaining_time_ms: Callable[[], int] = None, table_name: str = 'covid'):
+        """
+        Constructor.
+
+        :param database_path: SQLite database file, created if need be
+        :param table_name: Table within the database
+        """
+        super().__init__(dataset, collector, partition, remaining_time_ms)
+        self._database_path = database_path
+        self._table_name = table_name
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(self._TABLE_SCHEMA.format(table=self._table_name))
+                connection.execute(self._CHECKPOINT_SCHEMA.format(table=self._table_name))
+                connection.execute(self._FINGERPRINTS_SCHEMA.format(table=self._table_name))
+        finally:
+            connection.close()
+
+
+    def _connect(self):
+        return sqlite3.connect(self._database_path, timeout=self._LOCK_TIMEOUT)
+
+
+    def _insert(self, connection, records: ColumnarDataset) -> None:
+        partition = self._partition
+        connection.executemany(
+            f'INSERT OR REPLACE INTO {self._table_name} (dataset, date, cases, deaths, recovered) VALUES (?, ?, ?, ?, ?)',
+            ((partition, str(record_date), cases, deaths, recovered)
+             for record_date, cases, deaths, recovered in records.tuples())
+        )
+
+
+    def _set_checkpoint(self, connection, day: Optional[date]) -> None:
+        if day is None:
+            connection.execute(f'DELETE FROM {self._table_name}_checkpoints WHERE dataset = ?', (self._partition,))
+        else:
+            connection.execute(f'INSERT OR REPLACE INTO {self._table_name}_checkpoints (dataset, last_date) VALUES (?, ?)',
+                               (self._partition, str(day)))
+
+
+    def write_records(self, records: ColumnarDataset) -> None:
+        """
+        Insert or replace all the records in one transaction
         """
+        connection = self._connect()
+        try:
+            # The connection as a context manager commits, or rolls back on error
+            with connection:
+                self._insert(connection, records)
+        finally:
+            connection.close()
 
-        # Get all the data so far
-        # This will be sorted in ascending SORT KEY order, i.e. date
-        existing_data = self.read_all_data()
 
-        # Add to gviz data
-        self._collector.add_rows(existing_data)
+    def _write_checkpointed(self, records: ColumnarDataset, watermark: date, fingerprints: Fingerprints) -> int:
+        """
+        Write all the records and their fingerprints in one transaction
 
-        # Aggegate on most recent date
-        last_entry_date = existing_data[-1]['date'] if existing_data else date.min
+        :returns: Number of records written, always all of them
+        """
+        fingerprints.update(records)
+        connection = self._connect()
+        try:
+            with connection:
+                self._insert(connection, records)
+                self._set_fingerprints(connection, fingerprints)
+        finally:
+            connection.close()
+        return len(records)
 
-        # Filter dataset for records newer than last entry
-        records_to_write = list(filter(lambda r: r['date'] > last_entry_date, self._dataset))
-        record_count = len(records_to_write)
 
-        # Add new rows to gviz data
-        self._collector.add_rows(records_to_write)
+    def read_checkpoint(self) -> Optional[date]:
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                f'SELECT last_date FROM {self._table_name}_checkpoints WHERE dataset = ?', (self._partition,)
+            ).fetchone()
+        finally:
+            connection.close()
+        return parse_iso_date(row[0]) if row else None
 
-        if record_count == 0:
-            # Nothing to do
-            return record_count
 
-        if record_count > 1:
-            # More than one, then batch
-            self._batch_insert_repository(records_to_write)
-            return record_count
+    def write_checkpoint(self, day: Optional[date]) -> None:
+        connection = self._connect()
+        try:
+            with connection:
+                self._set_checkpoint(connection, day)
+        finally:
+            connection.close()
 
-        # If we get here, then single record
-        self._dynamodb.Table(self._table_name).put_item(
-            Item=self._render_dynamo_item(records_to_write[0])
+
+    def read_fingerprints(self) -> Optional[Fingerprints]:
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                f'SELECT fingerprints FROM {self._table_name}_fingerprints WHERE dataset = ?', (self._partition,)
+            ).fetchone()
+        finally:
+            connection.close()
+        return Fingerprints.from_bytes(row[0]) if row else None
+
+
+    def _set_fingerprints(self, connection, fingerprints: Fingerprints) -> None:
+        connection.execute(
+            f'INSERT OR REPLACE INTO {self._table_name}_fingerprints (dataset, fingerprints) VALUES (?, ?)',
+            (self._partition, fingerprints.to_bytes())
         )
 
-        return record_count
 
+    def write_fingerprints(self, fingerprints: Fingerprints) -> None:
+        connection = self._connect()
+        try:
+            with connection:
+                self._set_fingerprints(connection, fingerprints)
+        finally:
+            connection.close()
+
+
+    def read_range(self, start: date = None, end: date = None) -> ColumnarDataset:
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f'SELECT date, cases, deaths, recovered FROM {self._table_name} '
+                'WHERE dataset = ? AND date BETWEEN ? AND ? ORDER BY date',
+                (self._partition, str(start or date.min), str(end or date.max))
+            )
+            return ColumnarDataset.from_tuples(
+                (parse_iso_date(day), cases, deaths, recovered) for day, cases, deaths, recovered in rows
+            )
+        finally:
+            connection.close()
+
+
+    def read_last_date(self) -> Optional[date]:
+        connection = self._connect()
+        try:
+            last_date, = connection.execute(
+                f'SELECT MAX(date) FROM {self._table_name} WHERE dataset = ?', (self._partition,)
+            ).fetchone()
+        finally:
+            connection.close()
+        return parse_iso_date(last_date) if last_date else None
+
+
+class MultiRegionLoader:
+    """
+    Loads a dataset per country, each into its own partition of the table,
+    with its own watermark.
+
+    Partitions are loaded concurrently on a thread pool. Their batch writes
+    share one limit on how many are in flight, so adding countries doesn't
+    multiply the load on the table. The limit comes from the table's write
+    capacity: a full batch costs a WCU per item, so more batches than
+    WCU / batch size at once would only be throttled.
+    """
+
+    def __init__(self, table_name: str, regions: Dict[str, ColumnarDataset], collectors: Dict[str, GVizCollector] = None,
+                 max_workers: int = 8, write_capacity: int = 100, loader_class: type = DynamoDBLoader,
+                 remaining_time_ms: Callable[[], int] = None):
+        """
+        Constructor
+
+        :param table_name: Table to load, or database file for SQLiteLoader
+        :param regions: Dataset for each country
+        :param collectors: Chart collectors for the countries that have one
+        :param max_workers: Maximum number of partitions loaded at once
+        :param write_capacity: Provisioned write capacity units of the table
+        :param loader_class: Loader for each partition
+        :param remaining_time_ms: Function giving the milliseconds left to run in, if limited
+        """
+        collectors = collectors or {}
+        self._max_workers = max_workers
+        self._loaders = {}
+        partitions = {}
+        self.max_batches_in_flight = max(1, write_capacity // DynamoDBBatchWriter._MAX_BATCH_SIZE)
+        # Only DynamoDB batch writes need holding back
+        options = {'capacity_limiter': threading.BoundedSemaphore(self.max_batches_in_flight)} \
+            if issubclass(loader_class, DynamoDBLoader) else {}
+
+        for region, dataset in regions.items():
+            partition = Loader.partition_for(region)
+            if partition in partitions:
+                raise ValueError(f'{region} and {partitions[partition]} would share partition {partition}')
+            partitions[partition] = region
+            self._loaders[region] = loader_class(table_name, dataset, collectors.get(region, None), partition,
+                                                 remaining_time_ms=remaining_time_ms, **options)
+
+        self.record_counts = {}
+
+
+    @property
+    def loaders(self) -> Dict[str, Loader]:
+        """
+        The loader of each country
+        """
+        return self._loaders
+
+
+    @property
+    def complete(self) -> bool:
+        """
+        Whether every partition was loaded in full by the last update
+        """
+        return all(loader.complete for loader in self._loaders.values())
+
+
+    @property
+    def read_capacity_units(self) -> float:
+        return sum(loader.read_capacity_units for loader in self._loaders.values())
+
+
+    @property
+    def write_capacity_units(self) -> float:
+        return sum(loader.write_capacity_units for loader in self._loaders.values())
+
+
+    @property
+    def new_rows(self) -> int:
+        return sum(loader.new_rows for loader in self._loaders.values())
+
+
+    @property
+    def changed_rows(self) -> int:
+        return sum(loader.changed_rows for loader in self._loaders.values())
+
+
+    @property
+    def unchanged_rows(self) -> int:
+        return sum(loader.unchanged_rows for loader in self._loaders.values())
+
+
+    def update_repository(self) -> int:
+        """
+        Update every country's partition with its latest data
+
+        :returns: Total number of records stored, new or changed
+        """
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = {region: executor.submit(loader.update_repository) for region, loader in self._loaders.items()}
+
+        # Raise the first failure, if any, once everything has finished
+        self.record_counts = {region: future.result() for region, future in futures.items()}
+        return sum(self.record_counts.values())
@@ -0,0 +1,203 @@
+"""
+Per-stage metrics for the ETL, written as CloudWatch Embedded Metric Format.
+
+Each stage emits one JSON line when it finishes, which CloudWatch Logs
+turns into metrics without any API calls from the Lambda. A run that
+times out part way still leaves the stages it got through.
+
+Timing and RSS come from perf_counter and getrusage, which cost next to
+nothing. tracemalloc slows allocation down noticeably, so the Python heap
+peak is only measured when asked for.
+"""
+import json
+import sys
+import time
+import tracemalloc
+from typing import Optional, Union
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows. Peak RSS is just left out there.
+    resource = None
+
+
+def capacity_units(consumed: Union[dict, list, None]) -> float:
+    """
+    Total capacity units in the ConsumedCapacity of a DynamoDB response,
+    which is a single entry for table calls and a list for batch calls
+    """
+    if not consumed:
+        return 0.0
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return float(sum(c.get('CapacityUnits', 0) for c in consumed))
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    High-water mark of the process's resident set, in megabytes
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class NullSink:
+    """
+    Discards metrics. For tests, and anywhere metrics aren't wanted.
+    """
+    def emit(self, record: dict) -> None:
+        pass
+
+
+class StdoutSink:
+    """
+    Prints each record as a JSON line, which is how Lambda gets EMF to CloudWatch
+    """
+    def emit(self, record: dict) -> None:
+        print(json.dumps(record, separators=(',', ':')), flush=True)
+
+
+class ListSink:
+    """
+    Keeps emitted records in a list, to inspect them
+    """
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record: dict) -> None:
+        self.records.append(record)
+
+
+class Stage:
+    """
+    One timed stage of a run. Returned by Metrics.stage() for the with block to add to.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = None
+        self.values = {}
+
+
+    def add(self, name: str, value: float) -> None:
+        """
+        Add to a stage metric, e.g. consumed capacity, starting from zero
+        """
+        self.values[name] = self.values.get(name, 0) + value
+
+
+class Metrics:
+    """
+    Times the stages of a run and emits a metric record for each
+
+    Usage:
+
+        with metrics.stage('load') as stage:
+            stage.rows = loader.update_repository()
+    """
+
+    # Units of the metrics stages can carry. Anything else added to a stage is a Count.
+    _UNITS = {
+        'Duration': 'Milliseconds',
+        'Rows': 'Count',
+        'RowsPerSecond': 'Count/Second',
+        'PeakRSS': 'Megabytes',
+        'PeakTracedMemory': 'Megabytes'
+    }
+
+
+    def __init__(self, sink=None, namespace: str = 'CovidETL', service: str = 'etl', trace_memory: bool = False):
+        """
+        Constructor
+
+        :param sink: Where records go. Defaults to a NullSink.
+        :param namespace: CloudWatch namespace of the metrics
+        :param service: Value of the Service dimension
+        :param trace_memory: Also measure each stage's Python heap peak with tracemalloc
+        """
+        self._sink = sink or NullSink()
+        self._namespace = namespace
+        self._service = service
+        self._trace_memory = trace_memory
+        self.stages = []
+
+
+    def stage(self, name: str) -> '_StageTimer':
+        """
+        Context manager that times a stage and emits its record on exit
+        """
+        return _StageTimer(self, Stage(name))
+
+
+    def _emit(self, stage: Stage) -> None:
+        values = dict(stage.values)
+        if stage.rows is not None:
+            values['Rows'] = stage.rows
+            if values.get('Duration'):
+                values['RowsPerSecond'] = round(stage.rows / (values['Duration'] / 1000), 1)
+
+        self._sink.emit({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self._namespace,
+                    'Dimensions': [['Service', 'Stage']],
+                    'Metrics': [{'Name': name, 'Unit': self._UNITS.get(name, 'Count')} for name in values]
+                }]
+            },
+            'Service': self._service,
+            'Stage': stage.name,
+            **values
+        })
+        self.stages.append(stage)
+
+
+class _StageTimer:
+
+    def __init__(self, metrics: Metrics, stage: Stage):
+        self._metrics = metrics
+        self._stage = stage
+        self._start = None
+        self._traced_at_start = 0
+        self._started_tracing = False
+
+
+    def __enter__(self) -> Stage:
+        if self._metrics._trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                # No reset_peak before Python 3.9. Forgetting earlier blocks resets it too.
+                tracemalloc.clear_traces()
+            self._traced_at_start = tracemalloc.get_traced_memory()[0]
+
+        self._start = time.perf_counter()
+        return self._stage
+
+
+    def __exit__(self, exc_type, *_):
+        stage = self._stage
+        stage.values['Duration'] = round((time.perf_counter() - self._start) * 1000, 3)
+
+        if self._metrics._trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            stage.values['PeakTracedMemory'] = round((peak - self._traced_at_start) / (1024 * 1024), 3)
+            if self._started_tracing:
+                tracemalloc.stop()
+
+        rss = peak_rss_mb()
+        if rss is not None:
+            stage.values['PeakRSS'] = round(rss, 1)
+
+        if exc_type is not None:
+            stage.values['Failed'] = 1
+
+        self._metrics._emit(stage)
+        return False
@@ -0,0 +1,197 @@
+"""
+Content-addressed publishing of website artifacts
+
+Each artifact is stored precompressed under a key containing a hash
+of its content, so it never changes and can be cached at the edge for good.
+A small manifest maps each artifact's plain name to its current keys,
+and is the only thing viewers have to revalidate.
+
+Artifacts whose content hasn't changed since the manifest was last written
+are not uploaded again. If nothing has changed, nothing is written at all.
+Once a new manifest is written, the objects only the old one pointed at
+are deleted, so superseded variants don't pile up in the bucket.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import hashlib
+from typing import Callable, Dict, List, Optional, Set
+from clients import get_resource
+from lazy import lazy_import
+
+botocore_exceptions = lazy_import('botocore.exceptions')
+
+try:
+    import brotli
+except ImportError:
+    # Not in the Lambda runtime unless packaged with the function. Only gzip is published then.
+    brotli = None
+
+
+def _compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    """
+    Compression for each Content-Encoding that can be published here
+    """
+    compressors = {'gzip': lambda body: gzip.compress(body, 9)}
+    if brotli is not None:
+        compressors['br'] = brotli.compress
+    return compressors
+
+
+class ContentAddressedPublisher:
+    """
+    Publishes artifacts to a bucket under content-hashed keys, listed in a manifest
+
+    Call publish() or publish_fixed() for each artifact, then commit() to write
+    the manifest once everything it points to is in place, and delete what it no longer does.
+    """
+
+    # Hashed keys never change content
+    _IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+    # Always check for a new manifest
+    _MANIFEST_CACHE_CONTROL = 'no-cache'
+
+    # Hex digits of the SHA-256 that go in the key
+    _HASH_LENGTH = 16
+
+    # Most keys S3 deletes in one request
+    _DELETE_BATCH = 1000
+
+    # Entry fields that hold keys
+    _KEY_FIELDS = ('gzip', 'br', 'key')
+
+
+    def __init__(self, bucket_name: str, manifest_key: str):
+        """
+        :param bucket_name: Bucket to publish to
+        :param manifest_key: Key of the manifest
+        """
+        self._bucket_name = bucket_name
+        self._manifest_key = manifest_key
+        self._previous = None
+        self._manifest = {}
+        self.written = []
+        self.unchanged = []
+        self.deleted = []
+
+
+    def _previous_manifest(self) -> dict:
+        """
+        The manifest as last committed, or empty if there isn't one
+        """
+        if self._previous is None:
+            try:
+                body = get_resource('s3').Object(self._bucket_name, self._manifest_key).get()['Body'].read()
+                self._previous = json.loads(body)
+            except botocore_exceptions.ClientError as e:
+                if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+                    raise
+                self._previous = {}
+        return self._previous
+
+
+    def _unchanged(self, key: str, digest: str, encodings: List[str]) -> bool:
+        """
+        Whether the manifest already has this content under this name, in these encodings
+        """
+        previous = self._previous_manifest().get(key)
+        if not previous or previous.get('sha256') != digest or any(encoding not in previous for encoding in encodings):
+            return False
+
+        self._manifest[key] = previous
+        self.unchanged.append(key)
+        return True
+
+
+    def publish(self, key: str, body: bytes, content_type: str) -> None:
+        """
+        Upload an artifact precompressed under content-hashed keys, unless already there
+
+        :param key: Plain name of the artifact, e.g. dataset.js
+        :param body: Content
+        :param content_type: MIME type of the content
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        compressors = _compressors()
+
+        if self._unchanged(key, digest, list(compressors)):
+            return
+
+        stem, dot, extension = key.rpartition('.')
+        hashed_key = f'{stem}.{digest[:self._HASH_LENGTH]}{dot}{extension}' if dot else f'{key}.{digest[:self._HASH_LENGTH]}'
+        bucket = get_resource('s3').Bucket(self._bucket_name)
+        entry = {'sha256': digest}
+
+        for encoding, compress in compressors.items():
+            entry[encoding] = f'{hashed_key}.{"gz" if encoding == "gzip" else encoding}'
+            bucket.put_object(
+                Key=entry[encoding],
+                Body=compress(body),
+                ContentType=content_type,
+                ContentEncoding=encoding,
+                CacheControl=self._IMMUTABLE_CACHE_CONTROL
+            )
+            self.written.append(entry[encoding])
+
+        self._manifest[key] = entry
+
+
+    def publish_fixed(self, key: str, body: bytes, content_type: str) -> None:
+        """
+        Upload an artifact as is under its own key, unless unchanged.
+        For things read back by key rather than through the manifest.
+
+        :param key: Key of the artifact
+        :param body: Content
+        :param content_type: MIME type of the content
+        """
+        digest = hashlib.sha256(body).hexdigest()
+
+        if self._unchanged(key, digest, ['key']):
+            return
+
+        get_resource('s3').Bucket(self._bucket_name).put_object(
+            Key=key,
+            Body=body,
+            ContentType=content_type
+        )
+        self.written.append(key)
+        self._manifest[key] = {'sha256': digest, 'key': key}
+
+
+    def _keys(self, manifest: dict) -> Set[str]:
+        """
+        Every key a manifest points at
+        """
+        return {entry[field] for entry in manifest.values() for field in self._KEY_FIELDS if field in entry}
+
+
+    def commit(self) -> Optional[dict]:
+        """
+        Write the manifest, if anything in it has changed, then delete the
+        objects the previous one pointed at and this one doesn't
+
+        :returns: The manifest written, or None if there was no need
+        """
+        previous = self._previous_manifest()
+        if self._manifest == previous:
+            return None
+
+        bucket = get_resource('s3').Bucket(self._bucket_name)
+        bucket.put_object(
+            Key=self._manifest_key,
+            Body=json.dumps(self._manifest, sort_keys=True).encode('utf-8'),
+            ContentType='application/json',
+            CacheControl=self._MANIFEST_CACHE_CONTROL
+        )
+        self._previous = self._manifest
+
+        # Only once nothing points at them. Edge caches keep serving them to pages already loading.
+        stale = sorted(self._keys(previous) - self._keys(self._manifest))
+        for i in range(0, len(stale), self._DELETE_BATCH):
+            bucket.delete_objects(Delete={'Objects': [{'Key': key} for key in stale[i:i + self._DELETE_BATCH]], 'Quiet': True})
+        self.deleted = stale
+
+        return self._manifest
@@ -0,0 +1,365 @@
+"""
+Raw snapshots of downloaded datasets
+
+Extract can keep the exact bytes of every download, so a failed run can be
+reproduced, or months of history reprocessed, without going back to the network.
+"""
+from __future__ import annotations
+
+import io
+import os
+import gzip
+import json
+import mmap
+import shutil
+import hashlib
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import BinaryIO, List, Optional
+from clients import get_resource
+from lazy import lazy_import
+
+botocore_exceptions = lazy_import('botocore.exceptions')
+
+
+def _aware(value: datetime) -> datetime:
+    """
+    Naive times are taken to be UTC, as the index is
+    """
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class _MappedFile(io.BufferedIOBase):
+    """
+    Read-only binary stream over a memory map. Each read copies once, out of
+    the mapped pages into the bytes returned, with no read() calls on the file
+    and no buffer in between. The map is closed with the stream.
+    """
+
+    def __init__(self, mapped: mmap.mmap):
+        self._mapped = mapped
+
+
+    def readable(self) -> bool:
+        return True
+
+
+    def seekable(self) -> bool:
+        return True
+
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._mapped.seek(offset, whence)
+        return self._mapped.tell()
+
+
+    def tell(self) -> int:
+        return self._mapped.tell()
+
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        return self._mapped.read(-1 if size is None else size)
+
+
+    def read1(self, size: int = -1) -> bytes:
+        return self.read(size)
+
+
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        line = self._mapped.readline()
+        if size is not None and 0 <= size < len(line):
+            # Rarely asked for; give back what wasn't wanted
+            self._mapped.seek(size - len(line), io.SEEK_CUR)
+            line = line[:size]
+        return line
+
+
+    def readinto(self, buffer) -> int:
+        position = self._mapped.tell()
+        with memoryview(self._mapped) as view:
+            count = min(len(buffer), len(view) - position)
+            memoryview(buffer).cast('B')[:count] = view[position:position + count]
+        self._mapped.seek(position + count)
+        return count
+
+
+    def readinto1(self, buffer) -> int:
+        return self.readinto(buffer)
+
+
+    def close(self) -> None:
+        if not self.closed:
+            self._mapped.close()
+        super().close()
+
+
+class SnapshotStore(ABC):
+    """
+    Content-addressed store of raw downloads
+
+    Each body is kept gzip compressed under its SHA-256, so a source that hasn't
+    changed costs nothing more than an index entry. The index records which URL
+    gave which content, when, and in what text encoding. Partial downloads
+    are marked as such, as they can't stand in for the whole file.
+
+    For replay, a snapshot is decompressed once into a local cache of raw files,
+    which are then read through a memory map.
+
+    Derived classes decide where the objects and index are kept.
+    """
+
+    def __init__(self, raw_directory: str):
+        """
+        :param raw_directory: Local directory for decompressed snapshots
+        """
+        self._raw_directory = raw_directory
+        self._lock = threading.Lock()
+
+
+    @abstractmethod
+    def _has_object(self, sha256: str) -> bool:
+        """
+        Whether the compressed object of this content is stored
+        """
+
+
+    @abstractmethod
+    def _write_object(self, sha256: str, compressed: BinaryIO) -> None:
+        """
+        Store a compressed object, read from where the given file is
+        """
+
+
+    @abstractmethod
+    def _read_object(self, sha256: str, destination: BinaryIO) -> None:
+        """
+        Copy the compressed object into given file
+        """
+
+
+    @abstractmethod
+    def _read_index(self) -> List[dict]:
+        """
+        Every entry of the index, in any order
+        """
+
+
+    @abstractmethod
+    def _add_to_index(self, entry: dict) -> None:
+        """
+        Add an entry to the index
+        """
+
+
+    def put(self, url: str, body: BinaryIO, encoding: str = None, fetched_at: datetime = None, partial: bool = False) -> dict:
+        """
+        Store a download. The body is read from where it is and left rewound.
+
+        :param url: URL it came from
+        :param body: Seekable file of the body
+        :param encoding: Text encoding of the body, if known
+        :param fetched_at: When it was downloaded. Now if not given.
+        :param partial: If set, the body is only part of the file at the URL, e.g. an incremental download
+        :returns: The index entry
+        """
+        digest = hashlib.sha256()
+        size = 0
+
+        with tempfile.TemporaryFile() as compressed:
+            with gzip.GzipFile(fileobj=compressed, mode='wb') as writer:
+                for chunk in iter(lambda: body.read(1024 * 1024), b''):
+                    digest.update(chunk)
+                    writer.write(chunk)
+                    size += len(chunk)
+            body.seek(0)
+
+            entry = {
+                'url': url,
+                'sha256': digest.hexdigest(),
+                'size': size,
+                'encoding': encoding,
+                'partial': partial,
+                'fetched_at': (fetched_at or datetime.now(timezone.utc)).isoformat()
+            }
+
+            with self._lock:
+                if not self._has_object(entry['sha256']):
+                    compressed.seek(0)
+                    self._write_object(entry['sha256'], compressed)
+                self._add_to_index(entry)
+
+        return entry
+
+
+    def index(self, url: str = None) -> List[dict]:
+        """
+        Index entries in the order they were fetched
+
+        :param url: Only those of this URL, if given
+        """
+        entries = [entry for entry in self._read_index() if url is None or entry['url'] == url]
+        return sorted(entries, key=lambda entry: datetime.fromisoformat(entry['fetched_at']))
+
+
+    def latest(self, url: str, at: datetime = None) -> Optional[dict]:
+        """
+        Entry for the last snapshot of a URL, taken at or before the given time if any
+
+        :param url: URL the snapshot is of
+        :param at: Latest time to consider
+        :returns: The entry, or None if there's no such snapshot
+        """
+        at = _aware(at) if at else None
+        entries = [entry for entry in self.index(url) if at is None or datetime.fromisoformat(entry['fetched_at']) <= at]
+        return entries[-1] if entries else None
+
+
+    def path(self, sha256: str) -> str:
+        """
+        Path of the decompressed snapshot in the local cache, decompressing it first if need be
+
+        :param sha256: Hash of the snapshot's content
+        """
+        path = os.path.join(self._raw_directory, sha256)
+
+        if not os.path.exists(path):
+            os.makedirs(self._raw_directory, exist_ok=True)
+            # Written to one side first, so a half-written file is never used
+            with tempfile.NamedTemporaryFile(dir=self._raw_directory, delete=False) as raw:
+                with tempfile.TemporaryFile() as compressed:
+                    self._read_object(sha256, compressed)
+                    compressed.seek(0)
+                    with gzip.GzipFile(fileobj=compressed, mode='rb') as reader:
+                        shutil.copyfileobj(reader, raw, 1024 * 1024)
+            os.replace(raw.name, path)
+
+        return path
+
+
+    def open(self, sha256: str) -> BinaryIO:
+        """
+        Open a snapshot for reading, memory mapped
+
+        :param sha256: Hash of the snapshot's content
+        :returns: Binary stream to be closed when done with
+        """
+        with open(self.path(sha256), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files can't be mapped
+                return io.BytesIO()
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return _MappedFile(mapped)
+
+
+class FileSnapshotStore(SnapshotStore):
+    """
+    Snapshot store in a local directory: compressed objects under objects/,
+    the index as JSON lines in index.jsonl and decompressed snapshots under raw/
+    """
+
+    def __init__(self, directory: str):
+        super().__init__(os.path.join(directory, 'raw'))
+        self._directory = directory
+
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self._directory, 'objects', sha256[:2], f'{sha256}.gz')
+
+
+    def _has_object(self, sha256: str) -> bool:
+        return os.path.exists(self._object_path(sha256))
+
+
+    def _write_object(self, sha256: str, compressed: BinaryIO) -> None:
+        path = self._object_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            shutil.copyfileobj(compressed, f)
+        os.replace(path + '.tmp', path)
+
+
+    def _read_object(self, sha256: str, destination: BinaryIO) -> None:
+        with open(self._object_path(sha256), 'rb') as f:
+            shutil.copyfileobj(f, destination)
+
+
+    def _read_index(self) -> List[dict]:
+        path = os.path.join(self._directory, 'index.jsonl')
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+    def _add_to_index(self, entry: dict) -> None:
+        os.makedirs(self._directory, exist_ok=True)
+        with open(os.path.join(self._directory, 'index.jsonl'), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+
+class S3SnapshotStore(SnapshotStore):
+    """
+    Snapshot store under a prefix in S3: compressed objects under objects/
+    and each index entry as a small JSON object under index/<date fetched>/,
+    so adding one never rewrites the others. Snapshots are decompressed
+    into a local directory for replay.
+    """
+
+    def __init__(self, bucket_name: str, prefix: str = 'snapshots/', raw_directory: str = None):
+        """
+        :param bucket_name: Bucket to keep snapshots in
+        :param prefix: Key prefix for everything in the store
+        :param raw_directory: Local directory for decompressed snapshots. A temporary one if not given.
+        """
+        super().__init__(raw_directory or os.path.join(tempfile.gettempdir(), 'snapshots'))
+        self._bucket_name = bucket_name
+        self._prefix = prefix
+
+
+    def _object_key(self, sha256: str) -> str:
+        return f'{self._prefix}objects/{sha256}.gz'
+
+
+    def _index_key(self, entry: dict) -> str:
+        # Entries are told apart by their content, as one URL may give the same bytes twice
+        name = hashlib.sha256(json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return f'{self._prefix}index/{entry["fetched_at"][:10]}/{entry["fetched_at"]}-{name}.json'
+
+
+    def _has_object(self, sha256: str) -> bool:
+        try:
+            get_resource('s3').meta.client.head_object(Bucket=self._bucket_name, Key=self._object_key(sha256))
+        except botocore_exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return False
+            raise
+        return True
+
+
+    def _write_object(self, sha256: str, compressed: BinaryIO) -> None:
+        get_resource('s3').Bucket(self._bucket_name).put_object(
+            Key=self._object_key(sha256),
+            Body=compressed.read(),
+            ContentType='application/gzip'
+        )
+
+
+    def _read_object(self, sha256: str, destination: BinaryIO) -> None:
+        body = get_resource('s3').Object(self._bucket_name, self._object_key(sha256)).get()['Body']
+        shutil.copyfileobj(body, destination)
+
+
+    def _read_index(self) -> List[dict]:
+        summaries = get_resource('s3').Bucket(self._bucket_name).objects.filter(Prefix=f'{self._prefix}index/')
+        return [json.loads(summary.get()['Body'].read()) for summary in summaries]
+
+
+    def _add_to_index(self, entry: dict) -> None:
+        get_resource('s3').Bucket(self._bucket_name).put_object(
+            Key=self._index_key(entry),
+            Body=json.dumps(entry).encode('utf-8'),
+            ContentType='application/json'
+        )
@@ -1,8 +1,12 @@
-import csv
-import codecs
-from itertools import zip_longest
-from datetime import datetime, date
-from typing import List, Dict
+from itertools import chain
+from operator import itemgetter
+from datetime import date
+from typing import List, Dict, Iterable, Iterator, Tuple
+from columnar import ColumnarDataset
+from csvrows import HeaderIndexedRows
+from dates import parse_iso_date
+from joins import Join
+from aggregates import GroupBy
 
 class InvalidDatasetError(Exception):
     """
@@ -24,19 +28,38 @@ class MissingDatasetError(Exception):
 class Transform:
     """
     Handles all data transformation logic
+
+    Datasets may be lists of rows or row iterators (see Extract streaming mode).
+    Rows are dicts, or tuples in a HeaderIndexedRows (see Extract fast reader mode).
+    Each stage is a generator over the previous one, so with iterator input
+    no stage holds more than the row it is currently working on.
+
+    Between stages, rows are plain tuples with the date first:
+    (date, recovered, country, province) for JH, summed to (date, recovered)
+    per country and date, (date, cases, deaths) for NYT and
+    (date, cases, deaths, recovered) once merged.
     """
 
     # Required fields for each dataset
     _JOHN_HOPKINS_FIEILDS = ('Date', 'Country/Region', 'Province/State', 'Lat', 'Long', 'Confirmed', 'Recovered', 'Deaths')
     _NYT_FIELDS = ('date', 'cases', 'deaths')
 
-    def __init__(self, datasets: list):
+    # Every column read from either dataset, e.g. to project the input down to
+    REQUIRED_FIELDS = _JOHN_HOPKINS_FIEILDS + _NYT_FIELDS
+
+    def __init__(self, datasets: list, sorted_inputs: bool = True):
         """
         Constructor.
         Store a list of datasets to transform.
         At this stage we do not know/care what the data represents.
+
+        :param datasets: Datasets to transform
+        :param sorted_inputs: Whether the rows of each dataset are in date order
         """
         self._datasets = datasets
+        self._sorted_inputs = sorted_inputs
+        self._join = None
+        self._jh_group_by = None
         self._identified_datasets = {
             'NYT': None,
             'JohnHopkins': None
@@ -71,18 +94,30 @@ class Transform:
         :returns: self (for method chaining)
         """
         for dataset in [ds for ds in self._datasets if ds]:
-            if isinstance(dataset, list):
+            if isinstance(dataset, HeaderIndexedRows):
+                # Identified by the header alone
+                if not dataset.fieldnames:
+                    continue
+                datum = dict.fromkeys(dataset.fieldnames)
+            elif isinstance(dataset, list):
                 datum = dataset[0]
-                if not isinstance(datum, dict):
-                    raise InvalidDatasetError('Cannot find a dict record')
-                if self._is_nyt_data(datum):
-                    self._identified_datasets['NYT'] = dataset
-                elif self._is_jh_data(datum):
-                    self._identified_datasets['JohnHopkins'] = dataset
-                else:
-                    raise InvalidDatasetError('Required columns are missing')
+            elif isinstance(dataset, Iterator):
+                # Peek at the first row, then put it back in front of the rest
+                datum = next(dataset, None)
+                if datum is None:
+                    continue
+                dataset = chain((datum,), dataset)
             else:
-                raise InvalidDatasetError(f'Expected dataset to be a list, but found {type(dataset)}')
+                raise InvalidDatasetError(f'Expected dataset to be a list or iterator, but found {type(dataset)}')
+
+            if not isinstance(datum, dict):
+                raise InvalidDatasetError('Cannot find a dict record')
+            if self._is_nyt_data(datum):
+                self._identified_datasets['NYT'] = dataset
+            elif self._is_jh_data(datum):
+                self._identified_datasets['JohnHopkins'] = dataset
+            else:
+                raise InvalidDatasetError('Required columns are missing')
         else:
             # Check we received both
             missing_data = [key for key in self._identified_datasets.keys() if not self._identified_datasets[key]]
@@ -92,22 +127,64 @@ class Transform:
         return self
 
 
+    @staticmethod
+    def _validated(rows: Iterator[tuple]) -> Iterator[tuple]:
+        """
+        Generator that passes rows through, converting value errors
+        raised while they are produced into InvalidDatasetError.
+        Needed because the conversion generators only run when consumed.
+        """
+        try:
+            yield from rows
+        except ValueError as e:
+            raise InvalidDatasetError(f'{e}')
+        except IndexError:
+            raise InvalidDatasetError('Row has too few fields')
+
+
+    @staticmethod
+    def _fields(dataset: Iterable, *names: str) -> Iterator[tuple]:
+        """
+        The named fields of each row of a dataset, as a tuple in the order named,
+        whether the rows are dicts or header-indexed tuples
+        """
+        getter = dataset.getter(*names) if isinstance(dataset, HeaderIndexedRows) else itemgetter(*names)
+        return map(getter, dataset)
+
+
     def _transform_johnhopkins(self):
         """
         Transform JH data to required fields, filtering on US data and converting dates to date objects
 
         :returns: self (for method chaining)
         """
-        try:
-            self._identified_datasets['JohnHopkins']  = list(
-                map(lambda r: {
-                    'date': datetime.strptime(r['Date'], '%Y-%m-%d').date(),
-                    'recovered': int(r['Recovered'])
-                },
-                    filter(lambda r: r['Country/Region'] == 'US', self._identified_datasets['JohnHopkins'])
-                ))
-        except ValueError as e:
-            raise InvalidDatasetError(f'{e}')
+        self._identified_datasets['JohnHopkins'] = self._validated(
+            (
+                parse_iso_date(day),
+                int(recovered),
+                country,
+                province
+            )
+            for day, recovered, country, province in self._fields(
+                self._identified_datasets['JohnHopkins'], 'Date', 'Recovered', 'Country/Region', 'Province/State'
+            ) if country == 'US'
+        )
+
+        return self
+
+
+    def _aggregate_johnhopkins(self):
+        """
+        Sum JH figures by country and date, so that data broken down
+        by province gives one row per date. Output is in date order.
+
+        :returns: self (for method chaining)
+        """
+        self._jh_group_by = GroupBy(key=itemgetter(0, 2), values=lambda row: (row[1],))
+        self._identified_datasets['JohnHopkins'] = (
+            (day, recovered)
+            for (day, _), (recovered,) in self._jh_group_by.sum(self._identified_datasets['JohnHopkins'])
+        )
 
         return self
 
@@ -118,44 +195,117 @@ class Transform:
 
         :returns: self (for method chaining)
         """
-        try:
-            self._identified_datasets['NYT'] = list(
-                map(lambda r: {
-                    'date': datetime.strptime(r['date'], '%Y-%m-%d').date(),
-                    'cases': int(r['cases']),
-                    'deaths': int(r['deaths'])
-                },
-                    self._identified_datasets['NYT']
-                ))
-        except ValueError as e:
-            raise InvalidDatasetError(f'{e}')
+        self._identified_datasets['NYT'] = self._validated(
+            (
+                parse_iso_date(day),
+                int(cases),
+                int(deaths)
+            )
+            for day, cases, deaths in self._fields(self._identified_datasets['NYT'], 'date', 'cases', 'deaths')
+        )
 
         return self
 
 
-    def _merge_datasets(self) -> List[dict]:
+    def _merge_datasets(self) -> Iterator[Tuple[date, int, int, int]]:
         """
         Merge the two datasets keyed on date property, dropping rows
-        from either without matching keys
+        from either without matching keys.
 
-        :returns: merged dataset
+        Inputs are expected in date order, so by default this is a sort-merge
+        that only holds the current row from each side. Otherwise, the NYT data
+        is loaded into a hash table and the JH rows are streamed past it.
+
+        :returns: generator of merged (date, cases, deaths, recovered) tuples
+        """
+        self._join = Join(itemgetter(0), itemgetter(0), Join.INNER, ('JohnHopkins', 'NYT'))
+        join = self._join.merge if self._sorted_inputs else self._join.hash
+
+        return self._validated(
+            (u[0], v[1], v[2], u[1])
+            for u, v in join(self._identified_datasets['JohnHopkins'], self._identified_datasets['NYT'])
+        )
+
+
+    @property
+    def join(self) -> Join:
+        """
+        The join used by the last transformation, for its counts of matched and dropped dates
+        """
+        return self._join
+
+
+    def _transform(self) -> Iterator[Tuple[date, int, int, int]]:
+        """
+        Chain all the stages together
+
+        :returns: generator of merged (date, cases, deaths, recovered) tuples
         """
-        # Get set of dates in common to both datasets
-        dates_in_common = set([datum['date'] for datum in self._identified_datasets['JohnHopkins']]) & set([datum['date'] for datum in self._identified_datasets['NYT']])
 
-        # Trim both inputs to only those rows that have the same dates
-        dataset1 = [datum for datum in self._identified_datasets['JohnHopkins'] if datum['date'] in dates_in_common]
-        dataset2 = [datum for datum in self._identified_datasets['NYT'] if datum['date'] in dates_in_common]
+        return self._identify_datasets()._transform_johnhopkins()._aggregate_johnhopkins()._transform_nyt()._merge_datasets()
 
-        # Merge data and return
-        return [{**u, **v} for u, v in zip_longest(dataset1, dataset2, fillvalue={})]
 
+    def iter_transformed_data(self) -> Iterator[dict]:
+        """
+        Perform the entire data transformation lazily
 
-    def transform_data(self):
+        :returns: generator of merged rows as dicts
+        """
+
+        return (dict(zip(ColumnarDataset.COLUMNS, record)) for record in self._transform())
+
+
+    def transform_data(self) -> ColumnarDataset:
         """
         Perform the entire data trasformation and return the merged data
 
         :returns: merged dataset
         """
 
-        return self._identify_datasets()._transform_johnhopkins()._transform_nyt()._merge_datasets()
+        return ColumnarDataset.from_tuples(self._transform())
+
+
+    def transform_regions(self) -> Dict[str, ColumnarDataset]:
+        """
+        Perform the transformation for every country in the JH data.
+        US figures are merged with NYT exactly as transform_data() does.
+        Other countries take cases and deaths from JH (Confirmed and Deaths),
+        summed over their provinces.
+
+        :returns: dataset for each country, in date order
+        """
+        self._identify_datasets()
+        self._jh_group_by = GroupBy(key=itemgetter(0, 1), values=itemgetter(2, 3, 4))
+
+        rows = self._validated(
+            (
+                country,
+                parse_iso_date(day),
+                int(confirmed),
+                int(deaths),
+                int(recovered)
+            )
+            for country, day, confirmed, deaths, recovered in self._fields(
+                self._identified_datasets['JohnHopkins'], 'Country/Region', 'Date', 'Confirmed', 'Deaths', 'Recovered'
+            )
+        )
+
+        regions = {}
+        us_recovered = []
+
+        # Groups come out by country, then date
+        for (country, day), (confirmed, deaths, recovered) in self._jh_group_by.sum(rows):
+            if country == 'US':
+                us_recovered.append((day, recovered))
+                continue
+            dataset = regions.get(country, None)
+            if dataset is None:
+                dataset = regions[country] = ColumnarDataset()
+            dataset.append(day, confirmed, deaths, recovered)
+
+        self._identified_datasets['JohnHopkins'] = iter(us_recovered)
+        us = ColumnarDataset.from_tuples(self._transform_nyt()._merge_datasets())
+        if us:
+            regions['US'] = us
+
+        return regions
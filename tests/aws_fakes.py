@@ -0,0 +1,240 @@
+import io
+import math
+import threading
+from types import SimpleNamespace
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+
+def _to_dynamo(value):
+    # DynamoDB hands numbers back as Decimal
+    return Decimal(value) if isinstance(value, int) and not isinstance(value, bool) else value
+
+
+class FakeTable:
+    """
+    In-process stand-in for a boto3 DynamoDB Table with a
+    numeric 'dataset' partition key and string 'date' sort key.
+    Supports the calls made by the loaders, and counts them.
+    """
+
+    def __init__(self, resource: 'FakeDynamoDBResource', name: str):
+        self._resource = resource
+        self._name = name
+
+    @property
+    def _items(self) -> dict:
+        return self._resource.tables.setdefault(self._name, {})
+
+    def query(self, KeyConditionExpression, ScanIndexForward=True, Limit=None, ExclusiveStartKey=None,
+              ProjectionExpression=None, ExpressionAttributeNames=None, ReturnConsumedCapacity=None, **_):
+        expression = KeyConditionExpression.get_expression()
+        low, high = '', '\uffff'
+        if expression['operator'] == 'AND':
+            partition_condition, date_condition = expression['values']
+            date_key, low, high = date_condition.get_expression()['values']
+            assert date_key.name == 'date' and date_condition.get_expression()['operator'] == 'BETWEEN', \
+                'Only a date range is supported on the sort key'
+            expression = partition_condition.get_expression()
+
+        key, partition = expression['values']
+        assert key.name == 'dataset', 'Only partition key equality is supported'
+
+        with self._resource._lock:
+            stored = list(self._items.values())
+
+        items = sorted((i for i in stored if i['dataset'] == partition and low <= i['date'] <= high),
+                       key=lambda i: i['date'], reverse=not ScanIndexForward)
+
+        if ExclusiveStartKey:
+            last_date = ExclusiveStartKey['date']
+            items = [i for i in items if (i['date'] > last_date if ScanIndexForward else i['date'] < last_date)]
+
+        page_size = min(Limit or self._resource.page_size, self._resource.page_size)
+        page = items[:page_size]
+
+        if ProjectionExpression:
+            names = ExpressionAttributeNames or {}
+            attributes = [names.get(a.strip(), a.strip()) for a in ProjectionExpression.split(',')]
+            page = [{a: i[a] for a in attributes if a in i} for i in page]
+        else:
+            page = [dict(i) for i in page]
+
+        self._resource.query_calls += 1
+        self._resource.items_read += len(page)
+        response = {'Items': page, 'Count': len(page)}
+
+        if ReturnConsumedCapacity:
+            # Eventually consistent: half a unit per 4KB, taking items as 100 bytes
+            response['ConsumedCapacity'] = {'TableName': self._name, 'CapacityUnits': max(1, math.ceil(len(page) * 100 / 4096)) / 2}
+
+        if len(items) > page_size:
+            response['LastEvaluatedKey'] = {'dataset': partition, 'date': page[-1]['date']}
+        return response
+
+    def put_item(self, Item, ReturnConsumedCapacity=None, **_):
+        self._resource.put_item_calls += 1
+        self._store(Item)
+        return {'ConsumedCapacity': {'TableName': self._name, 'CapacityUnits': 1.0}} if ReturnConsumedCapacity else {}
+
+    def delete_item(self, Key, ReturnConsumedCapacity=None, **_):
+        with self._resource._lock:
+            self._items.pop((Key['dataset'], Key['date']), None)
+        return {'ConsumedCapacity': {'TableName': self._name, 'CapacityUnits': 1.0}} if ReturnConsumedCapacity else {}
+
+    def get_item(self, Key, ConsistentRead=False, ReturnConsumedCapacity=None, **_):
+        item = self._items.get((Key['dataset'], Key['date']), None)
+        response = {'Item': dict(item)} if item else {}
+        if ReturnConsumedCapacity:
+            response['ConsumedCapacity'] = {'TableName': self._name, 'CapacityUnits': 1.0 if ConsistentRead else 0.5}
+        return response
+
+    def _store(self, item: dict):
+        item = {k: _to_dynamo(v) for k, v in item.items()}
+        self._items[(item['dataset'], item['date'])] = item
+
+
+class FakeDynamoDBResource:
+    """
+    In-process stand-in for boto3.resource('dynamodb').
+    Also acts as its own meta.client, whose calls name the table.
+
+    To simulate a busy table, the next throttled_calls batch writes raise
+    a throughput error, and the next unprocessed_calls after that hand back
+    unprocessed_per_call items unprocessed.
+    """
+
+    def __init__(self, page_size: int = 100):
+        self.page_size = page_size
+        self.tables = {}
+        self.query_calls = 0
+        self.items_read = 0
+        self.put_item_calls = 0
+        self.batch_write_calls = 0
+        self.throttled_calls = 0
+        self.unprocessed_calls = 0
+        self.unprocessed_per_call = 1
+        self.meta = SimpleNamespace(client=self)
+        self._lock = threading.Lock()
+
+    def Table(self, name: str) -> FakeTable:
+        return FakeTable(self, name)
+
+    def query(self, TableName, **kwargs):
+        return self.Table(TableName).query(**kwargs)
+
+    def get_item(self, TableName, **kwargs):
+        return self.Table(TableName).get_item(**kwargs)
+
+    def put_item(self, TableName, **kwargs):
+        return self.Table(TableName).put_item(**kwargs)
+
+    def delete_item(self, TableName, **kwargs):
+        return self.Table(TableName).delete_item(**kwargs)
+
+    def batch_write_item(self, RequestItems, ReturnConsumedCapacity=None, **_):
+        with self._lock:
+            self.batch_write_calls += 1
+            if self.throttled_calls:
+                self.throttled_calls -= 1
+                raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'Slow down'}}, 'BatchWriteItem')
+
+            unprocessed = {}
+            consumed = []
+            for table_name, requests in RequestItems.items():
+                assert len(requests) <= 25, 'BatchWriteItem takes at most 25 requests'
+                keys = [(r['PutRequest']['Item']['dataset'], r['PutRequest']['Item']['date']) for r in requests]
+                assert len(set(keys)) == len(keys), 'BatchWriteItem rejects duplicate keys'
+
+                if self.unprocessed_calls:
+                    self.unprocessed_calls -= 1
+                    unprocessed[table_name] = requests[-self.unprocessed_per_call:]
+                    requests = requests[:-self.unprocessed_per_call]
+
+                for request in requests:
+                    self.Table(table_name)._store(request['PutRequest']['Item'])
+                consumed.append({'TableName': table_name, 'CapacityUnits': float(len(requests))})
+
+            response = {'UnprocessedItems': unprocessed}
+            if ReturnConsumedCapacity:
+                response['ConsumedCapacity'] = consumed
+            return response
+
+    def items(self, table_name: str, dataset: int = None) -> list:
+        """
+        All items in a table, or in one of its partitions, in key order
+        """
+        return [v for (partition, _), v in sorted(self.tables.get(table_name, {}).items())
+                if dataset is None or partition == dataset]
+
+
+class _FakeBucket:
+
+    def __init__(self, resource: 'FakeS3Resource', name: str):
+        self._resource = resource
+        self._name = name
+        self.objects = SimpleNamespace(filter=self._filter)
+
+    def _filter(self, Prefix='', **_):
+        return [self._resource.Object(self._name, key) for bucket_name, key in sorted(self._resource.objects)
+                if bucket_name == self._name and key.startswith(Prefix)]
+
+    def put_object(self, Key, Body, **kwargs):
+        self._resource.put_object_calls += 1
+        self._resource.objects[(self._name, Key)] = {'Body': Body, **kwargs}
+
+    def delete_objects(self, Delete, **_):
+        for item in Delete['Objects']:
+            self._resource.objects.pop((self._name, item['Key']), None)
+        return {}
+
+
+class _FakeObject:
+
+    def __init__(self, resource: 'FakeS3Resource', bucket_name: str, key: str):
+        self._resource = resource
+        self._location = (bucket_name, key)
+        self.key = key
+
+    def get(self, **_):
+        stored = self._resource.objects.get(self._location, None)
+        if stored is None:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'Not found'}}, 'GetObject')
+        return {'Body': io.BytesIO(stored['Body']), **{k: v for k, v in stored.items() if k != 'Body'}}
+
+
+class FakeS3Resource:
+    """
+    In-process stand-in for boto3.resource('s3').
+    Also acts as its own meta.client.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.put_object_calls = 0
+        self.meta = SimpleNamespace(client=self)
+
+    def Bucket(self, name: str) -> _FakeBucket:
+        return _FakeBucket(self, name)
+
+    def Object(self, bucket_name: str, key: str) -> _FakeObject:
+        return _FakeObject(self, bucket_name, key)
+
+    def head_object(self, Bucket, Key, **_):
+        stored = self.objects.get((Bucket, Key), None)
+        if stored is None:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': len(stored['Body']), **{k: v for k, v in stored.items() if k != 'Body'}}
+
+
+class FakeAWS:
+    """
+    Pair of fake resources, with a resource() to patch boto3.resource with
+    """
+
+    def __init__(self, page_size: int = 100):
+        self.dynamodb = FakeDynamoDBResource(page_size)
+        self.s3 = FakeS3Resource()
+
+    def resource(self, service_name: str, *_, **__):
+        return {'dynamodb': self.dynamodb, 's3': self.s3}[service_name]
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The Lambda code is deployed flat, so its modules import each other by bare name.
+# Put src on the path for that, and the tests directory so the tests run from the repository root too.
+_TEST_DIRECTORY = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(os.path.dirname(_TEST_DIRECTORY), 'src'))
+sys.path.insert(0, _TEST_DIRECTORY)
@@ -5,6 +5,7 @@ class Constants:
 
     _TEST_DIRECTORY = os.path.dirname(__file__)
     _JH_DATA_GOOD = os.path.join(_TEST_DIRECTORY, 'jh_data_good.csv')
+    _JH_DATA_PROVINCES = os.path.join(_TEST_DIRECTORY, 'jh_data_provinces.csv')
     _NYT_DATA_GOOD = os.path.join(_TEST_DIRECTORY, 'nyt_data_good.csv')
     _NYT_DATA_MISSING_COLUMN = os.path.join(
         _TEST_DIRECTORY, 'nyt_data_missing_column.csv')
@@ -0,0 +1,121 @@
+import os
+import gzip
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from constants import Constants
+
+
+class _QuietRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that doesn't log every request to stderr
+    """
+    def log_message(self, format, *args):
+        pass
+
+
+class RangeRequestHandler(_QuietRequestHandler):
+    """
+    Static file handler that also honours single open-ended byte ranges (bytes=N-),
+    and remembers the Range header of the last request on the server.
+
+    If-Modified-Since is ignored, as file times only have one second
+    resolution which is too coarse for tests that rewrite files.
+    """
+    def do_GET(self):
+        del self.headers['If-Modified-Since']
+        requested = self.headers.get('Range', None)
+        self.server.last_range = requested
+
+        if not requested or not requested.startswith('bytes=') or not requested.endswith('-'):
+            return super().do_GET()
+
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return self.send_error(404)
+
+        with open(path, 'rb') as f:
+            body = f.read()
+
+        start = int(requested[len('bytes='):-1])
+        if start >= len(body):
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(body)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+
+class GzipRequestHandler(_QuietRequestHandler):
+    """
+    Static file handler that sends bodies gzip compressed to clients that accept it,
+    as the dataset hosts do. Compressed bodies are kept until the file changes.
+    """
+    _compressed = {}
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if 'gzip' not in self.headers.get('Accept-Encoding', '') or not os.path.isfile(path):
+            return super().do_GET()
+
+        stat = os.stat(path)
+        version = (path, stat.st_mtime_ns, stat.st_size)
+        body = self._compressed.get(version, None)
+        if body is None:
+            with open(path, 'rb') as f:
+                body = self._compressed[version] = gzip.compress(f.read(), 6)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class LocalHTTPServer:
+    """
+    Local stand-in for the dataset hosts.
+
+    Serves the files in the test directory on a free localhost port
+    for the duration of a with block, so URL extraction can be tested
+    without touching the network.
+    """
+
+    def __init__(self, directory: str = Constants._TEST_DIRECTORY, handler_class=_QuietRequestHandler):
+        self._directory = directory
+        self._handler_class = handler_class
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), partial(self._handler_class, directory=self._directory))
+        self._server.last_range = None
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    @property
+    def last_range(self) -> str:
+        """
+        Range header of the last request handled, if any
+        """
+        return self._server.last_range
+
+    def url(self, file_path: str) -> str:
+        """
+        URL at which the given test file is served
+        """
+        return f'http://127.0.0.1:{self._server.server_port}/{os.path.basename(file_path)}'
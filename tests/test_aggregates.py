@@ -0,0 +1,34 @@
+import unittest
+from operator import itemgetter
+from aggregates import GroupBy
+
+
+class GroupByTests(unittest.TestCase):
+
+    # (date, country, province, recovered, deaths)
+    _ROWS = [
+        (2, 'US', 'Washington', 5, 1),
+        (1, 'US', 'New York', 1, 0),
+        (2, 'US', 'New York', 3, 1),
+        (1, 'US', 'Washington', 2, 0),
+        (1, 'Canada', 'Ontario', 7, 2)
+    ]
+
+
+    def test_sum_by_country_and_date_in_key_order(self):
+        """
+        Each distinct key gives one row of totals, sorted on the key
+        """
+        group_by = GroupBy(key=itemgetter(0, 1), values=itemgetter(3, 4))
+
+        assert list(group_by.sum(self._ROWS)) == [((1, 'Canada'), [7, 2]), ((1, 'US'), [3, 0]), ((2, 'US'), [8, 2])]
+        assert (group_by.rows_in, group_by.groups_out) == (5, 3)
+
+
+    def test_sum_by_country_province_and_date(self):
+        """
+        A finer key keeps provinces apart
+        """
+        group_by = GroupBy(key=itemgetter(1, 2, 0), values=itemgetter(3, 4))
+
+        assert len(list(group_by.sum(self._ROWS))) == 5
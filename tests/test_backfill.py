@@ -0,0 +1,150 @@
+import os
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+from datetime import date, datetime, timezone
+from aws_fakes import FakeAWS
+from backfill import Backfill, Shard, date_shards, snapshot_shards, line_ranges
+from loaders import GVizCollector, DynamoDBLoader, SQLiteLoader
+from snapshots import FileSnapshotStore
+from extract import Extract
+from transform import Transform, InvalidDatasetError
+from constants import Constants
+import clients
+
+
+class BackfillTests(unittest.TestCase):
+
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self._directory = directory.name
+        self._database = os.path.join(directory.name, 'covid.db')
+        self._regions = Transform(Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD).get_datasets()).transform_regions()
+
+
+    def _shards(self, count: int) -> list:
+        return date_shards(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD, date(2020, 1, 1), date(2020, 2, 29), count)
+
+
+    def test_date_shards_cover_the_range_without_overlap(self):
+        """
+        Shards are contiguous, half open and as even as the days allow
+        """
+        shards = date_shards('jh', 'nyt', date(2020, 1, 1), date(2020, 1, 10), 3)
+
+        assert [(shard.start, shard.end) for shard in shards] == [
+            (date(2020, 1, 1), date(2020, 1, 4)),
+            (date(2020, 1, 4), date(2020, 1, 7)),
+            (date(2020, 1, 7), date(2020, 1, 11))
+        ]
+        assert len(date_shards('jh', 'nyt', date(2020, 1, 1), date(2020, 1, 2), 8)) == 2
+
+
+    def test_line_ranges_split_the_lines_after_the_header(self):
+        """
+        Ranges start on line starts, cover every line but the header once, and are as even as the lines allow
+        """
+        with open(Constants._JH_DATA_GOOD, 'rb') as f:
+            content = f.read()
+        header = content.index(b'\n') + 1
+
+        for count in (1, 3, 17, 10_000):
+            ranges = line_ranges(Constants._JH_DATA_GOOD, count)
+
+            assert b''.join(content[start:end] for start, end in ranges) == content[header:]
+            assert all(content[start - 1:start] == b'\n' for start, _ in ranges)
+            assert len(ranges) == min(count, content.count(b'\n') - 1)
+
+
+    def test_bad_values_are_rejected(self):
+        """
+        A value that doesn't parse in any chunk fails the backfill, as it would fail a transform
+        """
+        shard = Shard(Constants._JH_DATA_GOOD, Constants._NYT_DATA_BAD_DATE)
+        self.assertRaises(InvalidDatasetError, Backfill(self._database, [shard], SQLiteLoader, max_workers=1).run)
+
+
+    def test_parallel_backfill_equals_a_sequential_load(self):
+        """
+        However the range is sharded, every partition ends up as one load of the whole files
+        """
+        for count in (1, 5, 17):
+            backfill = Backfill(self._database, self._shards(count), SQLiteLoader, all_regions=True, max_workers=2)
+
+            assert backfill.run() == self._regions
+            for region, dataset in self._regions.items():
+                assert SQLiteLoader(self._database, [], None, SQLiteLoader.partition_for(region)).read_all_data() == dataset
+            assert backfill.record_counts == {region: len(dataset) for region, dataset in self._regions.items()}
+
+
+    def test_only_the_dates_of_the_shards_are_written(self):
+        """
+        A backfill of part of the range leaves the rest alone
+        """
+        shard = Shard(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD, date(2020, 1, 25), date(2020, 1, 28))
+        Backfill(self._database, [shard], SQLiteLoader, max_workers=1).run()
+
+        written = SQLiteLoader(self._database, [], None).read_all_data()
+        assert written == [record for record in self._regions['US'] if date(2020, 1, 25) <= record['date'] < date(2020, 1, 28)]
+        assert len(written) == 3
+
+
+    def test_overlapping_shards_are_refused(self):
+        """
+        Overlapping shards would write some dates twice, so are an error
+        """
+        shards = [Shard('jh', 'nyt', date(2020, 1, 1), date(2020, 1, 10)), Shard('jh', 'nyt', date(2020, 1, 5))]
+        self.assertRaises(ValueError, Backfill, self._database, shards, SQLiteLoader)
+
+
+    def test_snapshots_are_sharded_by_when_they_were_fetched(self):
+        """
+        Each snapshot gives the dates up to the day it was fetched, the last giving the rest,
+        all from one read of the index
+        """
+        store = FileSnapshotStore(os.path.join(self._directory, 'snapshots'))
+        for day in (24, 28):
+            fetched_at = datetime(2020, 1, day, 7, tzinfo=timezone.utc)
+            for url, path in (('jh', Constants._JH_DATA_GOOD), ('nyt', Constants._NYT_DATA_GOOD)):
+                with open(path, 'rb') as f:
+                    store.put(url, BytesIO(f.read()), fetched_at=fetched_at)
+
+        with mock.patch.object(store, 'index', wraps=store.index) as index, mock.patch.object(store, 'latest') as latest:
+            shards = snapshot_shards(store, 'jh', 'nyt')
+
+        assert index.call_count == 1 and not latest.called
+        assert [(shard.start, shard.end) for shard in shards] == [(None, date(2020, 1, 24)), (date(2020, 1, 24), None)]
+        assert Backfill(self._database, shards, SQLiteLoader, max_workers=2).run() == {'US': self._regions['US']}
+
+
+class DynamoDBBackfillTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._aws = FakeAWS()
+        patcher = mock.patch('boto3.resource', side_effect=self._aws.resource)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clients.reset()
+        self.addCleanup(clients.reset)
+
+
+    def test_backfill_is_paced_and_published(self):
+        """
+        Writes are held to the write capacity, and the chart is rebuilt from the table
+        """
+        shards = date_shards(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD, date(2020, 1, 1), date(2020, 2, 29), 3)
+        collector = GVizCollector('bucket', 'dataset.js')
+
+        with mock.patch('time.sleep') as sleep:
+            backfill = Backfill('table', shards, DynamoDBLoader, max_workers=2, write_capacity=5, collector=collector)
+            merged = backfill.run()
+
+        assert sleep.called
+        assert len(self._aws.dynamodb.items('table')) == len(merged['US'])
+        assert backfill.write_capacity_units >= len(merged['US'])
+        assert collector._dataset == merged['US']
+        assert ('bucket', 'dataset.js') in self._aws.s3.objects
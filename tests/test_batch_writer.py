@@ -0,0 +1,80 @@
+import time
+import threading
+import unittest
+from batch_writer import DynamoDBBatchWriter, BatchWriteError
+from aws_fakes import FakeDynamoDBResource
+
+
+class DynamoDBBatchWriterTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._dynamodb = FakeDynamoDBResource()
+        self._items = [{'dataset': 1, 'date': f'2020-01-{d:02}', 'cases': d} for d in range(1, 31)] * 3
+
+
+    def _writer(self, max_attempts: int = 8) -> DynamoDBBatchWriter:
+        return DynamoDBBatchWriter(self._dynamodb.meta.client, 'table', max_attempts=max_attempts, base_delay=0)
+
+
+    def test_write_removes_duplicate_keys_and_writes_in_batches(self):
+        """
+        Duplicates are dropped before batching, and every unique item is written
+        """
+        stats = self._writer().write(self._items)
+
+        assert (stats.items_written, stats.batches, stats.duplicates) == (30, 2, 60)
+        assert len(self._dynamodb.items('table')) == 30
+
+
+    def test_write_retries_throttled_batches_and_unprocessed_items(self):
+        """
+        Nothing is lost when DynamoDB throttles or leaves items unprocessed
+        """
+        self._dynamodb.throttled_calls = 2
+        self._dynamodb.unprocessed_calls = 3
+        self._dynamodb.unprocessed_per_call = 5
+        stats = self._writer().write(self._items)
+
+        assert stats.items_written == 30 and len(self._dynamodb.items('table')) == 30
+        assert stats.throttles == 5 and stats.retries == 5
+
+
+    def test_write_raises_BatchWriteError_when_retries_run_out(self):
+        """
+        Items still unprocessed after the last attempt are reported, not dropped silently
+        """
+        self._dynamodb.unprocessed_calls = 100
+        self.assertRaises(BatchWriteError, self._writer(max_attempts=3).write, self._items)
+
+
+    def test_limiter_bounds_batches_in_flight_across_writers(self):
+        """
+        Writers sharing a semaphore never have more batches out than it allows
+        """
+        limiter = threading.BoundedSemaphore(2)
+        counter_lock = threading.Lock()
+        write = self._dynamodb.batch_write_item
+        active = [0]
+        peak = [0]
+
+        def counting_write(**kwargs):
+            with counter_lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.01)
+            with counter_lock:
+                active[0] -= 1
+            return write(**kwargs)
+
+        self._dynamodb.batch_write_item = counting_write
+        items = [{'dataset': p, 'date': f'2020-{m:02}-{d:02}', 'cases': d} for p in (1, 2) for m in (1, 2, 3) for d in range(1, 29)]
+        writers = [DynamoDBBatchWriter(self._dynamodb, 'table', base_delay=0, limiter=limiter) for _ in range(3)]
+        threads = [threading.Thread(target=w.write, args=(items[i::3],)) for i, w in enumerate(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert peak[0] == 2
+        assert len(self._dynamodb.items('table')) == len(items)
@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+import subprocess
+import unittest
+
+
+_CHART_JS = os.path.join(os.path.dirname(__file__), '..', 'presentation', 'chart.js')
+
+
+def evaluate(expression: str):
+    """
+    Evaluate an expression in the scope of chart.js, with the charts loader stubbed
+
+    :param expression: JavaScript expression, whose value is returned via JSON
+    :returns: Value of the expression
+    """
+    script = (
+        'const fs = require("fs"), vm = require("vm");'
+        'const context = {google: {charts: {load: function () {}}}};'
+        'vm.createContext(context);'
+        f'vm.runInContext(fs.readFileSync({json.dumps(_CHART_JS)}, "utf8"), context);'
+        f'console.log(JSON.stringify(vm.runInContext({json.dumps(expression)}, context)));'
+    )
+    return json.loads(subprocess.run(['node', '-e', script], check=True, capture_output=True, text=True).stdout)
+
+
+@unittest.skipIf(shutil.which('node') is None, 'node is not installed')
+class ResolutionTests(unittest.TestCase):
+
+
+    def _resolution(self, start: str, end: str) -> str:
+        return evaluate(
+            f'resolutionFor({{start: new Date("{start}"), end: new Date("{end}")}}, new Date("2020-01-22"), new Date("2029-12-31"))'
+        )
+
+
+    def test_whole_range_is_drawn_from_lttb(self):
+        """
+        The first view, and any view of the whole history, needs only the LTTB table
+        """
+        assert self._resolution('2020-01-22', '2029-12-31') == 'lttb'
+
+
+    def test_narrow_ranges_are_drawn_daily(self):
+        """
+        Up to maxLinePoints days are drawn from the daily rows
+        """
+        assert self._resolution('2021-01-01', '2021-04-11') == 'daily'
+        assert self._resolution('2021-01-01', '2022-05-16') == 'daily'
+
+
+    def test_wider_ranges_switch_to_coarser_tables(self):
+        """
+        Past maxLinePoints days the chart switches to weeks, then to months
+        """
+        assert self._resolution('2021-01-01', '2022-05-17') == 'weekly'
+        assert self._resolution('2020-02-01', '2029-08-01') == 'weekly'
+        assert self._resolution('2020-02-01', '2029-12-30') == 'monthly'
+
+
+    def test_daily_rows_are_fetched_for_the_years_in_range(self):
+        """
+        Only the years the range touches are downloaded
+        """
+        names = evaluate('dailyTableNames({start: new Date(2020, 11, 1), end: new Date(2022, 0, 5)})')
+
+        assert names == ['daily-2020', 'daily-2021', 'daily-2022']
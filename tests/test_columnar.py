@@ -0,0 +1,60 @@
+import unittest
+from datetime import date
+from columnar import ColumnarDataset
+
+
+class ColumnarDatasetTests(unittest.TestCase):
+
+    _RECORDS = [
+        (date(2020, 1, 22), 1, 0, 0),
+        (date(2020, 1, 23), 1, 0, 0),
+        (date(2020, 1, 24), 2, 0, 1)
+    ]
+
+
+    def test_rows_behave_like_dict_records(self):
+        """
+        Row views should index, convert and compare like the equivalent dicts
+        """
+        dataset = ColumnarDataset.from_tuples(self._RECORDS)
+        expected = {'date': date(2020, 1, 24), 'cases': 2, 'deaths': 0, 'recovered': 1}
+
+        assert dataset[-1]['date'] == date(2020, 1, 24)
+        assert dict(dataset[2]) == expected and dataset[2] == expected
+        assert ColumnarDataset.from_rows([dict(r) for r in dataset]) == dataset
+
+
+    def test_after_returns_only_later_rows(self):
+        """
+        Filtering on date should work for sorted and unsorted data
+        """
+        ordered = ColumnarDataset.from_tuples(self._RECORDS)
+        unordered = ColumnarDataset.from_tuples(reversed(self._RECORDS))
+
+        assert list(ordered.after(date(2020, 1, 22)).tuples()) == self._RECORDS[1:]
+        assert list(unordered.after(date(2020, 1, 22)).tuples()) == list(reversed(self._RECORDS[1:]))
+        assert len(ordered.after(date(2020, 1, 24))) == 0
+
+
+    def test_slices_and_columns(self):
+        """
+        Slices are datasets and columns are compact arrays
+        """
+        dataset = ColumnarDataset.from_tuples(self._RECORDS)
+
+        assert isinstance(dataset[1:], ColumnarDataset) and len(dataset[1:]) == 2
+        assert dataset.column('cases').tolist() == [1, 1, 2]
+        assert dataset.column('date')[0] == date(2020, 1, 22).toordinal()
+        assert dataset.last_date() == date(2020, 1, 24) and ColumnarDataset().last_date() is None
+
+
+    def test_merged_replaces_rows_of_the_same_date(self):
+        """
+        Merging keeps date order, the other dataset's rows winning
+        """
+        dataset = ColumnarDataset.from_tuples(self._RECORDS)
+        revisions = ColumnarDataset.from_tuples([(date(2020, 1, 25), 3, 0, 1), (date(2020, 1, 23), 5, 1, 0)])
+
+        assert list(dataset.merged(revisions).tuples()) == [
+            self._RECORDS[0], (date(2020, 1, 23), 5, 1, 0), self._RECORDS[2], (date(2020, 1, 25), 3, 0, 1)
+        ]
@@ -0,0 +1,43 @@
+import random
+import unittest
+import gviz_api
+from datetime import date, timedelta
+from columnar import ColumnarDataset
+from datatable import render_datatable
+from loaders import GVizCollector
+
+
+class RenderDataTableTests(unittest.TestCase):
+
+
+    def _gviz_json(self, dataset: ColumnarDataset) -> bytes:
+        """
+        Reference output from gviz_api
+        """
+        datatable = gviz_api.DataTable(GVizCollector._column_definitions)
+        datatable.LoadData(list(dataset.tuples()))
+        return datatable.ToJSon(columns_order=ColumnarDataset.COLUMNS, order_by='date').encode('utf-8')
+
+
+    def test_output_is_identical_to_gviz_api_for_unsorted_data(self):
+        """
+        Shuffled rows, repeated dates and large values render the same as gviz_api
+        """
+        rng = random.Random(42)
+        start = date(2020, 1, 22)
+        records = [(start + timedelta(days=rng.randrange(400)), rng.randrange(10 ** 10), rng.randrange(10 ** 6), rng.randrange(10 ** 7))
+                   for _ in range(2000)]
+        dataset = ColumnarDataset.from_tuples(records)
+
+        assert not dataset.is_sorted()
+        assert render_datatable(dataset, GVizCollector._column_definitions) == self._gviz_json(dataset)
+
+
+    def test_output_is_identical_to_gviz_api_for_empty_and_sorted_data(self):
+        """
+        Edge cases of no rows and already ordered rows
+        """
+        sorted_dataset = ColumnarDataset.from_tuples((date(2020, 1, d), d, 0, 0) for d in range(1, 32))
+
+        for dataset in (ColumnarDataset(), sorted_dataset):
+            assert render_datatable(dataset, GVizCollector._column_definitions) == self._gviz_json(dataset)
@@ -0,0 +1,39 @@
+import unittest
+from datetime import date
+from dates import parse_iso_date
+
+
+class ParseIsoDateTests(unittest.TestCase):
+
+
+    def test_parses_iso_dates(self):
+        """
+        Plain YYYY-MM-DD values parse, repeatedly
+        """
+        assert parse_iso_date('2020-01-22') == date(2020, 1, 22)
+        assert parse_iso_date('2020-01-22') == date(2020, 1, 22)
+
+
+    def test_accepts_what_strptime_accepted(self):
+        """
+        Values that fromisoformat rejects but strptime took are still accepted
+        """
+        assert parse_iso_date('2020-1-5') == date(2020, 1, 5)
+
+
+    def test_raises_ValueError_for_rubbish(self):
+        """
+        Invalid values raise ValueError every time, so callers can report them
+        """
+        self.assertRaises(ValueError, parse_iso_date, 'rubbish')
+        self.assertRaises(ValueError, parse_iso_date, 'rubbish')
+        self.assertRaises(ValueError, parse_iso_date, '2020-02-30')
+
+
+    def test_other_iso_forms_are_refused(self):
+        """
+        Forms fromisoformat takes from Python 3.11 but strptime never did are still errors
+        """
+        self.assertRaises(ValueError, parse_iso_date, '2020-W04-3')
+        self.assertRaises(ValueError, parse_iso_date, '20200122  ')
+        self.assertRaises(ValueError, parse_iso_date, '2020-01-22T00:00')
@@ -0,0 +1,127 @@
+import json
+import unittest
+import gviz_api
+from unittest import mock
+from datetime import date, timedelta
+from columnar import ColumnarDataset
+from datatable import render_datatable
+from derived import DerivedSeries, MonthlyTotals, MeasuresByDate
+from loaders import GVizCollector
+from aws_fakes import FakeAWS
+import clients
+
+
+def _cumulative(cases: list) -> ColumnarDataset:
+    start = date(2020, 3, 1)
+    return ColumnarDataset.from_tuples((start + timedelta(days=i), c, c // 10, c // 2) for i, c in enumerate(cases))
+
+
+class DerivedSeriesTests(unittest.TestCase):
+
+
+    def test_daily_figures_are_differences_from_the_day_before(self):
+        """
+        The first day counts everything up to it; corrections show as negative days
+        """
+        derived = DerivedSeries.from_dataset(_cumulative([5, 7, 12, 11, 20]))
+
+        assert list(derived.column('new_cases')) == [5, 2, 5, -1, 9]
+        assert list(derived.column('new_deaths')) == [0, 0, 1, 0, 1]
+
+
+    def test_rolling_means_use_the_rows_there_are_until_the_window_fills(self):
+        """
+        7 and 14 day means match a straightforward row by row calculation
+        """
+        cases = [i * i for i in range(1, 31)]
+        derived = DerivedSeries.from_dataset(_cumulative(cases))
+        new_cases = [cases[0]] + [b - a for a, b in zip(cases, cases[1:])]
+
+        for window in DerivedSeries.WINDOWS:
+            expected = [round(sum(new_cases[max(0, i - window + 1):i + 1]) / min(i + 1, window), 2) for i in range(len(cases))]
+            assert list(derived.column(f'cases_{window}d')) == expected
+
+
+    def test_unsorted_input_is_sorted_by_date_first(self):
+        """
+        Rows out of date order give the same series as sorted ones
+        """
+        dataset = _cumulative([1, 3, 6, 10])
+        shuffled = ColumnarDataset.from_tuples(list(dataset.tuples())[::-1])
+
+        assert DerivedSeries.from_dataset(shuffled).tuples() == DerivedSeries.from_dataset(dataset).tuples()
+
+
+    def test_render_matches_gviz_output_with_float_columns(self):
+        """
+        Means render exactly as gviz_api would render the same values
+        """
+        derived = DerivedSeries.from_dataset(_cumulative([3, 4, 9, 9, 15, 40, 41, 43]))
+        rows = [(date.fromordinal(row[0]),) + row[1:] for row in derived.tuples()]
+
+        datatable = gviz_api.DataTable(DerivedSeries.column_definitions)
+        datatable.LoadData(rows)
+        expected = datatable.ToJSon(columns_order=DerivedSeries.COLUMNS, order_by='date').encode('utf-8')
+
+        assert render_datatable(derived, DerivedSeries.column_definitions) == expected
+
+
+    def test_monthly_totals_are_differences_between_month_ends(self):
+        """
+        Each month counts what was added in it, the first counting everything up to its end
+        """
+        totals = MonthlyTotals.from_dataset(_cumulative(list(range(0, 450, 10))))
+
+        assert totals.column('month') == ['2020-03', '2020-04']
+        assert list(totals.column('cases')) == [300, 140]
+
+
+    def test_monthly_totals_render_as_gviz_would(self):
+        """
+        String month labels render exactly as gviz_api would render them
+        """
+        totals = MonthlyTotals.from_dataset(_cumulative(list(range(0, 900, 10))))
+        rows = list(zip(*(totals.column(name) for name in MonthlyTotals.COLUMNS)))
+
+        datatable = gviz_api.DataTable(MonthlyTotals.column_definitions)
+        datatable.LoadData(rows)
+        expected = datatable.ToJSon(columns_order=MonthlyTotals.COLUMNS).encode('utf-8')
+
+        assert render_datatable(totals, MonthlyTotals.column_definitions) == expected
+
+
+    def test_measures_by_date_has_a_column_per_date(self):
+        """
+        The pie table has a row per measure, and a column per date holding that day's figures
+        """
+        dataset = _cumulative([5, 7, 12])
+        table = json.loads(render_datatable(MeasuresByDate.from_dataset(dataset),
+                                            MeasuresByDate.from_dataset(dataset).column_definitions))
+
+        assert [col['id'] for col in table['cols']] == ['measure', '2020-03-01', '2020-03-02', '2020-03-03']
+        assert [[cell['v'] for cell in row['c']] for row in table['rows']] == [
+            ['Cases', 5, 7, 12], ['Deaths', 0, 0, 1], ['Recovered', 2, 3, 6]
+        ]
+
+
+    def test_collector_publishes_derived_tables_when_asked(self):
+        """
+        The daily, column and pie chart tables go next to the script, which only carries the main table
+        """
+        aws = FakeAWS()
+
+        with mock.patch('boto3.resource', side_effect=aws.resource):
+            clients.reset()
+            self.addCleanup(clients.reset)
+            plain = GVizCollector('bucket', 'dataset.js')
+            derived = GVizCollector('bucket', 'dataset.js', derived=True)
+            plain.add_rows(_cumulative([1, 2, 4]))
+            derived.add_rows(_cumulative([1, 2, 4]))
+
+            assert derived.render() == plain.render()
+            assert derived.write_to_s3() == 4
+
+        objects = aws.s3.objects
+        assert sorted(key for _, key in objects) == ['dataset-derived.json', 'dataset-monthly-totals.json',
+                                                      'dataset-pie.json', 'dataset.js']
+        assert objects[('bucket', 'dataset-derived.json')]['ContentType'] == 'application/json'
@@ -0,0 +1,137 @@
+import json
+import unittest
+from unittest import mock
+from datetime import date, timedelta
+from columnar import ColumnarDataset
+from downsample import rollup, lttb, by_year
+from loaders import GVizCollector
+from aws_fakes import FakeAWS
+import clients
+
+
+def _daily(days: int, start: date = date(2020, 3, 2)) -> ColumnarDataset:
+    return ColumnarDataset.from_tuples((start + timedelta(days=i), i * 10, i, i * 2) for i in range(days))
+
+
+class RollupTests(unittest.TestCase):
+
+
+    def test_week_rollup_keeps_last_day_of_each_week(self):
+        """
+        Weeks start on Monday; each holds the cumulative figures of its last day
+        """
+        # 2020-03-02 was a Monday
+        rolled = rollup(_daily(17), 'week')
+
+        assert [row['date'] for row in rolled] == [date(2020, 3, 2), date(2020, 3, 9), date(2020, 3, 16)]
+        assert [row['cases'] for row in rolled] == [60, 130, 160]
+
+
+    def test_month_rollup_handles_unsorted_input(self):
+        """
+        Rows in any order roll up by calendar month
+        """
+        daily = _daily(45)
+        rolled = rollup(ColumnarDataset.from_tuples(list(daily.tuples())[::-1]), 'month')
+
+        assert [row['date'] for row in rolled] == [date(2020, 3, 1), date(2020, 4, 1)]
+        assert rolled[0]['cases'] == 290 and rolled[1]['cases'] == 440
+
+
+class ByYearTests(unittest.TestCase):
+
+
+    def test_rows_are_split_by_calendar_year(self):
+        """
+        Each year gets its own rows, in date order, whatever order they came in
+        """
+        daily = _daily(800)
+        years = by_year(ColumnarDataset.from_tuples(list(daily.tuples())[::-1]))
+
+        assert list(years) == [2020, 2021, 2022]
+        assert [len(rows) for rows in years.values()] == [305, 365, 130]
+        assert years[2021][0]['date'] == date(2021, 1, 1) and years[2021].is_sorted()
+        assert ColumnarDataset.from_tuples(row for rows in years.values() for row in rows.tuples()) == daily
+
+
+class LTTBTests(unittest.TestCase):
+
+
+    def test_keeps_ends_and_threshold_rows_in_order(self):
+        """
+        The result is capped, in date order, and starts and ends where the data does
+        """
+        daily = _daily(1000)
+        sampled = lttb(daily, 50)
+
+        assert len(sampled) == 50
+        assert sampled.is_sorted()
+        assert sampled[0] == daily[0] and sampled[-1] == daily[-1]
+
+
+    def test_keeps_a_spike(self):
+        """
+        A one day peak survives downsampling, as the triangle it makes is the largest
+        """
+        daily = _daily(1000)
+        daily.column('cases')[637] = 1_000_000
+        sampled = lttb(daily, 20)
+
+        assert 1_000_000 in sampled.column('cases')
+
+
+    def test_small_datasets_are_returned_whole(self):
+        """
+        Nothing is dropped when there are no more rows than the threshold
+        """
+        daily = _daily(10)
+
+        assert lttb(daily, 10) == daily
+
+
+    def test_thresholds_below_three_keep_just_the_ends(self):
+        """
+        With no room for buckets, no more rows than the threshold are kept, ends first
+        """
+        daily = _daily(1000)
+
+        assert list(lttb(daily, 2)) == [daily[0], daily[-1]]
+        assert list(lttb(daily, 1)) == [daily[0]]
+        assert len(lttb(daily, 0)) == 0
+
+
+class GVizCollectorResolutionTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._aws = FakeAWS()
+        patcher = mock.patch('boto3.resource', side_effect=self._aws.resource)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clients.reset()
+        self.addCleanup(clients.reset)
+
+
+    def test_resolutions_are_published_as_separate_cacheable_json(self):
+        """
+        Weekly, monthly, LTTB and yearly daily tables go next to dataset.js, each with its own caching
+        """
+        collector = GVizCollector('bucket', 'dataset.js', resolutions=True, max_points=100)
+        collector.add_rows(_daily(800))
+        collector.write_to_s3()
+
+        for name, rows in (('weekly', 115), ('monthly', 27), ('lttb', 100), ('daily-2020', 305), ('daily-2022', 130)):
+            stored = self._aws.s3.objects[('bucket', f'dataset-{name}.json')]
+            assert stored['ContentType'] == 'application/json' and 'max-age' in stored['CacheControl']
+            assert len(json.loads(stored['Body'])['rows']) == rows
+
+
+    def test_resolutions_are_off_by_default(self):
+        """
+        Only dataset.js is written unless asked
+        """
+        collector = GVizCollector('bucket', 'dataset.js')
+        collector.add_rows(_daily(10))
+        collector.write_to_s3()
+
+        assert list(self._aws.s3.objects) == [('bucket', 'dataset.js')]
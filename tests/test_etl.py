@@ -0,0 +1,186 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from aws_fakes import FakeAWS
+from http_server import LocalHTTPServer, RangeRequestHandler
+from metrics import Metrics, ListSink
+from etl import do_etl, handler, resume, _MAX_RESUMES
+from batch_writer import BatchWriteError
+from caches import FileValidatorCache, DynamoDBValidatorCache
+from snapshots import FileSnapshotStore
+from extract import Extract
+from transform import Transform
+import clients
+from constants import Constants
+
+
+class DoEtlTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._aws = FakeAWS()
+        patcher = mock.patch('boto3.resource', side_effect=self._aws.resource)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clients.reset()
+        self.addCleanup(clients.reset)
+
+
+    def test_each_stage_emits_metrics(self):
+        """
+        A run reports extract, transform, load and publish, with rows and capacity
+        """
+        sink = ListSink()
+
+        with LocalHTTPServer() as server:
+            do_etl('table', 'bucket', server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD),
+                   metrics=Metrics(sink))
+
+        records = {record['Stage']: record for record in sink.records}
+        stored = len(self._aws.dynamodb.items('table', 1))
+
+        assert list(records) == ['extract', 'transform', 'load', 'publish']
+        assert records['transform']['Rows'] == records['load']['Rows'] == records['publish']['Rows'] == stored
+        assert records['load']['ConsumedWriteCapacity'] >= stored
+        assert records['load']['ConsumedReadCapacity'] > 0
+        assert (records['load']['NewRows'], records['load']['ChangedRows'], records['load']['UnchangedRows']) == (stored, 0, 0)
+
+
+    def test_all_regions_loads_every_country(self):
+        """
+        With all_regions, each JH country gets a partition and the US is still charted
+        """
+        with LocalHTTPServer() as server:
+            do_etl('table', 'bucket', server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD),
+                   all_regions=True)
+
+        partitions = {item['dataset'] for item in self._aws.dynamodb.items('table') if item['dataset']}
+
+        assert len(partitions) == 2 and 1 in partitions
+        assert ('bucket', 'dataset-manifest.json') in self._aws.s3.objects
+
+
+    def test_validators_are_committed_when_nothing_changed(self):
+        """
+        An unchanged run still stores the validators it got, so the next request is conditional on them
+        """
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = [shutil.copy(path, data_dir) for path in (Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD)]
+            cache = FileValidatorCache(os.path.join(data_dir, 'validators.json'))
+
+            with LocalHTTPServer(data_dir) as server:
+                urls = [server.url(path) for path in paths]
+                do_etl('table', 'bucket', *urls, validator_cache=cache)
+                before = cache.get(urls[0])['last_modified']
+
+                # Same bytes, newer Last-Modified
+                os.utime(paths[0], (os.path.getmtime(paths[0]) + 86400,) * 2)
+
+                assert do_etl('table', 'bucket', *urls, validator_cache=cache) is True
+                assert cache.get(urls[0])['last_modified'] != before
+
+
+    def test_validators_kept_in_the_table_skip_unchanged_runs(self):
+        """
+        Validators stored with the data let the next run see nothing has changed
+        """
+        with LocalHTTPServer() as server:
+            urls = server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD)
+            do_etl('table', 'bucket', *urls, validator_cache=DynamoDBValidatorCache('table'))
+            batch_writes = self._aws.dynamodb.batch_write_calls
+
+            assert do_etl('table', 'bucket', *urls, validator_cache=DynamoDBValidatorCache('table')) is True
+            assert self._aws.dynamodb.batch_write_calls == batch_writes > 0
+
+        validators = [item['date'] for item in self._aws.dynamodb.items('table', 0) if item['date'].startswith('validators#')]
+        assert validators == sorted(f'validators#{url}' for url in urls)
+
+
+    @mock.patch.object(Extract, '_OVERLAP_BYTES', 32)
+    def test_incremental_runs_replay_from_snapshots(self):
+        """
+        A run that only downloaded what was appended still keeps the whole file, so it can be replayed
+        """
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = [shutil.copy(path, data_dir) for path in (Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD)]
+            cache = FileValidatorCache(os.path.join(data_dir, 'validators.json'))
+            store = FileSnapshotStore(os.path.join(data_dir, 'snapshots'))
+
+            with LocalHTTPServer(data_dir, RangeRequestHandler) as server:
+                urls = [server.url(path) for path in paths]
+                do_etl('table', 'bucket', *urls, validator_cache=cache, snapshot_store=store, incremental_urls=urls[1:])
+                with open(paths[1], 'a') as f:
+                    f.write('\n2020-02-04,11,0')
+                with mock.patch.object(Extract, '_complete_snapshot', autospec=True, side_effect=Extract._complete_snapshot) as complete:
+                    do_etl('table', 'bucket', *urls, validator_cache=cache, snapshot_store=store, incremental_urls=urls[1:])
+
+            with open(paths[1], 'rb') as f:
+                appended = f.read()
+            with store.open(store.latest(urls[1])['sha256']) as f:
+                assert f.read() == appended
+
+            replay = Transform(Extract.from_snapshots(store, *urls).get_datasets()).transform_data()
+
+            assert complete.call_count == 1
+            assert not any(entry['partial'] for entry in store.index())
+            assert replay == Transform(Extract.from_files(*paths).get_datasets()).transform_data()
+
+
+    def test_out_of_time_load_is_incomplete(self):
+        """
+        A load with no time left stops at a checkpoint and reports it
+        """
+        with LocalHTTPServer() as server:
+            complete = do_etl('table', 'bucket', server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD),
+                              remaining_time_ms=lambda: 0)
+
+        assert complete is False
+        assert ('bucket', 'dataset-manifest.json') in self._aws.s3.objects
+
+
+    def test_resume_invokes_again_until_the_limit(self):
+        """
+        An incomplete load re-invokes the function asynchronously, up to _MAX_RESUMES times in a row
+        """
+        context = mock.Mock(invoked_function_arn='arn:aws:lambda:eu-west-1:123456789012:function:etl')
+
+        with mock.patch('etl.get_client') as get_client:
+            resume({'resume': 2}, context)
+            resume({'resume': _MAX_RESUMES}, context)
+
+        get_client.return_value.invoke.assert_called_once_with(
+            FunctionName=context.invoked_function_arn, InvocationType='Event', Payload='{"resume": 3}')
+
+
+class HandlerTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._aws = FakeAWS()
+        patcher = mock.patch('boto3.resource', side_effect=self._aws.resource)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clients.reset()
+        self.addCleanup(clients.reset)
+
+
+    def test_batch_write_error_is_reported_to_sns(self):
+        """
+        An error with non-string arguments is still published before the handler fails
+        """
+        environment = {'TABLE': 'table', 'WEBSITE_BUCKET': 'bucket', 'JH_DATA_URL': 'jh', 'NYT_DATA_URL': 'nyt',
+                       'ERROR_TOPIC_ARN': 'arn:aws:sns:eu-west-1:123456789012:errors'}
+
+        with mock.patch.dict('os.environ', environment), \
+                mock.patch('etl.do_etl', side_effect=BatchWriteError(3)), \
+                mock.patch('etl.get_client') as get_client:
+            with self.assertRaises(BatchWriteError):
+                handler({}, mock.Mock())
+
+        message = json.loads(get_client.return_value.publish.call_args.kwargs['Message'])
+
+        assert 'Arguments: 3 items could not be written after retrying' in message['email']
+        assert json.loads(message['lambda'])['ExceptionType'] == 'BatchWriteError'
@@ -1,7 +1,15 @@
 import unittest
 import os
-from src.extract import Extract
+import shutil
+import hashlib
+import tempfile
+import requests
+from extract import Extract
 from constants import Constants
+from caches import FileValidatorCache
+from http_server import LocalHTTPServer, RangeRequestHandler, GzipRequestHandler
+from transform import Transform
+from csvrows import HeaderIndexedRows
 
 class ExtractTests(unittest.TestCase):
 
@@ -23,3 +31,288 @@ class ExtractTests(unittest.TestCase):
         extractor = Extract.from_urls(Constants._JH_URL, Constants._NYT_URL)
         datasets = extractor.get_datasets()
         assert len(datasets) == 2
+
+
+    def test_extract_streaming_from_files_returns_lazy_iterators(self):
+        """
+        In streaming mode each dataset should be an iterator yielding the same rows as the list mode
+        """
+        datasets = Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD, streaming=True).get_datasets()
+        expected = Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD).get_datasets()
+        assert not any(isinstance(ds, list) for ds in datasets)
+        assert [list(ds) for ds in datasets] == expected
+
+
+    def test_extract_concurrent_from_urls_returns_same_data_as_files(self):
+        """
+        Downloading in parallel should give the datasets back in the order the URLs were given
+        """
+        expected = Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD).get_datasets()
+        with LocalHTTPServer() as server:
+            datasets = Extract.from_urls(server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD), concurrent=True).get_datasets()
+
+        assert datasets == expected
+
+
+    def test_extract_concurrent_streaming_from_urls_returns_same_data_as_files(self):
+        """
+        Prefetched row iterators should yield every row in order
+        """
+        expected = Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD).get_datasets()
+        with LocalHTTPServer() as server:
+            datasets = Extract.from_urls(server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD),
+                                         streaming=True, concurrent=True).get_datasets()
+            actual = [list(ds) for ds in datasets]
+
+        assert actual == expected
+
+
+    def test_extract_concurrent_streaming_raises_download_error_in_consumer(self):
+        """
+        An HTTP error in a background download should surface when its rows are read
+        """
+        with LocalHTTPServer() as server:
+            datasets = Extract.from_urls(server.url('no_such_file.csv'), streaming=True, concurrent=True, retries=0).get_datasets()
+            self.assertRaises(requests.HTTPError, list, datasets[0])
+
+
+    def test_extract_with_validator_cache_reports_unchanged_after_commit(self):
+        """
+        Once validators are committed, a second run should get 304s and return no data
+        """
+        with tempfile.TemporaryDirectory() as cache_dir, LocalHTTPServer() as server:
+            cache = FileValidatorCache(os.path.join(cache_dir, 'validators.json'))
+            urls = (server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD))
+
+            first = Extract.from_urls(*urls, validator_cache=cache)
+            datasets = first.get_datasets()
+            assert not first.sources_unchanged and all(datasets)
+            first.commit_validators()
+
+            second = Extract.from_urls(*urls, validator_cache=cache)
+            datasets = second.get_datasets()
+            assert second.sources_unchanged and not any(datasets)
+
+
+    def test_extract_with_validator_cache_does_not_skip_before_commit(self):
+        """
+        If the previous run never committed, the data should be returned again
+        """
+        with tempfile.TemporaryDirectory() as cache_dir, LocalHTTPServer() as server:
+            cache = FileValidatorCache(os.path.join(cache_dir, 'validators.json'))
+            urls = (server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD))
+
+            Extract.from_urls(*urls, validator_cache=cache).get_datasets()
+            extract = Extract.from_urls(*urls, validator_cache=cache)
+            extract.get_datasets()
+            assert not extract.sources_unchanged
+
+
+    def test_extract_with_validator_cache_matches_on_content_hash(self):
+        """
+        Without usable HTTP validators, an identical body should still count as unchanged
+        """
+        with tempfile.TemporaryDirectory() as cache_dir, LocalHTTPServer() as server:
+            cache = FileValidatorCache(os.path.join(cache_dir, 'validators.json'))
+            url = server.url(Constants._NYT_DATA_GOOD)
+            with open(Constants._NYT_DATA_GOOD, 'rb') as f:
+                cache.put(url, {'sha256': hashlib.sha256(f.read()).hexdigest()})
+
+            extract = Extract.from_urls(url, validator_cache=cache)
+            extract.get_datasets()
+            assert extract.sources_unchanged
+
+
+    def test_extract_with_validator_cache_refetches_unchanged_source_when_other_changed(self):
+        """
+        If only one source changed, the unchanged one is still needed for the merge
+        """
+        expected = Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD).get_datasets()
+        with tempfile.TemporaryDirectory() as cache_dir, LocalHTTPServer() as server:
+            cache = FileValidatorCache(os.path.join(cache_dir, 'validators.json'))
+            urls = (server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD))
+
+            first = Extract.from_urls(urls[0], validator_cache=cache)
+            first.get_datasets()
+            first.commit_validators()
+
+            extract = Extract.from_urls(*urls, streaming=True, concurrent=True, validator_cache=cache)
+            datasets = [list(ds) for ds in extract.get_datasets()]
+            assert not extract.sources_unchanged and datasets == expected
+
+
+    def _incremental_extract(self, url: str, cache: FileValidatorCache) -> Extract:
+        """
+        Incremental extract with an overlap small enough for the test files
+        """
+        extract = Extract.from_urls(url, validator_cache=cache, incremental=True)
+        extract._OVERLAP_BYTES = 32
+        return extract
+
+
+    def test_extract_incremental_fetches_only_appended_tail(self):
+        """
+        After appending rows, the next run should use a range request and return
+        the new rows plus those in the overlap, parsed against the remembered header
+        """
+        with tempfile.TemporaryDirectory() as data_dir:
+            data_file = shutil.copy(Constants._NYT_DATA_GOOD, data_dir)
+            cache = FileValidatorCache(os.path.join(data_dir, 'validators.json'))
+
+            with LocalHTTPServer(data_dir, RangeRequestHandler) as server:
+                first = self._incremental_extract(server.url(data_file), cache)
+                full = first.get_datasets()[0]
+                first.commit_validators()
+
+                with open(data_file, 'a') as f:
+                    f.write('\n2020-02-04,11,0\n2020-02-05,12,0')
+
+                second = self._incremental_extract(server.url(data_file), cache)
+                tail = second.get_datasets()[0]
+                second.commit_validators()
+                ranged = server.last_range
+
+        assert ranged is not None
+        assert len(tail) < len(full)
+        assert tail[-2:] == [{'date': '2020-02-04', 'cases': '11', 'deaths': '0'}, {'date': '2020-02-05', 'cases': '12', 'deaths': '0'}]
+        assert tail[:-2] == full[-len(tail) + 2:]
+
+
+    def test_extract_incremental_with_nothing_appended_is_unchanged(self):
+        """
+        A range request that returns only the overlap means there is nothing new
+        """
+        with tempfile.TemporaryDirectory() as data_dir:
+            data_file = shutil.copy(Constants._NYT_DATA_GOOD, data_dir)
+            cache = FileValidatorCache(os.path.join(data_dir, 'validators.json'))
+
+            with LocalHTTPServer(data_dir, RangeRequestHandler) as server:
+                first = self._incremental_extract(server.url(data_file), cache)
+                first.get_datasets()
+                first.commit_validators()
+
+                second = self._incremental_extract(server.url(data_file), cache)
+                second.get_datasets()
+
+        assert second.sources_unchanged
+
+
+    def test_extract_incremental_falls_back_to_full_download_when_file_rewritten(self):
+        """
+        If the file shrank or the overlap no longer matches, the whole file should be read
+        """
+        expected = Extract.from_files(Constants._NYT_DATA_MISSING_COLUMN).get_datasets()[0]
+        for replacement in (Constants._NYT_DATA_MISSING_COLUMN, Constants._NYT_DATA_BAD_DATE):
+            with tempfile.TemporaryDirectory() as data_dir:
+                data_file = shutil.copy(Constants._NYT_DATA_GOOD, data_dir)
+                cache = FileValidatorCache(os.path.join(data_dir, 'validators.json'))
+
+                with LocalHTTPServer(data_dir, RangeRequestHandler) as server:
+                    first = self._incremental_extract(server.url(data_file), cache)
+                    first.get_datasets()
+                    first.commit_validators()
+
+                    shutil.copy(replacement, data_file)
+                    expected = Extract.from_files(data_file).get_datasets()[0]
+                    actual = self._incremental_extract(server.url(data_file), cache).get_datasets()[0]
+
+            assert actual == expected
+
+
+    def test_extract_incremental_falls_back_to_full_download_when_range_ignored(self):
+        """
+        A server that doesn't do ranges answers with the whole file, which should be used as is
+        """
+        with tempfile.TemporaryDirectory() as data_dir:
+            data_file = shutil.copy(Constants._NYT_DATA_GOOD, data_dir)
+            cache = FileValidatorCache(os.path.join(data_dir, 'validators.json'))
+
+            with LocalHTTPServer(data_dir) as server:
+                first = self._incremental_extract(server.url(data_file), cache)
+                full = first.get_datasets()[0]
+                first.commit_validators()
+
+                with open(data_file, 'a') as f:
+                    f.write('\n2020-02-04,11,0')
+
+                # Make sure the file isn't reported as not modified
+                cache.put(server.url(data_file), {**cache.get(server.url(data_file)), 'last_modified': None})
+                actual = self._incremental_extract(server.url(data_file), cache).get_datasets()[0]
+
+        assert actual == full + [{'date': '2020-02-04', 'cases': '11', 'deaths': '0'}]
+
+
+    def test_extract_incremental_needs_validator_cache(self):
+        """
+        Incremental state has to be kept somewhere
+        """
+        self.assertRaises(ValueError, Extract.from_urls, Constants._NYT_URL, incremental=True)
+
+
+    def test_extract_incremental_only_for_the_urls_given(self):
+        """
+        Sources that aren't append-only are downloaded whole, and compressed, keeping no incremental state
+        """
+        with tempfile.TemporaryDirectory() as directory, LocalHTTPServer(handler_class=GzipRequestHandler) as server:
+            urls = server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD)
+            cache = FileValidatorCache(os.path.join(directory, 'validators.json'))
+            extract = Extract.from_urls(*urls, validator_cache=cache, incremental=urls[1:])
+            extract.get_datasets()
+            extract.commit_validators()
+
+            assert 'offset' not in cache.get(urls[0]) and 'offset' in cache.get(urls[1])
+            self.assertRaises(ValueError, Extract.from_urls, urls[0], validator_cache=cache, incremental=urls[1:])
+
+
+    def test_extract_fast_reader_gives_the_same_rows_as_tuples(self):
+        """
+        Fast reader mode yields the rows of the dict readers as header-indexed tuples
+        """
+        expected = Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD).get_datasets()
+
+        for streaming in (False, True):
+            datasets = Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD,
+                                          streaming=streaming, fast_reader=True).get_datasets()
+
+            assert all(isinstance(ds, HeaderIndexedRows) for ds in datasets)
+            assert [[dict(zip(ds.fieldnames, row)) for row in ds] for ds in datasets] == expected
+
+
+    def test_extract_fast_reader_projects_columns(self):
+        """
+        Only the columns asked for are kept, in file order
+        """
+        nyt, = Extract.from_files(Constants._NYT_DATA_GOOD, fast_reader=True, columns=('deaths', 'date')).get_datasets()
+        expected = Extract.from_files(Constants._NYT_DATA_GOOD).get_datasets()[0]
+
+        assert nyt.fieldnames == ('date', 'deaths')
+        assert list(nyt) == [(row['date'], row['deaths']) for row in expected]
+
+
+    def test_extract_fast_reader_decompresses_gzip_as_it_streams(self):
+        """
+        Bodies sent gzip compressed are read as they would be uncompressed, and transform the same
+        """
+        expected = Transform(Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD).get_datasets()).transform_data()
+
+        with LocalHTTPServer(handler_class=GzipRequestHandler) as server:
+            for streaming in (False, True):
+                extract = Extract.from_urls(server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD),
+                                            streaming=streaming, concurrent=True, fast_reader=True,
+                                            columns=Transform.REQUIRED_FIELDS)
+
+                assert Transform(extract.get_datasets()).transform_data() == expected
+
+
+    def test_extract_fast_reader_with_validator_cache(self):
+        """
+        Downloads checked against a validator cache are read from the spool as tuples
+        """
+        expected = Transform(Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD).get_datasets()).transform_data()
+
+        with tempfile.TemporaryDirectory() as directory, LocalHTTPServer() as server:
+            extract = Extract.from_urls(server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD),
+                                        validator_cache=FileValidatorCache(os.path.join(directory, 'validators.json')),
+                                        fast_reader=True)
+
+            assert Transform(extract.get_datasets()).transform_data() == expected
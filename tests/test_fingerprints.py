@@ -0,0 +1,48 @@
+import unittest
+from datetime import date
+from columnar import ColumnarDataset
+from fingerprints import Fingerprints
+
+
+class FingerprintsTests(unittest.TestCase):
+
+    _RECORDS = [
+        (date(2020, 1, 22), 1, 0, 0),
+        (date(2020, 1, 23), 1, 0, 0),
+        (date(2020, 1, 24), 2, 0, 1)
+    ]
+
+
+    def test_diff_finds_new_and_changed_rows(self):
+        """
+        Only rows that are new or whose figures differ need writing, and each kind is counted
+        """
+        fingerprints = Fingerprints.of(ColumnarDataset.from_tuples(self._RECORDS))
+        incoming = ColumnarDataset.from_tuples([
+            (date(2020, 1, 22), 1, 0, 0),
+            (date(2020, 1, 23), 1, 1, 0),
+            (date(2020, 1, 24), 2, 0, 1),
+            (date(2020, 1, 25), 3, 1, 1)
+        ])
+
+        rows, new, changed, unchanged = fingerprints.diff(incoming)
+
+        assert [row['date'] for row in rows] == [date(2020, 1, 23), date(2020, 1, 25)]
+        assert (new, changed, unchanged) == (1, 1, 2)
+
+        fingerprints.update(rows)
+        assert fingerprints.diff(incoming)[1:] == (0, 0, 4)
+
+
+    def test_round_trip_is_compact(self):
+        """
+        Serialized fingerprints compare the same as the originals, in a few bytes a row
+        """
+        dataset = ColumnarDataset.from_tuples(
+            (date.fromordinal(date(2020, 1, 22).toordinal() + i), i * i, i, 0) for i in range(1000)
+        )
+        data = Fingerprints.of(dataset).to_bytes()
+
+        assert len(data) < 5 * len(dataset)
+        assert Fingerprints.from_bytes(data).diff(dataset)[1:] == (0, 0, len(dataset))
+        assert len(Fingerprints.from_bytes(Fingerprints().to_bytes())) == 0
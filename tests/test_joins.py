@@ -0,0 +1,55 @@
+import unittest
+from operator import itemgetter
+from joins import Join
+
+
+class JoinTests(unittest.TestCase):
+
+    _LEFT = [(1, 'a'), (2, 'b'), (4, 'd'), (5, 'e')]
+    _RIGHT = [(0, 'Z'), (2, 'B'), (3, 'C'), (4, 'D'), (4, 'DD')]
+
+
+    def _join(self, how: str = Join.INNER) -> Join:
+        return Join(itemgetter(0), itemgetter(0), how)
+
+
+    def test_merge_inner_join_matches_keys_and_counts_dropped(self):
+        """
+        Inner join keeps matching keys only, with every right row for a key
+        """
+        join = self._join()
+        joined = list(join.merge(self._LEFT, self._RIGHT))
+
+        assert joined == [((2, 'b'), (2, 'B')), ((4, 'd'), (4, 'D')), ((4, 'd'), (4, 'DD'))]
+        assert (join.matched_keys, join.left_dropped_keys, join.right_dropped_keys) == (2, 2, 2)
+
+
+    def test_merge_left_join_keeps_unmatched_left_rows(self):
+        """
+        Left join emits unmatched left rows against None
+        """
+        joined = list(self._join(Join.LEFT).merge(self._LEFT, self._RIGHT))
+
+        assert [(l[1], r[1] if r else None) for l, r in joined] == [('a', None), ('b', 'B'), ('d', 'D'), ('d', 'DD'), ('e', None)]
+
+
+    def test_hash_join_gives_same_result_as_merge_for_any_order(self):
+        """
+        Hash join doesn't need sorted input and agrees with merge join
+        """
+        for how in (Join.INNER, Join.LEFT):
+            merge = self._join(how)
+            hash = self._join(how)
+            expected = list(merge.merge(self._LEFT, self._RIGHT))
+            actual = list(hash.hash(reversed(self._LEFT), reversed(self._RIGHT)))
+
+            assert sorted(actual, key=lambda p: (p[0], p[1] or ())) == sorted(expected, key=lambda p: (p[0], p[1] or ()))
+            assert (hash.matched_keys, hash.left_dropped_keys, hash.right_dropped_keys) == \
+                (merge.matched_keys, merge.left_dropped_keys, merge.right_dropped_keys)
+
+
+    def test_merge_raises_ValueError_for_unsorted_input(self):
+        """
+        Merge join relies on key order
+        """
+        self.assertRaises(ValueError, list, self._join().merge(self._LEFT, reversed(self._RIGHT)))
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+import unittest
+from lazy import lazy_import
+
+_SRC_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src')
+
+
+class LazyImportTests(unittest.TestCase):
+
+
+    def test_imports_on_first_attribute_access(self):
+        """
+        The proxy resolves attributes from the real module once it is used
+        """
+        json = lazy_import('json')
+        assert 'not loaded' in repr(json)
+        assert json.loads('[1]') == [1]
+        assert json.JSONDecodeError is sys.modules['json'].JSONDecodeError
+        assert 'not loaded' not in repr(json)
+
+
+    def test_missing_module_raises_ImportError_when_used(self):
+        """
+        A bad module name is only reported when the module is needed
+        """
+        missing = lazy_import('no_such_module_here')
+        self.assertRaises(ImportError, getattr, missing, 'anything')
+
+
+    def test_importing_etl_does_not_import_aws_or_http_libraries(self):
+        """
+        The handler module loads without boto3 or requests, keeping cold starts short
+        """
+        check = "import etl, sys; print(','.join(m for m in ('boto3', 'botocore', 'requests') if m in sys.modules))"
+        result = subprocess.run([sys.executable, '-c', check], cwd=_SRC_DIRECTORY,
+                                 stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        assert result.stdout.strip() == ''
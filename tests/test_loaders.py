@@ -0,0 +1,407 @@
+import os
+import boto3
+import tempfile
+import unittest
+import gviz_api
+from unittest import mock
+from datetime import date
+from columnar import ColumnarDataset
+from loaders import GVizCollector, Loader, DynamoDBLoader, SQLiteLoader, MultiRegionLoader
+from aws_fakes import FakeAWS
+import clients
+from extract import Extract
+from transform import Transform
+from constants import Constants
+
+
+def _clock(chunks: int):
+    """
+    Remaining time function that has time for this many chunks, then none
+    """
+    calls = iter(range(chunks))
+    return lambda: 60_000 if next(calls, None) is not None else 0
+
+
+def _revised(dataset: ColumnarDataset, *indices: int) -> ColumnarDataset:
+    """
+    Copy of a dataset with the cases of the rows at the given indices revised
+    """
+    return ColumnarDataset.from_tuples(
+        (day, cases + 100 if i in indices else cases, deaths, recovered)
+        for i, (day, cases, deaths, recovered) in enumerate(dataset.tuples())
+    )
+
+
+class GVizCollectorTests(unittest.TestCase):
+
+
+    def test_render_matches_gviz_output_for_dict_records(self):
+        """
+        Loading columnar rows should produce the same script as loading dict records
+        """
+        merged = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()).transform_data()
+        collector = GVizCollector('bucket', 'dataset.js')
+        collector.add_rows(merged)
+
+        datatable = gviz_api.DataTable({
+            'date': ('date', 'Date'),
+            'cases': ('number', 'Cases'),
+            'deaths': ('number', 'Deaths'),
+            'recovered': ('number', 'Recovered')
+        })
+        datatable.LoadData([dict(row) for row in merged])
+        json_data = datatable.ToJSon(columns_order=('date', 'cases', 'deaths', 'recovered'), order_by='date')
+        expected = f'function createDataset() {{ return {{ getDataTable: function () {{ return new google.visualization.DataTable({json_data}); }} }}; }}'
+
+        assert collector.render() == expected.encode('utf-8')
+
+
+    def test_add_rows_accepts_dicts_lists_and_columnar_datasets(self):
+        """
+        All the record shapes used by the loader can be collected
+        """
+        collector = GVizCollector('bucket', 'dataset.js')
+        collector.add_rows({'date': date(2020, 1, 1), 'cases': 1, 'deaths': 0, 'recovered': 0})
+        collector.add_rows([{'date': date(2020, 1, 2), 'cases': 2, 'deaths': 0, 'recovered': 0}])
+        collector.add_rows(ColumnarDataset.from_tuples([(date(2020, 1, 3), 3, 1, 0)]))
+
+        assert [row['cases'] for row in collector._dataset] == [1, 2, 3]
+        self.assertRaises(ValueError, collector.add_rows, 'not a record')
+
+
+    def test_collectors_do_not_share_rows(self):
+        """
+        Each run's collector starts empty, as warm Lambda containers reuse the module
+        """
+        GVizCollector('bucket', 'dataset.js').add_rows({'date': date(2020, 1, 1), 'cases': 1, 'deaths': 0, 'recovered': 0})
+
+        assert len(GVizCollector('bucket', 'dataset.js')._dataset) == 0
+
+
+    def test_add_rows_beyond_limit_raises_ValueError(self):
+        """
+        The collector holds no more than its row limit
+        """
+        collector = GVizCollector('bucket', 'dataset.js', max_rows=2)
+        collector.add_rows([{'date': date(2020, 1, d), 'cases': d, 'deaths': 0, 'recovered': 0} for d in (1, 2)])
+
+        self.assertRaises(ValueError, collector.add_rows, {'date': date(2020, 1, 3), 'cases': 3, 'deaths': 0, 'recovered': 0})
+
+
+class DynamoDBLoaderTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._aws = FakeAWS(page_size=5)
+        patcher = mock.patch('boto3.resource', side_effect=self._aws.resource)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clients.reset()
+        self.addCleanup(clients.reset)
+        self._merged = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()).transform_data()
+
+
+    def _run(self, dataset: ColumnarDataset, history_key: str = 'history.json', remaining_time_ms=None) -> GVizCollector:
+        collector = GVizCollector('bucket', 'dataset.js', history_key)
+        self._loader = DynamoDBLoader('table', dataset, collector, remaining_time_ms=remaining_time_ms)
+        self._record_count = self._loader.update_repository()
+        collector.write_to_s3()
+        return collector
+
+
+    def test_update_repository_on_empty_table_writes_everything(self):
+        """
+        First load stores every row and reads nothing but the watermark
+        """
+        collector = self._run(self._merged)
+
+        assert self._record_count == len(self._merged)
+        assert len(self._aws.dynamodb.items('table', 1)) == len(self._merged)
+        assert self._aws.dynamodb.query_calls == 1
+        assert collector._dataset == self._merged
+
+
+    def test_update_repository_reads_only_watermark_when_history_is_current(self):
+        """
+        With a matching stored history, a run costs one single-item query
+        """
+        self._run(self._merged[:-2])
+        self._aws.dynamodb.query_calls = self._aws.dynamodb.items_read = 0
+
+        collector = self._run(self._merged)
+
+        assert self._record_count == 2
+        assert (self._aws.dynamodb.query_calls, self._aws.dynamodb.items_read) == (1, 1)
+        assert collector._dataset == self._merged
+
+
+    def test_update_repository_rebuilds_history_from_table_when_missing(self):
+        """
+        Without a stored history the whole table is read, in pages, for the chart
+        """
+        self._run(self._merged[:-1], history_key=None)
+        self._aws.dynamodb.query_calls = 0
+
+        collector = self._run(self._merged)
+
+        assert self._record_count == 1
+        assert self._aws.dynamodb.query_calls > 2
+        assert collector._dataset == self._merged
+
+
+    def test_batch_write_stats_cover_every_chunk(self):
+        """
+        A load of several checkpoint chunks reports the batch writes of all of them
+        """
+        rows = ColumnarDataset.from_tuples((date.fromordinal(date(2020, 1, 1).toordinal() + i), i, 0, 0) for i in range(600))
+        self._run(rows, history_key=None)
+
+        assert self._loader.write_stats.items_written == 600
+        assert self._loader.write_stats.batches == 24
+        assert self._loader.write_stats.consumed_capacity == 600
+
+
+    def test_consumed_capacity_is_totalled(self):
+        """
+        Capacity reported by every table call is added up, batch writes
+        and the checkpoint and fingerprints around them included
+        """
+        self._run(self._merged[:-1])
+
+        # Checkpoint read and watermark query. An empty partition has no fingerprints to read.
+        assert self._loader.read_capacity_units == 1.5
+        # Checkpoint set, moved after the one chunk, and cleared, and fingerprints saved after the chunk
+        assert self._loader.write_capacity_units == len(self._merged) - 1 + 4
+        assert self._loader.write_stats.consumed_capacity == len(self._merged) - 1
+
+        self._run(self._merged)
+
+        # Fingerprints read as well, and saved with the one new record
+        assert (self._loader.read_capacity_units, self._loader.write_capacity_units) == (2.5, 2.0)
+
+
+    @mock.patch.object(Loader, '_CHECKPOINT_ROWS', 4)
+    def test_load_out_of_time_resumes_from_checkpoint(self):
+        """
+        A load stopped for time leaves a checkpoint the next run carries on from
+        """
+        self._run(self._merged, remaining_time_ms=_clock(2))
+
+        assert (self._loader.complete, self._record_count) == (False, 8)
+        assert (self._loader.new_rows, self._loader.changed_rows) == (8, 0)
+        assert self._loader.read_checkpoint() == self._merged[7]['date']
+        assert len(self._loader.read_fingerprints()) == 8
+
+        collector = self._run(self._merged)
+
+        assert (self._loader.complete, self._record_count) == (True, len(self._merged) - 8)
+        assert self._loader.read_checkpoint() is None
+        assert collector._dataset == self._merged
+        assert len(self._aws.dynamodb.items('table', 1)) == len(self._merged)
+
+
+    @mock.patch.object(Loader, '_CHECKPOINT_ROWS', 4)
+    def test_rows_past_the_checkpoint_are_rewritten_once(self):
+        """
+        Batches that landed after the last checkpoint, as after a crash, are written again without duplicates
+        """
+        loader = DynamoDBLoader('table', self._merged, None)
+        loader.write_records(self._merged[:10])
+        loader.write_checkpoint(self._merged[5]['date'])
+
+        collector = self._run(self._merged, history_key=None)
+
+        assert self._record_count == len(self._merged) - 6
+        assert collector._dataset == self._merged
+        assert len(self._aws.dynamodb.items('table', 1)) == len(self._merged)
+
+
+    def test_revised_rows_are_written_and_nothing_else(self):
+        """
+        Rows the source has revised are written with the new one, and the chart takes the revisions
+        """
+        self._run(self._merged[:-1])
+        revised = _revised(self._merged, 2, 5)
+
+        collector = self._run(revised)
+
+        assert self._record_count == 3
+        assert (self._loader.new_rows, self._loader.changed_rows, self._loader.unchanged_rows) == (1, 2, len(self._merged) - 3)
+        # Three records in one batch, then the fingerprints
+        assert self._loader.write_capacity_units == 4.0
+        assert DynamoDBLoader('table', [], None).read_all_data() == revised
+        assert collector._dataset == revised
+
+
+    def test_partition_stored_without_fingerprints_takes_them_from_its_rows(self):
+        """
+        A partition loaded before fingerprints were kept is read once, and only the revisions written
+        """
+        DynamoDBLoader('table', [], None).write_records(self._merged)
+        revised = _revised(self._merged, 0)
+
+        collector = self._run(revised, history_key=None)
+
+        assert (self._record_count, self._loader.changed_rows) == (1, 1)
+        assert self._loader.read_fingerprints().diff(revised)[1:] == (0, 0, len(revised))
+        assert collector._dataset == revised
+
+
+    def test_read_range_reads_only_the_dates_asked_for(self):
+        """
+        Either end of the range can be left open
+        """
+        self._run(self._merged)
+        loader = DynamoDBLoader('table', [], None)
+        first, last = self._merged[2]['date'], self._merged[5]['date']
+
+        assert loader.read_range(first, last) == self._merged[2:6]
+        assert loader.read_range(start=first) == self._merged[2:]
+        assert loader.read_range(end=last) == self._merged[:6]
+
+
+    def test_resources_are_shared_between_runs(self):
+        """
+        Repeated runs, as in a warm container, create each resource once
+        """
+        self._run(self._merged[:-1])
+        self._run(self._merged)
+
+        assert boto3.resource.call_count == 2
+
+
+class MultiRegionLoaderTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._aws = FakeAWS(page_size=5)
+        patcher = mock.patch('boto3.resource', side_effect=self._aws.resource)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clients.reset()
+        self.addCleanup(clients.reset)
+        self._regions = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()).transform_regions()
+
+
+    def _partition(self, region: str) -> list:
+        partition = DynamoDBLoader.partition_for(region)
+        return [item for item in self._aws.dynamodb.items('table') if item['dataset'] == partition]
+
+
+    def test_each_region_is_loaded_into_its_own_partition(self):
+        """
+        Every country lands in a separate partition, US keeping partition 1
+        """
+        collector = GVizCollector('bucket', 'dataset.js')
+        loader = MultiRegionLoader('table', self._regions, {'US': collector})
+
+        assert loader.update_repository() == sum(len(dataset) for dataset in self._regions.values())
+        assert DynamoDBLoader.partition_for('US') == 1
+        assert len(self._partition('US')) == len(self._regions['US'])
+        assert len(self._partition('Afghanistan')) == len(self._regions['Afghanistan'])
+        assert collector._dataset == self._regions['US']
+
+
+    def test_each_region_has_its_own_watermark(self):
+        """
+        A country that is behind is topped up without rewriting the others
+        """
+        behind = dict(self._regions, Afghanistan=self._regions['Afghanistan'][:-3])
+        MultiRegionLoader('table', behind).update_repository()
+
+        loader = MultiRegionLoader('table', self._regions)
+        loader.update_repository()
+
+        assert loader.record_counts == {'US': 0, 'Afghanistan': 3}
+        assert len(self._partition('Afghanistan')) == len(self._regions['Afghanistan'])
+
+
+    def test_batches_in_flight_follow_write_capacity(self):
+        """
+        The shared limit on batch writes comes from the table's write capacity
+        """
+        assert MultiRegionLoader('table', self._regions, write_capacity=25).max_batches_in_flight == 1
+        assert MultiRegionLoader('table', self._regions, write_capacity=100).max_batches_in_flight == 4
+
+
+class SQLiteLoaderTests(unittest.TestCase):
+
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self._database = os.path.join(directory.name, 'covid.db')
+        self._merged = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()).transform_data()
+
+
+    def _run(self, dataset: ColumnarDataset) -> GVizCollector:
+        collector = GVizCollector('bucket', 'dataset.js')
+        self._record_count = SQLiteLoader(self._database, dataset, collector).update_repository()
+        return collector
+
+
+    def test_update_repository_writes_only_new_records(self):
+        """
+        Loads behave as they do against DynamoDB, watermark and chart history included
+        """
+        self._run(self._merged[:-3])
+        collector = self._run(self._merged)
+
+        assert self._record_count == 3
+        assert collector._dataset == self._merged
+        assert SQLiteLoader(self._database, [], None).read_all_data() == self._merged
+
+
+    @mock.patch.object(Loader, '_CHECKPOINT_ROWS', 4)
+    def test_revisions_and_new_records_are_written_together(self):
+        """
+        Revised rows go first, leaving the checkpoint to guard the new dates
+        """
+        self._run(self._merged[:-5])
+        revised = _revised(self._merged, 0, 1, 2, 3, 4)
+
+        collector = self._run(revised)
+
+        assert self._record_count == 10
+        assert SQLiteLoader(self._database, [], None).read_all_data() == revised
+        assert SQLiteLoader(self._database, [], None).read_checkpoint() is None
+        assert collector._dataset == revised
+
+
+    @mock.patch.object(Loader, '_CHECKPOINT_ROWS', 4)
+    def test_load_is_one_transaction_whatever_the_time(self):
+        """
+        The records and their fingerprints go in one transaction, so there's no checkpoint and no stopping part way
+        """
+        loader = SQLiteLoader(self._database, self._merged, GVizCollector('bucket', 'dataset.js'), remaining_time_ms=lambda: 0)
+
+        with mock.patch.object(loader, '_insert', wraps=loader._insert) as insert:
+            assert (loader.update_repository(), loader.complete) == (len(self._merged), True)
+
+        assert insert.call_count == 1
+        assert loader.read_checkpoint() is None
+        assert loader.read_fingerprints().diff(self._merged)[1:] == (0, 0, len(self._merged))
+
+
+    def test_partitions_are_kept_apart(self):
+        """
+        Each partition has its own watermark and range reads
+        """
+        SQLiteLoader(self._database, self._merged, None, partition=1).update_repository()
+        other = SQLiteLoader(self._database, self._merged[:4], None, partition=2)
+
+        assert other.update_repository() == 4
+        assert other.read_last_date() == self._merged[3]['date']
+        assert other.read_range(self._merged[2]['date']) == self._merged[2:4]
+
+
+    def test_multi_region_loader_can_load_into_sqlite(self):
+        """
+        Partitions loaded concurrently share the database file safely
+        """
+        regions = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()).transform_regions()
+        loader = MultiRegionLoader(self._database, regions, loader_class=SQLiteLoader)
+
+        assert loader.update_repository() == sum(len(dataset) for dataset in regions.values())
+        for region, dataset in regions.items():
+            assert SQLiteLoader(self._database, [], None, SQLiteLoader.partition_for(region)).read_all_data() == dataset
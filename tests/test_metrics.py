@@ -0,0 +1,74 @@
+import unittest
+from metrics import Metrics, ListSink, capacity_units
+
+
+class MetricsTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._sink = ListSink()
+
+
+    def test_stage_emits_embedded_metric_format_record(self):
+        """
+        Each stage becomes one EMF record, declaring every metric it carries
+        """
+        metrics = Metrics(self._sink, namespace='Test')
+
+        with metrics.stage('load') as stage:
+            stage.rows = 10
+            stage.add('ConsumedWriteCapacity', 4.0)
+            stage.add('ConsumedWriteCapacity', 6.0)
+
+        record, = self._sink.records
+        definition, = record['_aws']['CloudWatchMetrics']
+        declared = {m['Name']: m['Unit'] for m in definition['Metrics']}
+
+        assert definition['Namespace'] == 'Test'
+        assert definition['Dimensions'] == [['Service', 'Stage']]
+        assert (record['Service'], record['Stage']) == ('etl', 'load')
+        assert (record['Rows'], record['ConsumedWriteCapacity']) == (10, 10.0)
+        assert declared['Duration'] == 'Milliseconds'
+        assert declared['ConsumedWriteCapacity'] == 'Count'
+        assert set(declared) <= set(record)
+        assert record['RowsPerSecond'] > 0
+
+
+    def test_stage_is_emitted_when_it_fails(self):
+        """
+        A failing stage still reports how long it ran, and is flagged
+        """
+        metrics = Metrics(self._sink)
+
+        with self.assertRaises(KeyError):
+            with metrics.stage('transform'):
+                raise KeyError('boom')
+
+        assert self._sink.records[0]['Failed'] == 1
+        assert 'Duration' in self._sink.records[0]
+
+
+    def test_trace_memory_reports_stage_heap_peak(self):
+        """
+        With tracing on, the peak is that of the stage, not of earlier ones
+        """
+        metrics = Metrics(self._sink, trace_memory=True)
+
+        with metrics.stage('big'):
+            big = bytearray(8 * 1024 * 1024)
+        del big
+        with metrics.stage('small'):
+            small = bytearray(1024)
+
+        big_record, small_record = self._sink.records
+        assert big_record['PeakTracedMemory'] >= 8
+        assert small_record['PeakTracedMemory'] < 1
+
+
+    def test_capacity_units_accepts_single_and_batch_shapes(self):
+        """
+        Table calls report one ConsumedCapacity, batch calls a list of them
+        """
+        assert capacity_units(None) == 0.0
+        assert capacity_units({'TableName': 't', 'CapacityUnits': 0.5}) == 0.5
+        assert capacity_units([{'TableName': 't', 'CapacityUnits': 2}, {'TableName': 'u', 'CapacityUnits': 3}]) == 5.0
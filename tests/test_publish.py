@@ -0,0 +1,127 @@
+import gzip
+import json
+import unittest
+from unittest import mock
+from datetime import date
+from aws_fakes import FakeAWS
+from loaders import GVizCollector
+from publish import ContentAddressedPublisher
+import clients
+
+
+class ContentAddressedPublisherTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._aws = FakeAWS()
+        patcher = mock.patch('boto3.resource', side_effect=self._aws.resource)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clients.reset()
+        self.addCleanup(clients.reset)
+
+
+    def _publish(self, body: bytes) -> dict:
+        publisher = ContentAddressedPublisher('bucket', 'manifest.json')
+        publisher.publish('dataset.js', body, 'application/javascript')
+        publisher.commit()
+        return json.loads(self._aws.s3.objects[('bucket', 'manifest.json')]['Body'])
+
+
+    @mock.patch('publish.brotli', None)
+    def test_artifact_is_stored_gzipped_under_a_hashed_key(self):
+        """
+        The manifest points at a gzip variant that never changes, so can be cached for good
+        """
+        manifest = self._publish(b'function createDataset() {}')
+
+        entry = manifest['dataset.js']
+        stored = self._aws.s3.objects[('bucket', entry['gzip'])]
+
+        assert entry['gzip'].startswith('dataset.') and entry['gzip'].endswith('.js.gz')
+        assert gzip.decompress(stored['Body']) == b'function createDataset() {}'
+        assert (stored['ContentEncoding'], stored['ContentType']) == ('gzip', 'application/javascript')
+        assert 'immutable' in stored['CacheControl']
+        assert self._aws.s3.objects[('bucket', 'manifest.json')]['CacheControl'] == 'no-cache'
+
+
+    @mock.patch('publish.brotli', None)
+    def test_unchanged_content_is_not_uploaded_again(self):
+        """
+        Republishing the same content writes nothing, not even the manifest
+        """
+        self._publish(b'same')
+        self._aws.s3.put_object_calls = 0
+
+        publisher = ContentAddressedPublisher('bucket', 'manifest.json')
+        publisher.publish('dataset.js', b'same', 'application/javascript')
+
+        assert publisher.commit() is None
+        assert (self._aws.s3.put_object_calls, publisher.unchanged) == (0, ['dataset.js'])
+
+
+    @mock.patch('publish.brotli', None)
+    def test_changed_content_gets_a_new_key(self):
+        """
+        New content goes under a new key and the manifest moves to it
+        """
+        first = self._publish(b'old')['dataset.js']['gzip']
+        second = self._publish(b'new')['dataset.js']['gzip']
+
+        assert first != second
+        assert gzip.decompress(self._aws.s3.objects[('bucket', second)]['Body']) == b'new'
+
+
+    @mock.patch('publish.brotli', None)
+    def test_superseded_objects_are_deleted_after_the_manifest_moves(self):
+        """
+        Keys only the previous manifest pointed at go, those still in use stay
+        """
+        first = self._publish(b'old')['dataset.js']['gzip']
+
+        publisher = ContentAddressedPublisher('bucket', 'manifest.json')
+        publisher.publish('dataset.js', b'new', 'application/javascript')
+        publisher.publish('other.json', b'{}', 'application/json')
+        publisher.commit()
+
+        assert publisher.deleted == [first]
+        assert ('bucket', first) not in self._aws.s3.objects
+        assert sorted(key for _, key in self._aws.s3.objects) == sorted(['manifest.json'] + publisher.written)
+
+
+    def test_brotli_variant_is_added_when_available(self):
+        """
+        With brotli to hand there's a br variant too, even for content otherwise unchanged
+        """
+        with mock.patch('publish.brotli', None):
+            self._publish(b'content')
+
+        with mock.patch('publish.brotli', mock.Mock(compress=lambda body: b'br:' + body)):
+            entry = self._publish(b'content')['dataset.js']
+
+        stored = self._aws.s3.objects[('bucket', entry['br'])]
+        assert entry['br'].endswith('.js.br') and 'gzip' in entry
+        assert (stored['Body'], stored['ContentEncoding']) == (b'br:content', 'br')
+
+
+    @mock.patch('publish.brotli', None)
+    def test_collector_publishes_everything_through_the_manifest(self):
+        """
+        Script and resolutions are content-addressed, the history keeps its key for the loader
+        """
+        rows = [{'date': date(2020, 3, day), 'cases': day, 'deaths': 0, 'recovered': 0} for day in range(1, 29)]
+        collector = GVizCollector('bucket', 'dataset.js', 'history.json', resolutions=True, precompressed=True)
+        collector.add_rows(rows)
+
+        assert collector.write_to_s3() == 7
+
+        manifest = json.loads(self._aws.s3.objects[('bucket', 'dataset-manifest.json')]['Body'])
+        assert sorted(manifest) == ['dataset-daily-2020.json', 'dataset-lttb.json', 'dataset-monthly.json',
+                                    'dataset-weekly.json', 'dataset.js', 'history.json']
+        assert ('bucket', 'dataset.js') not in self._aws.s3.objects
+        assert GVizCollector('bucket', 'dataset.js', 'history.json').load_history(date(2020, 3, 28))
+
+        collector = GVizCollector('bucket', 'dataset.js', 'history.json', resolutions=True, precompressed=True)
+        collector.add_rows(rows)
+
+        assert collector.write_to_s3() == 0
@@ -0,0 +1,215 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+from datetime import datetime, timedelta, timezone
+from aws_fakes import FakeAWS
+from http_server import LocalHTTPServer, RangeRequestHandler
+from snapshots import FileSnapshotStore, S3SnapshotStore
+from caches import FileValidatorCache
+from extract import Extract
+from transform import Transform
+from constants import Constants
+import clients
+
+
+class FileSnapshotStoreTests(unittest.TestCase):
+
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self._directory = directory.name
+        self._store = FileSnapshotStore(directory.name)
+
+
+    def test_same_content_is_stored_once_and_indexed_each_time(self):
+        """
+        Two downloads of the same bytes share one compressed object
+        """
+        body = BytesIO(b'date,cases\n2020-01-01,1\n')
+        first = self._store.put('http://a/b.csv', body, 'utf-8')
+        second = self._store.put('http://a/b.csv', body, 'utf-8')
+
+        objects = [name for _, _, names in os.walk(os.path.join(self._directory, 'objects')) for name in names]
+
+        assert first['sha256'] == second['sha256'] and objects == [f'{first["sha256"]}.gz']
+        assert len(self._store.index('http://a/b.csv')) == 2
+        assert body.tell() == 0
+
+
+    def test_open_reads_the_snapshot_back(self):
+        """
+        Snapshots replay byte for byte, empty ones included
+        """
+        for content in (b'date,cases\n2020-01-01,1\n' * 1000, b''):
+            entry = self._store.put('http://a/b.csv', BytesIO(content))
+
+            with self._store.open(entry['sha256']) as f:
+                assert f.read() == content
+
+
+    def test_latest_picks_the_last_snapshot_at_or_before_a_time(self):
+        """
+        Older snapshots are found by time, and naive times are taken as UTC
+        """
+        start = datetime(2020, 10, 1, 7, tzinfo=timezone.utc)
+        for day in range(3):
+            self._store.put('http://a/b.csv', BytesIO(f'day {day}'.encode()), fetched_at=start + timedelta(days=day))
+
+        assert self._store.latest('http://a/b.csv')['sha256'] == self._store.index()[-1]['sha256']
+        with self._store.open(self._store.latest('http://a/b.csv', datetime(2020, 10, 2, 12))['sha256']) as f:
+            assert f.read() == b'day 1'
+        assert self._store.latest('http://a/b.csv', datetime(2020, 9, 30)) is None
+        assert self._store.latest('http://other/') is None
+
+
+class S3SnapshotStoreTests(unittest.TestCase):
+
+
+    def setUp(self):
+        self._aws = FakeAWS()
+        patcher = mock.patch('boto3.resource', side_effect=self._aws.resource)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clients.reset()
+        self.addCleanup(clients.reset)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self._store = S3SnapshotStore('bucket', 'snapshots/', raw_directory=directory.name)
+
+
+    def test_snapshots_round_trip_through_the_bucket(self):
+        """
+        Objects are written once, compressed, and each index entry is its own object under the date fetched
+        """
+        entry = self._store.put('http://a/b.csv', BytesIO(b'x' * 10_000), fetched_at=datetime(2020, 10, 1, 7, tzinfo=timezone.utc))
+        self._store.put('http://a/b.csv', BytesIO(b'x' * 10_000), fetched_at=datetime(2020, 10, 2, 7, tzinfo=timezone.utc))
+
+        stored = self._aws.s3.objects[('bucket', f'snapshots/objects/{entry["sha256"]}.gz')]
+        index_keys = [key for _, key in self._aws.s3.objects if key.startswith('snapshots/index/')]
+        assert len(stored['Body']) < 10_000
+        assert self._aws.s3.put_object_calls == 3
+        assert sorted(key.split('/')[2] for key in index_keys) == ['2020-10-01', '2020-10-02']
+        assert len(self._store.index()) == 2 and self._store.latest('http://a/b.csv', datetime(2020, 10, 1, 12)) == entry
+        with self._store.open(entry['sha256']) as f:
+            assert f.read() == b'x' * 10_000
+
+
+class ExtractSnapshotTests(unittest.TestCase):
+
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self._directory = directory.name
+        self._store = FileSnapshotStore(os.path.join(directory.name, 'snapshots'))
+        self._expected = Transform(Extract.from_files(Constants._JH_DATA_GOOD, Constants._NYT_DATA_GOOD).get_datasets()).transform_data()
+
+
+    def test_downloads_replay_from_snapshots(self):
+        """
+        What was downloaded replays without the network, in either reader mode
+        """
+        with LocalHTTPServer() as server:
+            urls = server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD)
+            extract = Extract.from_urls(*urls, streaming=True, concurrent=True, fast_reader=True, snapshot_store=self._store)
+            assert Transform(extract.get_datasets()).transform_data() == self._expected
+
+        for streaming in (False, True):
+            for fast_reader in (False, True):
+                replay = Extract.from_snapshots(self._store, *urls, streaming=streaming, fast_reader=fast_reader)
+                assert Transform(replay.get_datasets()).transform_data() == self._expected
+
+
+    def test_validated_downloads_are_snapshotted(self):
+        """
+        Downloads checked against a validator cache are kept too, but only when used
+        """
+        with LocalHTTPServer() as server:
+            urls = server.url(Constants._JH_DATA_GOOD), server.url(Constants._NYT_DATA_GOOD)
+            cache = FileValidatorCache(os.path.join(self._directory, 'validators.json'))
+            extract = Extract.from_urls(*urls, validator_cache=cache, snapshot_store=self._store)
+            extract.get_datasets()
+            extract.commit_validators()
+
+            assert Extract.from_urls(*urls, validator_cache=cache, snapshot_store=self._store).get_datasets() == [[], []]
+
+        assert len(self._store.index()) == 2
+        assert Transform(Extract.from_snapshots(self._store, *urls).get_datasets()).transform_data() == self._expected
+
+
+    def test_replay_needs_a_snapshot_of_every_url(self):
+        """
+        Replaying a URL that was never snapshotted is an error
+        """
+        self.assertRaises(ValueError, Extract.from_snapshots, self._store, 'http://never/fetched.csv')
+
+
+    def _incremental_extract(self, url: str, cache: FileValidatorCache, store: FileSnapshotStore) -> Extract:
+        extract = Extract.from_urls(url, validator_cache=cache, incremental=True, snapshot_store=store)
+        extract._OVERLAP_BYTES = 32
+        extract.get_datasets()
+        extract.commit_validators()
+        return extract
+
+
+    def test_incremental_downloads_are_kept_whole(self):
+        """
+        The last snapshot and the appended bytes make up the file, which replays as a full download would
+        """
+        with tempfile.TemporaryDirectory() as data_dir:
+            data_file = shutil.copy(Constants._NYT_DATA_GOOD, data_dir)
+            cache = FileValidatorCache(os.path.join(data_dir, 'validators.json'))
+
+            with LocalHTTPServer(data_dir, RangeRequestHandler) as server:
+                url = server.url(data_file)
+                self._incremental_extract(url, cache, self._store)
+                with open(data_file, 'a') as f:
+                    f.write('\n2020-02-04,11,0')
+                self._incremental_extract(url, cache, self._store)
+                ranged = server.last_range
+
+            with open(data_file, 'rb') as f:
+                content = f.read()
+
+        assert ranged is not None
+        assert [entry['partial'] for entry in self._store.index(url)] == [False, False]
+        with self._store.open(self._store.latest(url)['sha256']) as f:
+            assert f.read() == content
+        assert Extract.from_snapshots(self._store, url).get_datasets()[0][-1] == {'date': '2020-02-04', 'cases': '11', 'deaths': '0'}
+
+
+    def test_incremental_download_without_a_snapshot_to_build_on_is_whole(self):
+        """
+        With no snapshot of the last download, e.g. a new store, the whole file is downloaded
+        """
+        with tempfile.TemporaryDirectory() as data_dir:
+            data_file = shutil.copy(Constants._NYT_DATA_GOOD, data_dir)
+            cache = FileValidatorCache(os.path.join(data_dir, 'validators.json'))
+
+            with LocalHTTPServer(data_dir, RangeRequestHandler) as server:
+                url = server.url(data_file)
+                self._incremental_extract(url, cache, None)
+                with open(data_file, 'a') as f:
+                    f.write('\n2020-02-04,11,0')
+                self._incremental_extract(url, cache, self._store)
+                ranged = server.last_range
+
+            with open(data_file, 'rb') as f:
+                content = f.read()
+
+        assert ranged is None
+        with self._store.open(self._store.latest(url)['sha256']) as f:
+            assert f.read() == content
+
+
+    def test_partial_snapshots_are_not_replayed(self):
+        """
+        A snapshot of part of a file can't stand in for it, so replaying it is refused
+        """
+        self._store.put('http://a/b.csv', BytesIO(b'2020-01-01,1,0\n'), partial=True)
+
+        self.assertRaises(ValueError, Extract.from_snapshots, self._store, 'http://a/b.csv')
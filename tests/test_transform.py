@@ -2,8 +2,8 @@ import unittest
 import os
 import requests
 from datetime import date
-from src.extract import Extract
-from src.transform import Transform, InvalidDatasetError, MissingDatasetError
+from extract import Extract
+from transform import Transform, InvalidDatasetError, MissingDatasetError
 from constants import Constants
 
 class TransformTests(unittest.TestCase):
@@ -33,6 +33,14 @@ class TransformTests(unittest.TestCase):
         self.assertRaises(InvalidDatasetError, transformer.transform_data)
 
 
+    def test_transform_raises_InvalidDatasetError_when_column_is_missing_from_header(self):
+        """
+        Header-indexed datasets are checked for required columns by their header
+        """
+        datasets = Extract.from_files(Constants._NYT_DATA_MISSING_COLUMN, Constants._JH_DATA_GOOD, fast_reader=True).get_datasets()
+        self.assertRaises(InvalidDatasetError, Transform(datasets).transform_data)
+
+
     def test_transform_raises_InvalidDatasetError_when_dataset_does_not_contain_dict_records(self):
         """
         if dataset is not dict records, exception should be raised
@@ -67,3 +75,91 @@ class TransformTests(unittest.TestCase):
         max_date = max([d['date'] for d in merged_data])
 
         assert min_date == expected_min_date and max_date == expected_max_date
+
+
+    def test_transform_streaming_input_gives_same_result_as_list_input(self):
+        """
+        Lazily evaluated input should produce exactly the same merged output
+        """
+        expected = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()).transform_data()
+        streamed = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD, streaming=True).get_datasets()).iter_transformed_data()
+
+        assert list(streamed) == expected
+
+
+    def test_transform_streaming_raises_InvalidDatasetError_when_date_cannot_be_parsed(self):
+        """
+        A bad value should still be reported when the data is consumed lazily
+        """
+        transformer = Transform(Extract.from_files(Constants._NYT_DATA_BAD_DATE, Constants._JH_DATA_GOOD, streaming=True).get_datasets())
+        self.assertRaises(InvalidDatasetError, transformer.transform_data)
+
+
+    def test_transform_raises_InvalidDatasetError_when_dates_are_out_of_order(self):
+        """
+        The merge relies on date ordered input, so out of order rows should be rejected
+        """
+        datasets = Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()
+        datasets[0].reverse()
+        transformer = Transform(datasets)
+        self.assertRaises(InvalidDatasetError, transformer.transform_data)
+
+
+    def test_transform_with_unsorted_inputs_uses_hash_join(self):
+        """
+        Without the sorted input promise, out of order rows merge the same as ordered ones
+        """
+        expected = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()).transform_data()
+        datasets = Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()
+        datasets[0].reverse()
+        transformer = Transform(datasets, sorted_inputs=False)
+        merged = transformer.transform_data()
+
+        assert sorted(merged.tuples()) == list(expected.tuples())
+        assert transformer.join.right_dropped_keys == 1
+
+
+    def test_transform_sums_province_rows_to_one_row_per_date(self):
+        """
+        JH data broken down by province, in any order, should be summed per date before the merge
+
+        The province fixture splits each US row into two provinces with
+        recovered values one and two higher than the original
+        """
+        expected = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_GOOD).get_datasets()).transform_data()
+        transformer = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_PROVINCES).get_datasets())
+        merged = transformer.transform_data()
+
+        assert [(d, c, r) for d, c, _, r in merged.tuples()] == [(d, c, 2 * r + 3) for d, c, _, r in expected.tuples()]
+
+
+    def test_transform_regions_gives_each_country_its_own_dataset(self):
+        """
+        US is merged with NYT as before; other countries take cases and deaths from JH
+        """
+        us = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_PROVINCES).get_datasets()).transform_data()
+        regions = Transform(Extract.from_files(Constants._NYT_DATA_GOOD, Constants._JH_DATA_PROVINCES).get_datasets()).transform_regions()
+
+        assert sorted(regions) == ['Afghanistan', 'US']
+        assert regions['US'] == us
+        assert regions['Afghanistan'].is_sorted()
+        assert regions['Afghanistan'][0] == {'date': date(2020, 1, 22), 'cases': 0, 'deaths': 0, 'recovered': 0}
+        assert len(regions['Afghanistan']) == 13
+
+
+    def test_transform_regions_sums_provinces_of_other_countries(self):
+        """
+        Confirmed, deaths and recovered are summed over each country's provinces
+        """
+        def jh(day, country, province, confirmed, recovered, deaths):
+            return {'Date': day, 'Country/Region': country, 'Province/State': province, 'Lat': '0', 'Long': '0',
+                    'Confirmed': str(confirmed), 'Recovered': str(recovered), 'Deaths': str(deaths)}
+
+        regions = Transform([
+            [jh('2020-03-01', 'France', 'Paris', 10, 1, 2), jh('2020-03-01', 'France', 'Lyon', 5, 0, 1),
+             jh('2020-03-02', 'France', 'Paris', 12, 2, 3), jh('2020-03-01', 'US', '', 7, 1, 0)],
+            [{'date': '2020-03-01', 'cases': '8', 'deaths': '0'}]
+        ]).transform_regions()
+
+        assert list(regions['France'].tuples()) == [(date(2020, 3, 1), 15, 3, 1), (date(2020, 3, 2), 12, 3, 2)]
+        assert list(regions['US'].tuples()) == [(date(2020, 3, 1), 8, 0, 1)]